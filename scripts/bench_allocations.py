@@ -0,0 +1,79 @@
+"""
+bench_allocations.py
+
+Function:
+This file is used to check that the image pipeline reuses its buffers (frame_workspace.py). It runs the motion
+check (get_threshold) and the dart diff (diff2blur + threshold) on synthetic frames, once with a new workspace
+every frame (what the pipeline did before: every step allocates its output) and once with one workspace per
+camera, and prints per frame: the number of image buffers allocated, the peak memory allocated (tracemalloc
+sees the numpy/opencv arrays) and the time.
+
+Run this file in the project root directory
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import cv2
+import numpy as np
+from frame_workspace import FrameWorkspace
+from utils import cam2gray, diff2blur, get_threshold
+
+
+class SyntheticCamera:
+    """ Returns the same few BGR frames in turn (no allocation in the camera itself) """
+
+    def __init__(self, width, height):
+        rng = np.random.default_rng(0)
+        self.frames = [rng.integers(90, 110, (height, width, 3), dtype=np.uint8) for _ in range(4)]
+        self.index = 0
+
+    def read(self):
+        self.index = (self.index + 1) % len(self.frames)
+        return True, self.frames[self.index]
+
+
+def pipeline(cam, t, ws):
+    thresh = get_threshold(cam, t, 60, ws)
+    _, blur = diff2blur(cam, t, ws)
+    _, thresh = cv2.threshold(blur, 60, 255, 0, dst=ws.get('thresh'))
+    ws.keep('thresh', thresh)
+
+
+def run(cam, t, frames, reuse):
+    shared = FrameWorkspace()
+    allocations = 0
+    peaks = []
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in range(frames):
+        ws = shared if reuse else FrameWorkspace()
+        before = ws.allocations
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        pipeline(cam, t, ws)
+        peaks.append(tracemalloc.get_traced_memory()[1] - current)
+        allocations += ws.allocations - before
+    elapsed = time.perf_counter() - start
+    tracemalloc.stop()
+    # the first frame always allocates the buffers
+    return allocations / frames, np.mean(peaks[1:]) / 1024, elapsed / frames * 1000
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Count the image buffers allocated per frame")
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--frames", type=int, default=200)
+    args = parser.parse_args()
+
+    cam = SyntheticCamera(args.width, args.height)
+    _, t = cam2gray(cam)
+    print(f"{'':>14} {'buffers/frame':>14} {'peak KiB/frame':>15} {'ms/frame':>9}")
+    for name, reuse in [('new buffers', False), ('workspace', True)]:
+        allocations, peak_kib, ms = run(cam, t, args.frames, reuse)
+        print(f"{name:>14} {allocations:>14.2f} {peak_kib:>15.1f} {ms:>9.2f}")
@@ -0,0 +1,69 @@
+"""
+bench_corners.py
+
+Function:
+This file is used to compare the corner detectors (CORNER_DETECTOR in cv_constants_base.yaml). For every pair of
+frames it runs the original full frame getCorners and each detector (inside the motion bounding box), and prints
+the time, the number of corners and how far the lowest corner (the dart tip end) is from the one of getCorners.
+Uses the same frame pairs as check_blur_backends.py (--frames folder, or synthetic darts).
+
+Run this file in the project root directory
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import cv2
+import numpy as np
+from check_blur_backends import recorded_pairs, synthetic_pairs
+from corner_detectors import CORNER_DETECTORS, find_corners
+from cv_config import load_config
+from utils import blur_box, getCorners
+
+
+def lowest_point(corners):
+    if len(corners) == 0:
+        return None
+    return corners[np.argmax(corners[:, 0, 1]), 0]
+
+
+def timed(function, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        result = function()
+    return result, (time.perf_counter() - start) / iterations * 1000
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare the corner detectors")
+    parser.add_argument("--frames", help="folder with <name>_reference.png / <name>_dart.png pairs")
+    parser.add_argument("--synthetic", type=int, default=20, help="number of synthetic pairs without --frames")
+    parser.add_argument("--iterations", type=int, default=10, help="timing iterations per pair")
+    args = parser.parse_args()
+
+    constants = load_config()
+    pairs = recorded_pairs(args.frames) if args.frames else synthetic_pairs(args.synthetic, constants.IMAGE_WIDTH, constants.IMAGE_HEIGHT)
+    if not pairs:
+        sys.exit("No frame pairs found")
+
+    blurs = [blur_box(cv2.absdiff(reference, dart)) for _, reference, dart in pairs]
+    threshs = [cv2.threshold(blur, constants.DIFF_THRESHOLD, 255, 0)[1] for blur in blurs]
+
+    results = {'getCorners': [timed(lambda: getCorners(blur), args.iterations) for blur in blurs]}
+    for name in CORNER_DETECTORS:
+        results[name] = [timed(lambda: find_corners(blur, thresh, constants, name), args.iterations)
+                         for blur, thresh in zip(blurs, threshs)]
+
+    reference_tips = [lowest_point(corners) for corners, _ in results['getCorners']]
+    print(f"{len(pairs)} pairs")
+    print(f"{'detector':>11} {'ms/frame':>9} {'corners':>8} {'tip px':>7}")
+    for name, runs in results.items():
+        ms = np.mean([ms for _, ms in runs])
+        counts = np.mean([len(corners) for corners, _ in runs])
+        tip_errors = [np.linalg.norm(lowest_point(corners) - tip) for (corners, _), tip in zip(runs, reference_tips)
+                      if tip is not None and len(corners)]
+        tip = f"{np.mean(tip_errors):.1f}" if tip_errors else "-"
+        print(f"{name:>11} {ms:>9.3f} {counts:>8.0f} {tip:>7}")
@@ -0,0 +1,81 @@
+"""
+bench_gray.py
+
+Function:
+This file is used to compare the ways of getting the gray image the cv works on, per frame:
+    bgr:      decoded BGR frame + cvtColor (the old cam2gray, new array every frame)
+    bgr_dst:  decoded BGR frame + cvtColor into a reused buffer
+    yuyv:     Y plane of a raw YUYV frame (CONVERT_RGB=0) into a reused buffer
+    mjpg:     full color jpeg decode + cvtColor (what MJPG + CONVERT_RGB=1 costs)
+    mjpg_y:   gray-only jpeg decode of the raw MJPG frame (CONVERT_RGB=0)
+The frames are synthetic (no camera needed), with --camera the real camera is also timed with both read paths.
+
+Run this file in the project root directory
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import cv2
+import numpy as np
+from capture import Camera, profile_for
+from utils import cam2gray
+
+
+def time_it(function, iterations):
+    function()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    return (time.perf_counter() - start) / iterations * 1000
+
+
+def synthetic(width, height, iterations):
+    rng = np.random.default_rng(0)
+    bgr = cv2.GaussianBlur(rng.integers(0, 255, (height, width, 3), dtype=np.uint8), (9, 9), 0)
+    yuyv = rng.integers(0, 255, (height, width, 2), dtype=np.uint8)
+    jpeg = cv2.imencode(".jpg", bgr)[1]
+    gray = np.empty((height, width), np.uint8)
+
+    results = {
+        'bgr': time_it(lambda: cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY), iterations),
+        'bgr_dst': time_it(lambda: cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY, dst=gray), iterations),
+        'yuyv': time_it(lambda: cv2.extractChannel(yuyv, 0, dst=gray), iterations),
+        'mjpg': time_it(lambda: cv2.cvtColor(cv2.imdecode(jpeg, cv2.IMREAD_COLOR), cv2.COLOR_BGR2GRAY), iterations),
+        'mjpg_y': time_it(lambda: cv2.imdecode(jpeg, cv2.IMREAD_GRAYSCALE), iterations),
+    }
+    for name, ms in results.items():
+        print(f"{name:>8}: {ms:.3f} ms/frame")
+
+
+def camera(camera_id, iterations):
+    cam = Camera(camera_id, profile_for(camera_id))
+    if not cam.isOpened():
+        print(f"Camera {camera_id}: could not be opened")
+        return
+    print(f"Camera {camera_id}: {cam.granted}")
+    gray = np.empty((cam.granted.height, cam.granted.width), np.uint8)
+    # the read includes waiting for the next frame, so this is mostly the cpu time that matters
+    for name, read in [('read+cvt', lambda: cv2.cvtColor(cam.read()[1], cv2.COLOR_BGR2GRAY)),
+                       ('read_gray', lambda: cam2gray(cam, gray))]:
+        cpu_start = time.process_time()
+        wall_ms = time_it(read, iterations)
+        cpu_ms = (time.process_time() - cpu_start) / (iterations + 1) * 1000
+        print(f"{name:>10}: {wall_ms:.2f} ms/frame, cpu {cpu_ms:.2f} ms/frame")
+    cam.release()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the gray capture paths")
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--camera", type=int, help="also time this camera")
+    args = parser.parse_args()
+
+    synthetic(args.width, args.height, args.iterations)
+    if args.camera is not None:
+        camera(args.camera, min(args.iterations, 100))
@@ -0,0 +1,108 @@
+"""
+bench_segmentation.py
+
+Function:
+This file is used to compare the two dart segmentations (DART_SEGMENTATION in cv_constants_base.yaml): corners
+(corner cloud, line fit, filled contour and thinning) and components (connected components of the threshold
+image). Synthetic darts (a shaft and a flight, with a known tip) are put in front of the three fake cameras, and
+for each mode it prints how many darts were found, the time of dart_detection + getRealLocation, and how far
+the tip found is from the real tip. With --single-camera only the right camera sees the dart, the other two only
+get a little noise (a camera without corners must be left out, not break the line fit).
+
+Run this file in the project root directory
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import cv2
+import numpy as np
+from cv_context import get_context
+from darts_cv import DartBoard_CV
+from utils import generate_kalman_filters
+
+
+class SyntheticCamera:
+
+    def __init__(self, reference):
+        self.frame = reference
+
+    def read(self):
+        return True, self.frame
+
+    def grab(self):
+        return True
+
+
+def synthetic_dart(rng, width, height):
+    reference = cv2.GaussianBlur(rng.integers(60, 140, (height, width), dtype=np.uint8), (7, 7), 0)
+    reference = cv2.cvtColor(reference, cv2.COLOR_GRAY2BGR)
+    dart = reference.copy()
+    x, y = int(rng.integers(150, width - 150)), int(rng.integers(60, height - 220))
+    angle = rng.uniform(-0.5, 0.5)
+    length = rng.uniform(110, 150)
+    tip = (int(x + length * np.sin(angle)), int(y + length * np.cos(angle)))
+    cv2.line(dart, (x, y), tip, (220, 220, 220), 5)
+    # knurled barrel: bright/dark bands across the shaft (gives the corners path something to find)
+    for t in np.linspace(0.3, 0.8, 12):
+        cx, cy = x + t * (tip[0] - x), y + t * (tip[1] - y)
+        dx, dy = 5 * np.cos(angle), -5 * np.sin(angle)
+        shade = (255, 255, 255) if int(t * 24) % 2 else (170, 170, 170)
+        cv2.line(dart, (int(cx - dx), int(cy - dy)), (int(cx + dx), int(cy + dy)), shade, 2)
+    # flight at the back of the dart
+    flight = np.array([[x - 14, y - 30], [x + 14, y - 30], [x + 4, y + 10], [x - 4, y + 10]], np.int32)
+    cv2.fillPoly(dart, [flight], (40, 40, 200))
+    return reference, dart, tip
+
+
+def noisy(frame, rng, amplitude=6):
+    noise = rng.integers(-amplitude, amplitude + 1, frame.shape)
+    return np.clip(frame.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+
+
+def run(mode, darts, single_camera=False):
+    context = get_context()
+    context.update_constants(context.constants.replace(DART_SEGMENTATION=mode))
+    rng = np.random.default_rng(1)
+    cameras = [SyntheticCamera(darts[0][0]) for _ in range(3)]
+    db = DartBoard_CV(*cameras, context=context)
+    db.kalman_filter_R, db.kalman_filter_L, db.kalman_filter_C = generate_kalman_filters(context)
+    db.select_segmentation()
+
+    found, errors, times = 0, [], []
+    for reference, dart, tip in darts:
+        for cam in cameras:
+            cam.frame = reference
+        db.update_reference_frame()
+        cameras[0].frame = dart
+        for cam in cameras[1:]:
+            cam.frame = noisy(reference, rng) if single_camera else dart
+        start = time.perf_counter()
+        detected = db.dart_detection()
+        # all the mounts, like calculate_score
+        locations = [db.getRealLocation(mount)[0] for mount in ("right", "left", "center")] if detected else [None]
+        location = locations[0]
+        times.append(time.perf_counter() - start)
+        if isinstance(location, tuple):
+            found += 1
+            errors.append(np.hypot(location[0] - tip[0], location[1] - tip[1]))
+    return found, np.mean(times) * 1000, (np.mean(errors) if errors else float('nan'))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare the corners and components dart segmentations")
+    parser.add_argument("--darts", type=int, default=30)
+    parser.add_argument("--single-camera", action="store_true", help="only the right camera sees the darts")
+    args = parser.parse_args()
+
+    constants = get_context().constants
+    rng = np.random.default_rng(0)
+    darts = [synthetic_dart(rng, constants.IMAGE_WIDTH, constants.IMAGE_HEIGHT) for _ in range(args.darts)]
+
+    results = {mode: run(mode, darts, args.single_camera) for mode in ('corners', 'components')}
+    print(f"{'mode':>11} {'found':>7} {'ms/dart':>8} {'tip px':>7}")
+    for mode, (found, ms, error) in results.items():
+        print(f"{mode:>11} {found:>3}/{len(darts):<3} {ms:>8.2f} {error:>7.1f}")
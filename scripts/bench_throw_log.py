@@ -0,0 +1,78 @@
+"""
+bench_throw_log.py
+
+Function:
+This file is used to check that the throw log (throw_log.py) keeps up with the scoring loop and stays fast to
+query after months of play. A temporary log is filled with synthetic throws (spread over --months, several boards
+and players, 5% of the camera scores wrong) through record() and the writer thread, then the queries the analytics use
+are timed: a player's heatmap, the monthly misscore rates, a board's throws as columns.
+
+Run this file in the project root directory
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import numpy as np
+from board_layout import DEFAULT_SECTOR_ORDER, RING_NAMES
+from throw_log import ThrowLog
+
+DAY = 24 * 3600
+
+
+def fill(log, throws, months, rng):
+    boards = ['board1', 'board2']
+    players = [f"player{i}" for i in range(8)]
+    start = time.time() - months * 30 * DAY
+    times = np.sort(rng.uniform(start, time.time(), throws))
+    xy = rng.normal(400, 60, (throws, 2))
+    scores = rng.choice(DEFAULT_SECTOR_ORDER, throws)
+    wrong = rng.random((throws, 3)) < 0.05
+
+    record_seconds = 0.0
+    for i in range(throws):
+        score = int(scores[i])
+        camera_scores = [score + 1 if wrong[i, camera] else score for camera in range(3)]
+        tips = [(xy[i, 0] * 0.8, xy[i, 1] * 0.6)] * 3
+        started = time.perf_counter()
+        log.record(boards[i % 2], float(times[i]), float(xy[i, 0]), float(xy[i, 1]), score, score,
+                   RING_NAMES[3], 2 / 3, tips, camera_scores, players[i % len(players)], 30.0, 2.0)
+        record_seconds += time.perf_counter() - started
+    return record_seconds / throws
+
+
+def timed(function, *args, **kwargs):
+    started = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, (time.perf_counter() - started) * 1000
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Fill a throw log and time its queries")
+    parser.add_argument("--throws", type=int, default=1000000)
+    parser.add_argument("--months", type=int, default=12)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "throws.db")
+        log = ThrowLog(path, max_pending=args.throws).start()
+        started = time.perf_counter()
+        record_us = fill(log, args.throws, args.months, np.random.default_rng(0)) * 1e6
+        log.stop()
+        print(f"record(): {record_us:.1f} us/throw, {args.throws} throws written in "
+              f"{time.perf_counter() - started:.1f} s, {os.path.getsize(path) / args.throws:.0f} bytes/throw")
+        print(f"writer: {log.stats()}")
+
+        histogram, ms = timed(log.heatmap, bin_px=4, width=800, height=800, player='player3')
+        print(f"heatmap of a player:   {ms:7.1f} ms ({histogram.sum()} throws)")
+        rates, ms = timed(log.misscore_rates, 'month')
+        print(f"monthly misscore rates: {ms:6.1f} ms ({len(rates)} months, "
+              f"last {rates[-1]['misscore_rate']:.3f} / cameras {np.round(rates[-1]['camera_misscore_rates'], 3)})")
+        columns, ms = timed(log.columns, ('board_x', 'board_y', 'score'), board='board1',
+                            since=time.time() - 30 * DAY)
+        print(f"last month of a board: {ms:7.1f} ms ({len(columns['score'])} throws)")
+        log.close()
@@ -0,0 +1,149 @@
+"""
+check_auto_calibration.py
+
+Function:
+This file is used to check the automatic calibration (auto_calibration.py) against the 4 click calibration. A
+colored dartboard is rendered, seen by a camera with a known perspective matrix (plus blur, noise and uneven
+light), and calibrated again:
+    auto:      auto_calibrate, with the up point of a bumped camera (the matrix before it moved)
+    4 clicks:  getPerspectiveTransform from the 4 calibration points, clicked --click-error pixels off
+The error is the distance between where the true and the solved matrix put the board points (camera pixels, and
+mm on the board).
+
+--images is a folder of camera images (png/jpg) of the real board: each one is calibrated and the reprojection
+error is printed (there is no true matrix to compare with).
+
+Run this file in the project root directory
+"""
+import argparse
+import glob
+import math
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import cv2
+import numpy as np
+from auto_calibration import auto_calibrate, drawn_top, matrix_drift, project
+from board_layout import DOUBLE, INNER_BULL, OUTER_BULL, TRIPLE, get_layout
+from cv_config import load_config
+
+SCALE = 3  # the board is rendered at 3x the drawn board resolution
+
+
+def render_board(constants):
+    ''' BGR board with the real colors, SCALE times the drawn board size '''
+    layout = get_layout(constants)
+    height, width = constants.IMAGE_HEIGHT * SCALE, constants.IMAGE_WIDTH * SCALE
+    ys, xs = np.mgrid[0:height, 0:width]
+    points = np.stack([xs.ravel(), ys.ravel()], axis=1) / SCALE
+    _, _, rings = layout.classify_points(points)
+    dx = points[:, 0] - constants.center[0]
+    dy = points[:, 1] - constants.center[1]
+    red_parity = layout.sector_order.index(constants.AUTO_CAL_RED_SECTOR) % 2
+    red = layout.sector_indices(np.arctan2(dy, dx)) % 2 == red_parity
+
+    colors = np.empty((len(points), 3), np.uint8)
+    colors[:] = (30, 30, 30)  # outside the scoring area
+    single = (rings != 0) & (rings != TRIPLE) & (rings != DOUBLE) & (rings != INNER_BULL) & (rings != OUTER_BULL)
+    colors[single & red] = (20, 20, 20)
+    colors[single & ~red] = (180, 215, 225)
+    rings_colored = (rings == TRIPLE) | (rings == DOUBLE)
+    colors[rings_colored & red] = (40, 30, 190)
+    colors[rings_colored & ~red] = (40, 140, 30)
+    colors[rings == INNER_BULL] = (40, 30, 190)
+    colors[rings == OUTER_BULL] = (40, 140, 30)
+    board = colors.reshape(height, width, 3)
+
+    # wires
+    center = (constants.center[0] * SCALE, constants.center[1] * SCALE)
+    outer = constants.DOUBLE_RING_OUTER_RADIUS_MM * constants.PIXELS_PER_MM * SCALE
+    for index in range(20):
+        angle = layout.sector_start_angle(index)
+        start = (round(center[0] + 16 * SCALE * math.cos(angle)), round(center[1] + 16 * SCALE * math.sin(angle)))
+        end = (round(center[0] + outer * math.cos(angle)), round(center[1] + outer * math.sin(angle)))
+        cv2.line(board, start, end, (170, 170, 170), 2, cv2.LINE_AA)
+    for radius_mm in (constants.TRIPLE_RING_INNER_RADIUS_MM, constants.TRIPLE_RING_OUTER_RADIUS_MM,
+                      constants.DOUBLE_RING_INNER_RADIUS_MM, constants.DOUBLE_RING_OUTER_RADIUS_MM):
+        cv2.circle(board, center, round(radius_mm * constants.PIXELS_PER_MM * SCALE), (170, 170, 170), 2, cv2.LINE_AA)
+    return board
+
+
+def camera_matrix(constants, corners):
+    ''' drawn board -> camera, from where the 4 calibration points are seen '''
+    cx, cy = constants.center
+    radius = constants.DOUBLE_RING_OUTER_RADIUS_PX
+    drawn = np.float32([[cx, cy - radius], [cx + radius, cy], [cx, cy + radius], [cx - radius, cy]])
+    return cv2.getPerspectiveTransform(drawn, np.float32(corners)), drawn
+
+
+def camera_image(board, matrix, constants, rng):
+    scale_down = np.diag([1 / SCALE, 1 / SCALE, 1])
+    image = cv2.warpPerspective(board, matrix @ scale_down, (constants.IMAGE_WIDTH, constants.IMAGE_HEIGHT),
+                                flags=cv2.INTER_AREA, borderValue=(60, 70, 80))
+    image = cv2.GaussianBlur(image, (3, 3), 0).astype(np.float32)
+    light = np.linspace(0.7, 1.1, constants.IMAGE_WIDTH, dtype=np.float32)[None, :, None]
+    image = image * light + rng.normal(0, 4, image.shape)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+def matrix_error(solved, true, constants):
+    ''' mean distance (camera px, board mm) between the board points put by both matrices '''
+    error_px, _, error_mm, _ = matrix_drift(true, solved, constants)
+    return error_px, error_mm
+
+
+def check_synthetic(constants, click_error, seed):
+    rng = np.random.default_rng(seed)
+    board = render_board(constants)
+    views = {
+        'center': [(322, 70), (510, 232), (320, 420), (128, 230)],
+        'right': [(300, 95), (520, 215), (340, 380), (110, 250)],
+        'left': [(350, 90), (545, 260), (290, 390), (95, 215)],
+    }
+    print(f"{'view':<8} {'auto px':>8} {'auto mm':>8} {'pairs':>7} {'time':>7} {'4 clicks px':>12} {'4 clicks mm':>12}")
+    for name, corners in views.items():
+        true, drawn = camera_matrix(constants, corners)
+        image = camera_image(board, true, constants, rng)
+
+        # the camera was bumped: the old matrix is 12 px and 4 degrees off
+        bump = cv2.getRotationMatrix2D(tuple(map(float, constants.center)), 4, 1.0)
+        bump = np.vstack([bump, [0, 0, 1]])
+        bump[:2, 2] += 12
+        up_point = tuple(project(true @ bump, [drawn_top(constants)])[0])
+        result = auto_calibrate(image, constants, up_point)
+        if result is None:
+            print(f"{name:<8} board not found")
+            continue
+        auto_px, auto_mm = matrix_error(result.matrix, true, constants)
+
+        clicks = np.float32(corners) + rng.normal(0, click_error, (4, 2)).astype(np.float32)
+        clicked_px, clicked_mm = matrix_error(cv2.getPerspectiveTransform(drawn, clicks), true, constants)
+        print(f"{name:<8} {auto_px:8.2f} {auto_mm:8.2f} {result.inliers:>3}/{result.pairs:<3} "
+              f"{result.seconds * 1000:5.0f}ms {clicked_px:12.2f} {clicked_mm:12.2f}")
+
+
+def check_images(constants, folder):
+    paths = sorted(glob.glob(os.path.join(folder, "*.png")) + glob.glob(os.path.join(folder, "*.jpg")))
+    for path in paths:
+        result = auto_calibrate(cv2.imread(path, cv2.IMREAD_COLOR), constants)
+        print(f"{os.path.basename(path)}: {result.summary() if result else 'board not found'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the automatic calibration")
+    parser.add_argument("--images", help="folder of camera images of the board")
+    parser.add_argument("--click-error", type=float, default=2.0, help="click error (pixels, std) of the 4 clicks")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    constants = load_config()
+    if args.images:
+        check_images(constants, args.images)
+    else:
+        check_synthetic(constants, args.click_error, args.seed)
+
+
+if __name__ == '__main__':
+    main()
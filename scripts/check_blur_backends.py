@@ -0,0 +1,95 @@
+"""
+check_blur_backends.py
+
+Function:
+This file is used to check that the diff2blur blur backends (BLUR_BACKEND in cv_constants_base.yaml) give the
+same detection results, and how fast each one is on this cpu. For every pair of frames (the reference frame and
+the frame with the dart), each backend blurs the difference and the result is compared with filter2d (the
+original blur): pixels that differ in the blur and in the threshold image, and the number of corners found.
+
+--frames is a folder with recorded pairs: <name>_reference.png and <name>_dart.png (gray or color). Without it,
+synthetic pairs (a dart-like line on a noisy background) are used.
+
+Run this file in the project root directory
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import cv2
+import numpy as np
+from cv_config import load_config
+from utils import BLUR_BACKENDS, getCorners
+
+
+def recorded_pairs(folder):
+    pairs = []
+    for reference_path in sorted(glob.glob(os.path.join(folder, "*_reference.png"))):
+        dart_path = reference_path.replace("_reference.png", "_dart.png")
+        if os.path.exists(dart_path):
+            reference = cv2.imread(reference_path, cv2.IMREAD_GRAYSCALE)
+            dart = cv2.imread(dart_path, cv2.IMREAD_GRAYSCALE)
+            pairs.append((os.path.basename(reference_path)[:-len("_reference.png")], reference, dart))
+    return pairs
+
+
+def synthetic_pairs(count, width, height):
+    rng = np.random.default_rng(0)
+    pairs = []
+    for i in range(count):
+        reference = cv2.GaussianBlur(rng.integers(60, 140, (height, width), dtype=np.uint8), (7, 7), 0)
+        dart = reference.copy()
+        x, y = int(rng.integers(100, width - 100)), int(rng.integers(100, height - 150))
+        angle = rng.uniform(-0.6, 0.6)
+        tip = (int(x + 120 * np.sin(angle)), int(y + 120 * np.cos(angle)))
+        cv2.line(dart, (x, y), tip, 230, 6)
+        noise = rng.normal(0, 3, dart.shape)
+        dart = np.clip(dart + noise, 0, 255).astype(np.uint8)
+        pairs.append((f"synthetic_{i}", reference, dart))
+    return pairs
+
+
+def corner_count(blur):
+    return len(getCorners(blur))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare the diff2blur blur backends")
+    parser.add_argument("--frames", help="folder with <name>_reference.png / <name>_dart.png pairs")
+    parser.add_argument("--synthetic", type=int, default=20, help="number of synthetic pairs without --frames")
+    parser.add_argument("--iterations", type=int, default=100, help="timing iterations per backend")
+    args = parser.parse_args()
+
+    constants = load_config()
+    pairs = recorded_pairs(args.frames) if args.frames else synthetic_pairs(args.synthetic, constants.IMAGE_WIDTH, constants.IMAGE_HEIGHT)
+    if not pairs:
+        sys.exit("No frame pairs found")
+
+    threshold = constants.DIFF_THRESHOLD
+    diffs = [cv2.absdiff(reference, dart) for _, reference, dart in pairs]
+    expected = [BLUR_BACKENDS['filter2d'](diff) for diff in diffs]
+
+    print(f"{len(pairs)} pairs, DIFF_THRESHOLD {threshold}")
+    print(f"{'backend':>10} {'ms/frame':>9} {'blur px':>8} {'thresh px':>10} {'corners':>8} {'same':>6}")
+    for name, blur in BLUR_BACKENDS.items():
+        start = time.perf_counter()
+        for _ in range(args.iterations):
+            blur(diffs[0])
+        ms = (time.perf_counter() - start) / args.iterations * 1000
+
+        blur_px = thresh_px = corner_diff = same = 0
+        for diff, reference_blur in zip(diffs, expected):
+            result = blur(diff)
+            blur_px += int(np.count_nonzero(result != reference_blur))
+            _, thresh = cv2.threshold(result, threshold, 255, 0)
+            _, reference_thresh = cv2.threshold(reference_blur, threshold, 255, 0)
+            mismatch = int(np.count_nonzero(thresh != reference_thresh))
+            thresh_px += mismatch
+            corners = abs(corner_count(result) - corner_count(reference_blur))
+            corner_diff += corners
+            same += mismatch == 0 and corners == 0
+        print(f"{name:>10} {ms:>9.3f} {blur_px:>8} {thresh_px:>10} {corner_diff:>8} {same:>3}/{len(pairs)}")
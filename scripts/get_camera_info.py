@@ -2,21 +2,36 @@
 get_camera_info.py
 
 Function:
-This file is used to get the frame width and height of the camera used. This info is 
+This file is used to get the frame format, width, height, fps and buffer size of the cameras used, as they are
+by default and as they are after the capture profile (config/capture.yaml) was applied. This info is
 needed during the calibartion of the cameras for the computer vision
 
+Run this file in the project root directory
 """
+import argparse
+import os
+import sys
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
 
 import cv2
+from capture import DEFAULT_CAPTURE_PATH, apply_profile, granted_profile, load_capture_profiles, profile_for, profile_mismatches
 
-# Open the camera (0 is usually the default webcam)
-cap = cv2.VideoCapture(0)
+parser = argparse.ArgumentParser(description="Print the default and granted settings of the cameras")
+parser.add_argument("camera_ids", type=int, nargs="*", default=[0, 2, 4], help="IDs of the cameras to open")
+parser.add_argument("--profiles", default=DEFAULT_CAPTURE_PATH, help="capture profiles file")
+args = parser.parse_args()
 
-if cap.isOpened():
-    frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    
-    print(f"Frame width: {frame_width}, Frame height: {frame_height}")
-
-cap.release()
\ No newline at end of file
+profiles = load_capture_profiles(args.profiles)
+for camera_id in args.camera_ids:
+    cap = cv2.VideoCapture(camera_id)
+    if not cap.isOpened():
+        print(f"Camera {camera_id}: could not be opened")
+        continue
+    print(f"Camera {camera_id} default: {granted_profile(cap)}")
+    profile = profile_for(camera_id, profiles)
+    granted = apply_profile(cap, profile)
+    print(f"Camera {camera_id} granted: {granted}")
+    for name, (asked, got) in profile_mismatches(profile, granted).items():
+        print(f"    {name}: asked {asked}, got {got}")
+    cap.release()
@@ -1,41 +1,55 @@
 """
-camera_test.py
+get_fps.py
 
 Function:
-This file is used to see the approximate FPS of the camera used. 
+This file is used to check the cameras with the capture profiles of config/capture.yaml. All the cameras are
+opened together and read one after the other (like the scoring loop does), so a USB hub that can not carry all
+the streams shows up as a low fps. For every camera it prints what was asked and what the driver granted,
+the effective FPS and how old the frames were when read() returned them.
 This info is needed for the CV calibartion
 
+Run this file in the project root directory
 """
-
-
-import cv2
-import time
-
-# Open the camera
-cap = cv2.VideoCapture(0)  # Use the appropriate camera index
-
-# Check if the camera opened successfully
-if not cap.isOpened():
-    print("Error: Could not open camera.")
-    exit()
-
-# Initialize variables
-num_frames = 120  # Number of frames to capture
-start_time = time.time()
-
-for i in range(num_frames):
-    ret, frame = cap.read()
-    if not ret:
-        print("Error: Could not read frame.")
-        break
-
-# Calculate the time elapsed and FPS
-end_time = time.time()
-elapsed_time = end_time - start_time
-fps = num_frames / elapsed_time
-
-print(f"Approximate FPS: {fps}")
-
-# Release the camera
-cap.release()
-cv2.destroyAllWindows()
\ No newline at end of file
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from capture import DEFAULT_CAPTURE_PATH, load_capture_profiles, open_camera, profile_mismatches
+
+parser = argparse.ArgumentParser(description="Measure the FPS and frame age of the cameras")
+parser.add_argument("camera_ids", type=int, nargs="*", default=[0, 2, 4], help="IDs of the cameras to open")
+parser.add_argument("--profiles", default=DEFAULT_CAPTURE_PATH, help="capture profiles file")
+parser.add_argument("--frames", type=int, default=120, help="number of frames to read per camera")
+args = parser.parse_args()
+
+profiles = load_capture_profiles(args.profiles)
+cameras = [open_camera(camera_id, profiles) for camera_id in args.camera_ids]
+
+for cam in cameras:
+    if not cam.isOpened():
+        print(f"Camera {cam.camera_id}: could not be opened")
+        continue
+    print(f"Camera {cam.camera_id}: asked {cam.profile}")
+    print(f"Camera {cam.camera_id}: granted {cam.granted}")
+    if not profile_mismatches(cam.profile, cam.granted):
+        print(f"Camera {cam.camera_id}: profile granted as asked")
+
+cameras = [cam for cam in cameras if cam.isOpened()]
+for i in range(args.frames):
+    for cam in cameras:
+        ret, frame = cam.read()
+        if not ret:
+            print(f"Error: Camera {cam.camera_id} could not read frame {i}.")
+
+for cam in cameras:
+    stats = cam.stats()
+    fps = stats.get('effective_fps')
+    line = f"Camera {cam.camera_id}: {stats['frames']} frames, effective FPS: {fps:.1f}" if fps else f"Camera {cam.camera_id}: no FPS"
+    if 'frame_age_ms_mean' in stats:
+        line += f", frame age: {stats['frame_age_ms_mean']:.1f} ms (p95 {stats['frame_age_ms_p95']:.1f} ms)"
+    else:
+        line += ", frame age: not reported by this backend"
+    print(line)
+    cam.release()
@@ -0,0 +1,43 @@
+"""
+import_time.py
+
+Function:
+This file is used to measure how long it takes to import the scoring modules. Each module is imported in a fresh
+python process (so nothing is cached from a previous import) and the time is printed in milliseconds.
+Importing should not need a calibrated board or the config file, so this also works on a dev machine.
+
+Run this file in the project root directory
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+DEFAULT_MODULES = ["cv_context", "utils", "darts_cv", "calibrate"]
+
+TIMER = "import time; t = time.perf_counter(); import {module}; print((time.perf_counter() - t) * 1000)"
+
+
+def time_import(module, repeats):
+    times = []
+    for _ in range(repeats):
+        result = subprocess.run([sys.executable, "-c", TIMER.format(module=module)], cwd=SRC_DIR,
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            print(f"{module}: import failed\n{result.stderr}")
+            return None
+        times.append(float(result.stdout.strip()))
+    return min(times)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Measure the import time of the scoring modules")
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES, help="modules (in src/) to import")
+    parser.add_argument("-n", "--repeats", type=int, default=5, help="number of runs, the best one is reported")
+    args = parser.parse_args()
+
+    for module in args.modules:
+        best = time_import(module, args.repeats)
+        if best is not None:
+            print(f"{module:<20} {best:8.2f} ms")
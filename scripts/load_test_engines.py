@@ -0,0 +1,94 @@
+"""
+load_test_engines.py
+
+Function:
+This file is used to see how many boards one SocketIO server can handle. It runs N replay engines (one per board)
+inside one Flask-SocketIO app, with a few connected (test) clients per board, and reports how late the events
+were sent compared to when the recording says they should have been (lag) and how many events the clients got.
+Without --recording, a recording of random darts is generated first (see SimulatedEngine).
+
+Run this file in the project root directory
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import numpy as np
+from flask import Flask
+from flask_socketio import SocketIO, join_room
+from detection_engine import ReplayEngine, SimulatedEngine
+from event_bus import ScoreEvent
+
+
+def make_recording(path, num_events, spacing):
+    simulated = SimulatedEngine(None, None)
+    start = time.time()
+    with open(path, "w") as file:
+        for i in range(num_events):
+            score, sector, ring = simulated.generate_random_hit()
+            board_x, board_y = simulated.board_location(sector, ring)
+            event = ScoreEvent(score=score, sector=sector, ring=ring, board_x=board_x, board_y=board_y,
+                               confidence=1.0, detected_at=start + i * spacing)
+            file.write(json.dumps(event.to_dict()) + "\n")
+
+
+def run(num_boards, clients_per_board, recording, speed, duration):
+    app = Flask(__name__)
+    socketio = SocketIO(app, async_mode="threading")
+
+    @socketio.on('join')
+    def handle_join(data):
+        join_room(data['board'])
+
+    lags = []
+
+    def on_event_for(board_id):
+        def on_event(event):
+            socketio.emit(event.kind, event.to_app(), to=board_id)
+            lags.append(time.time() - event.detected_at)
+        return on_event
+
+    clients = []
+    for board in range(num_boards):
+        for _ in range(clients_per_board):
+            client = socketio.test_client(app)
+            client.emit('join', {'board': f"board{board}"})
+            clients.append(client)
+
+    engines = [ReplayEngine(socketio, on_event_for(f"board{board}"), recording, speed=speed, loop=True,
+                            board_id=f"board{board}") for board in range(num_boards)]
+    for engine in engines:
+        engine.initialize()
+        engine.start()
+    time.sleep(duration)
+    for engine in engines:
+        engine.stop()
+
+    received = sum(len(client.get_received()) for client in clients)
+    lags_ms = np.array(lags) * 1000 if lags else np.zeros(1)
+    print(f"{num_boards:>6} {len(lags) / duration:>10.1f} {np.percentile(lags_ms, 50):>9.2f} "
+          f"{np.percentile(lags_ms, 95):>9.2f} {lags_ms.max():>9.2f} {received:>9}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Load test the SocketIO layer with replayed boards")
+    parser.add_argument("--boards", default="1,2,4,8,16", help="comma separated board counts to try")
+    parser.add_argument("--clients", type=int, default=2, help="connected clients per board")
+    parser.add_argument("--recording", help="recording (.jsonl) to replay, default: generated random darts")
+    parser.add_argument("--speed", type=float, default=20.0, help="replay speed factor")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per run")
+    args = parser.parse_args()
+
+    recording = args.recording
+    if recording is None:
+        recording = os.path.join(tempfile.mkdtemp(), "random_darts.jsonl")
+        make_recording(recording, 300, spacing=2.0)
+
+    print(f"{'boards':>6} {'events/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9} {'received':>9}")
+    for num_boards in [int(n) for n in args.boards.split(",")]:
+        run(num_boards, args.clients, recording, args.speed, args.duration)
@@ -1,12 +1,21 @@
+import os
+import sys
+import argparse
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
 from flask import Flask, render_template
 from flask_socketio import SocketIO
-from darts_cv_simulation import *
+from detection_engine import ENGINES, create_engine
+from event_bus import ScoreSubscriber, DEFAULT_SOCKET_PATH
 
 app = Flask(__name__)
 socketio = SocketIO(app, cors_allowed_origins="*")
 
-# Instantiate the DartDetection class
-dart_detection = DartDetection(socketio)
+# the detection engine (simulated/replay/live), created in main
+dart_detection = None
+
+def send_score_event(event):
+    socketio.emit(event.kind, event.to_app())
 
 @app.route('/')
 def index():
@@ -16,7 +25,12 @@ def index():
 @socketio.on('start_game')
 def handle_start_game():
     """Starts the CV loop."""
-    dart_detection.initialize()
+    try:
+        dart_detection.initialize()
+    except Exception as e:
+        socketio.emit('game_status', {'message': f'Failed to start: {str(e)}'})
+        return
+    socketio.emit('cvinit_status', {'cvInit': 'Done Init'})
     dart_detection.start()
     socketio.emit('game_status', {'message': 'Game started'})
 
@@ -26,5 +40,36 @@ def handle_stop_game():
     dart_detection.stop()
     socketio.emit('game_status', {'message': 'Game stopped'})
 
+def relay_score_events(subscriber):
+    """Forwards the score events from the cv process (main.py) to the browsers."""
+    while True:
+        for event in subscriber.poll():
+            send_score_event(event)
+        socketio.sleep(0.02)
+
+def build_engine(args):
+    kwargs = {'record_path': args.record}
+    if args.engine == 'replay':
+        if args.recording is None:
+            sys.exit("--recording is needed for the replay engine")
+        kwargs.update(recording_path=args.recording, speed=args.speed, loop=args.loop)
+    elif args.engine == 'simulated':
+        kwargs.update(interval=args.interval)
+    return create_engine(args.engine, socketio, send_score_event, **kwargs)
+
 if __name__ == '__main__':
-    socketio.run(app, host='0.0.0.0', port=5000, debug=True)
+    parser = argparse.ArgumentParser(description="Smart dartboard app")
+    parser.add_argument("--engine", choices=list(ENGINES), default="simulated", help="where the darts come from")
+    parser.add_argument("--recording", help="recording (.jsonl) for the replay engine")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed factor")
+    parser.add_argument("--loop", action="store_true", help="replay the recording forever")
+    parser.add_argument("--interval", type=float, default=5.0, help="seconds between simulated darts")
+    parser.add_argument("--record", help="append the events of this session to a recording (.jsonl)")
+    args = parser.parse_args()
+
+    dart_detection = build_engine(args)
+    socketio.start_background_task(relay_score_events, ScoreSubscriber(DEFAULT_SOCKET_PATH))
+    try:
+        socketio.run(app, host='0.0.0.0', port=5000, debug=True)
+    finally:
+        dart_detection.close()
@@ -5,15 +5,25 @@ LEDs.py
 
 Function: 
 This file is holds the functions to control the LED strips for the dartboard. 
+The methods only queue the pixel changes, the LEDEngine thread (led_engine.py) draws them into a frame buffer
+and calls show() once per frame, so none of these block the cv loop.
 """
 
-import time
-from rpi_ws281x import *
 import argparse
+from led_engine import LEDEngine, MockStrip
+from led_layout import (LEDLayout, NUMBER_RING, DOUBLE_RING, OUTER_SINGLE_RING, TRIPLE_RING,
+                        INNER_SINGLE_RING)
+
+try:
+    from rpi_ws281x import Adafruit_NeoPixel, Color
+except ImportError:
+    # not on the pi, use the mock strip so the rest of the code still runs
+    Adafruit_NeoPixel = None
+    from led_engine import Color
 
 class LEDs:
 
-    def __init__(self):
+    def __init__(self, strip=None, max_fps=60, use_mock=False):
         # LED strip configuration:
         self.NUM_STRIPS = 5
         self.NUM_LED_PER_STRIP = 19
@@ -30,12 +40,36 @@ class LEDs:
         self.TRPL_RING = 10
         self.DBL_RING = 1
 
+        # board number under each strip, in wiring order (strip 0 first)
+        self.STRIP_SECTORS = [20, 1, 18, 4, 13]
+
+        self.HIT_COLORS = {
+            'double': Color(0, 128, 0),
+            'triple': Color(0, 128, 0),
+            'outer_single': Color(0, 0, 255),
+            'inner_single': Color(0, 0, 255),
+        }
+
+        # segment -> pixel tables, built once from the strip geometry
+        self.layout = LEDLayout(self.NUM_STRIPS, self.NUM_LED_PER_STRIP, self.NUM_RING, self.DBL_RING,
+                                self.TRPL_RING, self.STRIP_SECTORS)
+
         # Initialize the LED strip
-        self.strip = Adafruit_NeoPixel(
-            self.LED_COUNT, self.LED_PIN, self.LED_FREQ_HZ,
-            self.LED_DMA, self.LED_INVERT, self.LED_BRIGHTNESS, self.LED_CHANNEL
-        )
+        if strip is None:
+            if Adafruit_NeoPixel is None and not use_mock:
+                print("rpi_ws281x not available, using a mock LED strip")
+                use_mock = True
+            strip_class = MockStrip if use_mock else Adafruit_NeoPixel
+            strip = strip_class(
+                self.LED_COUNT, self.LED_PIN, self.LED_FREQ_HZ,
+                self.LED_DMA, self.LED_INVERT, self.LED_BRIGHTNESS, self.LED_CHANNEL
+            )
+        self.strip = strip
         self.strip.begin()
+        self.engine = LEDEngine(self.strip, max_fps=max_fps).start()
+
+    def close(self, clear=True):
+        self.engine.stop(clear=clear)
 
     def getSegIndexes(self, strip_num):
     
@@ -44,91 +78,43 @@ class LEDs:
         
         return start_seg, end_seg 
     
-    # Sweep colors across strip     
+    # Sweep colors across strip (one pixel every wait_ms, animated by the engine)
     def colorWipe(self, strip_num, color, wait_ms=50):
         start_seg, end_seg = self.getSegIndexes(strip_num) 
-        for i in range(start_seg, end_seg):
-            self.strip.setPixelColor(i, color)
-            self.strip.show()
-            time.sleep(wait_ms/1000.0)
+        self.engine.wipe(range(start_seg, end_seg), color, wait_ms)
 
     # Turn off all LEDs
     def clearAll(self, wait_ms=1): 
-        for i in range(self.strip.numPixels()):
-            self.strip.setPixelColor(i, Color(0,0,0))
-            self.strip.show()
-            time.sleep(wait_ms/1000.0)
+        self.engine.clear()
 
     # Lights up number segment on outer circumference of dartboard 
     def numSeg(self, strip_num, color, wait_ms=5):
-        # light up number segment outside of dartboard
-        if(strip_num % 2 == 0): #even num strip 
-            pixel = self.NUM_RING + self.NUM_LED_PER_STRIP*strip_num
-        else: # odd num strip 
-            pixel = self.NUM_LED_PER_STRIP*strip_num + (self.NUM_LED_PER_STRIP - 1)
-            
-        self.strip.setPixelColor(pixel, color)
-        self.strip.show()
-        time.sleep(wait_ms/1000.0)
+        self.engine.set_pixels(self.layout.strip_pixels(strip_num, NUMBER_RING), color)
         
     # Lights up triple segment 
     def tripleSeg(self, strip_num, color, wait_ms=5):
-        # light up triple segment
-        if(strip_num % 2 == 0): #even num strip 
-            pixel = self.TRPL_RING + self.NUM_LED_PER_STRIP*strip_num
-        else: # odd num strip 
-            pixel = self.NUM_LED_PER_STRIP*strip_num + (self.NUM_LED_PER_STRIP - self.TRPL_RING - 1)
-        
-        self.strip.setPixelColor(pixel, color)
-        self.strip.show()
-        time.sleep(wait_ms/1000.0)
+        self.engine.set_pixels(self.layout.strip_pixels(strip_num, TRIPLE_RING), color)
         
     # Lights up double segment 
     def doubleSeg(self, strip_num, color, wait_ms=5):
-        # light up triple segment
-        if(strip_num % 2 == 0): #even num strip 
-            pixel = self.DBL_RING + self.NUM_LED_PER_STRIP*strip_num
-        else: # odd num strip 
-            pixel = self.NUM_LED_PER_STRIP*strip_num + (self.NUM_LED_PER_STRIP - self.DBL_RING - 1)
-        
-        self.strip.setPixelColor(pixel, color)
-        self.strip.show()
-        time.sleep(wait_ms/1000.0)
+        self.engine.set_pixels(self.layout.strip_pixels(strip_num, DOUBLE_RING), color)
 
     # Lights up outer single segment (closest to circumference)
     def outerSingleSeg(self, strip_num, color, wait_ms=5):
-        
-        if(strip_num % 2 == 0): #even num strip 
-            start_seg = (self.DBL_RING + self.NUM_LED_PER_STRIP*strip_num) + 1
-            end_seg = self.TRPL_RING + self.NUM_LED_PER_STRIP*strip_num
-        else: # odd num strip
-            end_seg = self.NUM_LED_PER_STRIP*strip_num + (self.NUM_LED_PER_STRIP - self.DBL_RING) - 1
-            start_seg = self.NUM_LED_PER_STRIP*strip_num + (self.NUM_LED_PER_STRIP - self.TRPL_RING)
-        
-        
-        for i in range(start_seg, end_seg):
-            self.strip.setPixelColor(i, color)
-            self.strip.show()
-            time.sleep(wait_ms/1000.0)
+        self.engine.set_pixels(self.layout.strip_pixels(strip_num, OUTER_SINGLE_RING), color)
 
     # Lights up inner single segment (furthest from circumference)
     def innerSingleSeg(self, strip_num, color, wait_ms=5):
-        
-        if(strip_num % 2 == 0): #even num strip 
-            start_seg = self.NUM_LED_PER_STRIP*strip_num + self.TRPL_RING + 1 
-            end_seg = self.NUM_LED_PER_STRIP*strip_num + self.NUM_LED_PER_STRIP
-        else: # odd num strip
-            start_seg = self.NUM_LED_PER_STRIP*strip_num 
-            end_seg = self.NUM_LED_PER_STRIP*strip_num + (self.NUM_LED_PER_STRIP - self.TRPL_RING - 1)
-        
-        
-        for i in range(start_seg, end_seg):
-            self.strip.setPixelColor(i, color)
-            self.strip.show()
-            time.sleep(wait_ms/1000.0)
+        self.engine.set_pixels(self.layout.strip_pixels(strip_num, INNER_SINGLE_RING), color)
+
+    # Lights up the segment that was hit + its number, (sector, ring) as returned by the scoring code
+    def hitSeg(self, sector, ring, color=None):
+        pixels = self.layout.hit_pixels(sector, ring)
+        if len(pixels) == 0:
+            return False
+        self.engine.set_pixels(pixels, color if color is not None else self.HIT_COLORS[ring])
+        return True
 
-                    
-        
 # # Main program testing 
 # if __name__ == '__main__':
 #     # Process arguments
@@ -0,0 +1,339 @@
+"""
+analytics.py
+
+Function:
+This file turns the scored darts into statistics for the players (where they hit, how tight they group, points per
+dart) and for the operators (where on the board each camera gets the score wrong). The input is the position of
+the dart on the drawn board (DartBoard_CV.dart_coordinates, made by transform_score), the final score and the
+score of every camera.
+
+ThrowStats is the set of aggregates of one group of throws (a player, a board):
+    heatmap            2D histogram of the board positions, HEATMAP_BIN_PX drawn board pixels per bin
+    segments           counts per ring id (board_layout.RING_NAMES) and sector number (0 miss .. 20, 25 bulls)
+    grouping           center and spread of all the throws (running sums of x, y, x*x, y*y, x*y)
+    rolling            the same plus points per dart and the scoring accuracy over the last ROLLING_WINDOW throws
+    camera error maps  per camera, throws and misscores (camera score != right score) per ERROR_MAP_BIN_PX bin
+Every aggregate is updated in O(1) when a throw is added (a few counters and array cells), so the dashboard reads
+them as they are and never goes through the history again. add_many() adds the history once (ie: from the throw
+log, ThrowLog.columns) vectorized with numpy. Analytics keeps one ThrowStats per player and per board.
+"""
+import collections
+import math
+import threading
+
+from board_layout import RING_NAMES
+from cv_context import lazy_import
+
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+
+HEATMAP_BIN_PX = 4
+ERROR_MAP_BIN_PX = 16
+ROLLING_WINDOW = 30  # darts (10 visits)
+HEATMAP_OPACITY = 0.6
+NUM_CAMERAS = 3
+SECTOR_COLUMNS = 26  # sector numbers 0..25 (0 miss, 25 bulls) used as the column
+DOUBLE_TRIPLE = (RING_NAMES.index('double'), RING_NAMES.index('triple'))
+
+
+def ring_index(ring):
+    return ring if isinstance(ring, (int, np.integer)) else RING_NAMES.index(ring)
+
+
+class Moments:
+    """ Running sums of points: their center and spread (covariance), points can also be taken out again """
+
+    def __init__(self):
+        self.n = 0
+        self.sums = [0.0] * 5  # x, y, x*x, y*y, x*y
+
+    def add(self, x, y, weight=1):
+        self.n += weight
+        for i, value in enumerate((x, y, x * x, y * y, x * y)):
+            self.sums[i] += weight * value
+
+    def add_many(self, x, y):
+        self.n += len(x)
+        for i, values in enumerate((x, y, x * x, y * y, x * y)):
+            self.sums[i] += float(np.sum(values))
+
+    def center(self):
+        return (self.sums[0] / self.n, self.sums[1] / self.n) if self.n else None
+
+    def covariance(self):
+        if self.n < 2:
+            return None
+        mx, my = self.center()
+        xx = self.sums[2] / self.n - mx * mx
+        yy = self.sums[3] / self.n - my * my
+        xy = self.sums[4] / self.n - mx * my
+        return np.array([[xx, xy], [xy, yy]])
+
+    def radius(self):
+        ''' root mean square distance of the points from their center '''
+        covariance = self.covariance()
+        return None if covariance is None else math.sqrt(max(0.0, covariance[0, 0] + covariance[1, 1]))
+
+
+class ThrowStats:
+
+    def __init__(self, constants, heatmap_bin_px=HEATMAP_BIN_PX, error_map_bin_px=ERROR_MAP_BIN_PX,
+                 window=ROLLING_WINDOW):
+        self.pixels_per_mm = constants.PIXELS_PER_MM
+        self.heatmap_bin_px = heatmap_bin_px
+        self.error_map_bin_px = error_map_bin_px
+        self.heatmap = np.zeros((-(-constants.IMAGE_HEIGHT // heatmap_bin_px),
+                                 -(-constants.IMAGE_WIDTH // heatmap_bin_px)), np.int64)
+        error_shape = (-(-constants.IMAGE_HEIGHT // error_map_bin_px), -(-constants.IMAGE_WIDTH // error_map_bin_px))
+        self.error_throws = np.zeros(error_shape, np.int64)
+        self.camera_misses = np.zeros((NUM_CAMERAS, *error_shape), np.int64)
+        self.segments = np.zeros((len(RING_NAMES), SECTOR_COLUMNS), np.int64)
+        self.throws = 0
+        self.points = 0
+        self.wrong = 0  # the final score was not the right one (corrected)
+        self.grouping = Moments()
+        # last throws (x, y, score, double/triple, wrong) and the running sums over them
+        self.window = collections.deque(maxlen=window)
+        self.rolling = Moments()
+        self.rolling_points = 0
+        self.rolling_double_triple = 0
+        self.rolling_wrong = 0
+
+    def _cells(self, x, y, bin_px, shape):
+        ''' bin (row, col) of board positions, clipped to the map '''
+        row = np.clip(np.asarray(y, np.float64) // bin_px, 0, shape[0] - 1).astype(np.intp)
+        col = np.clip(np.asarray(x, np.float64) // bin_px, 0, shape[1] - 1).astype(np.intp)
+        return row, col
+
+    @staticmethod
+    def _cell(x, y, bin_px, shape):
+        ''' _cells of one position, with plain ints (a throw at a time) '''
+        return min(max(int(y // bin_px), 0), shape[0] - 1), min(max(int(x // bin_px), 0), shape[1] - 1)
+
+    def add(self, x, y, score, sector, ring, camera_scores=None, right_score=None):
+        '''
+        One throw. right_score: the corrected score when the final score was wrong (None: it was right)
+        '''
+        ring = ring_index(ring)
+        right_score = score if right_score is None else right_score
+        wrong = right_score != score
+        self.throws += 1
+        self.points += right_score
+        self.wrong += wrong
+        self.segments[ring, sector] += 1
+        row, col = self._cell(x, y, self.heatmap_bin_px, self.heatmap.shape)
+        self.heatmap[row, col] += 1
+        self.grouping.add(x, y)
+
+        row, col = self._cell(x, y, self.error_map_bin_px, self.error_throws.shape)
+        self.error_throws[row, col] += 1
+        for camera, camera_score in enumerate(camera_scores or ()):
+            self.camera_misses[camera, row, col] += camera_score != right_score
+
+        self.window_add(x, y, right_score, ring in DOUBLE_TRIPLE, wrong)
+
+    def add_many(self, x, y, scores, sectors, rings, camera_scores=None, right_scores=None):
+        ''' Throws as arrays (oldest first), camera_scores (N, 3) with -1/nan where a camera found nothing '''
+        x = np.asarray(x, np.float64)
+        y = np.asarray(y, np.float64)
+        scores = np.asarray(scores, np.int64)
+        rings = np.asarray(rings, np.intp)
+        right_scores = scores if right_scores is None else np.asarray(right_scores, np.int64)
+        wrong = right_scores != scores
+        self.throws += len(x)
+        self.points += int(right_scores.sum())
+        self.wrong += int(wrong.sum())
+        np.add.at(self.segments, (rings, np.asarray(sectors, np.intp)), 1)
+        np.add.at(self.heatmap, self._cells(x, y, self.heatmap_bin_px, self.heatmap.shape), 1)
+        self.grouping.add_many(x, y)
+
+        cells = self._cells(x, y, self.error_map_bin_px, self.error_throws.shape)
+        np.add.at(self.error_throws, cells, 1)
+        if camera_scores is not None:
+            misses = np.asarray(camera_scores, np.float64) != right_scores[:, None]
+            for camera in range(misses.shape[1]):
+                np.add.at(self.camera_misses[camera], cells, misses[:, camera])
+
+        # the rolling window only needs the last throws
+        start = max(0, len(x) - self.window.maxlen)
+        for i in range(start, len(x)):
+            self.window_add(x[i], y[i], int(right_scores[i]), int(rings[i]) in DOUBLE_TRIPLE, bool(wrong[i]))
+
+    def correct(self, x, y, final, previous, right, camera_scores=None):
+        '''
+        A throw added before was corrected: final/previous/right are (score, sector, ring) as scored, as counted so
+        far (the final one, or an earlier correction) and the right one. The rolling window keeps the throw as it was
+        '''
+        self.points += right[0] - previous[0]
+        self.wrong += (right[0] != final[0]) - (previous[0] != final[0])
+        self.segments[ring_index(previous[2]), previous[1]] -= 1
+        self.segments[ring_index(right[2]), right[1]] += 1
+        row, col = self._cell(x, y, self.error_map_bin_px, self.error_throws.shape)
+        for camera, camera_score in enumerate(camera_scores or ()):
+            self.camera_misses[camera, row, col] += (camera_score != right[0]) - (camera_score != previous[0])
+
+    def window_add(self, x, y, score, double_triple, wrong):
+        # the oldest throw leaves the window when it is full
+        if len(self.window) == self.window.maxlen:
+            old_x, old_y, old_score, old_double_triple, old_wrong = self.window[0]
+            self.rolling.add(old_x, old_y, weight=-1)
+            self.rolling_points -= old_score
+            self.rolling_double_triple -= old_double_triple
+            self.rolling_wrong -= old_wrong
+        self.window.append((x, y, score, double_triple, wrong))
+        self.rolling.add(x, y)
+        self.rolling_points += score
+        self.rolling_double_triple += double_triple
+        self.rolling_wrong += wrong
+
+    def camera_error_maps(self):
+        ''' (3, rows, cols) misscore rate of every camera per bin, nan where there were no throws '''
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.error_throws > 0, self.camera_misses / self.error_throws, np.nan)
+
+    def camera_error_bins(self):
+        ''' the bins with throws: center (board pixels), throws and the misscore rate of every camera '''
+        rows, cols = np.nonzero(self.error_throws)
+        throws = self.error_throws[rows, cols]
+        rates = self.camera_misses[:, rows, cols] / throws
+        half = self.error_map_bin_px / 2
+        return [{'x': int(col) * self.error_map_bin_px + half, 'y': int(row) * self.error_map_bin_px + half,
+                 'throws': int(count), 'camera_misscore_rates': [round(float(rate), 3) for rate in rates[:, i]]}
+                for i, (row, col, count) in enumerate(zip(rows, cols, throws))]
+
+    def segment_table(self):
+        ''' {ring name: {sector number: throws}} of the segments that were hit '''
+        table = {}
+        for ring, sector in zip(*np.nonzero(self.segments)):
+            table.setdefault(RING_NAMES[ring], {})[int(sector)] = int(self.segments[ring, sector])
+        return table
+
+    def _grouping(self, moments):
+        center, radius = moments.center(), moments.radius()
+        return {
+            'center': None if center is None else [round(center[0], 1), round(center[1], 1)],
+            'radius_mm': None if radius is None else radius / self.pixels_per_mm,
+        }
+
+    def summary(self):
+        n = len(self.window)
+        return {
+            'throws': self.throws,
+            'points_per_dart': self.points / self.throws if self.throws else None,
+            'scoring_accuracy': 1 - self.wrong / self.throws if self.throws else None,
+            'grouping': self._grouping(self.grouping),
+            'segments': self.segment_table(),
+            'rolling': {
+                'throws': n,
+                'points_per_dart': self.rolling_points / n if n else None,
+                'double_triple_rate': self.rolling_double_triple / n if n else None,
+                'scoring_accuracy': 1 - self.rolling_wrong / n if n else None,
+                **self._grouping(self.rolling),
+            },
+            'camera_misscore_rates': [float(misses.sum()) / self.throws if self.throws else None
+                                      for misses in self.camera_misses],
+        }
+
+
+def _overlay(levels, hit, board):
+    # levels (0..1) of the bins colored over the board, only where hit
+    colored = cv2.applyColorMap((levels * 255).astype(np.uint8), cv2.COLORMAP_INFERNO)
+    size = (board.shape[1], board.shape[0])
+    colored = cv2.resize(colored, size, interpolation=cv2.INTER_NEAREST)
+    hit = cv2.resize(hit.astype(np.uint8), size, interpolation=cv2.INTER_NEAREST).astype(bool)
+    image = board.copy()
+    image[hit] = cv2.addWeighted(board, 1 - HEATMAP_OPACITY, colored, HEATMAP_OPACITY, 0)[hit]
+    return image
+
+
+def render_heatmap(heatmap, board):
+    ''' The heatmap (colored, log scale) over the drawn board image (BGR), empty bins leave the board visible '''
+    if not heatmap.any():
+        return board.copy()
+    return _overlay(np.log1p(heatmap) / np.log1p(heatmap.max()), heatmap > 0, board)
+
+
+def render_error_map(error_map, board):
+    ''' A camera error map (misscore rate 0..1, linear) over the drawn board, bins without throws (nan) left out '''
+    hit = ~np.isnan(error_map)
+    return _overlay(np.where(hit, error_map, 0.0), hit, board)
+
+
+class Analytics:
+    """ ThrowStats per player and per board, fed with the score events of the boards (any thread) """
+
+    def __init__(self, constants, **stats_options):
+        self.constants = constants
+        self.stats_options = stats_options
+        self._lock = threading.Lock()
+        self.groups = {}  # ('player' | 'board', name) -> ThrowStats
+
+    def group(self, kind, name):
+        stats = self.groups.get((kind, name))
+        if stats is None:
+            stats = self.groups[(kind, name)] = ThrowStats(self.constants, **self.stats_options)
+        return stats
+
+    def add_event(self, event):
+        ''' A dart_detected event (event_bus.ScoreEvent) '''
+        if event.board_x is None:
+            return
+        with self._lock:
+            keys = [('board', event.board_id)] + ([('player', event.player)] if event.player else [])
+            for kind, name in keys:
+                self.group(kind, name).add(event.board_x, event.board_y, event.score, event.sector, event.ring,
+                                           event.camera_scores)
+
+    def correct_event(self, event):
+        ''' A score_corrected event (DartBoard.correct_score) '''
+        if event.board_x is None:
+            return
+        right = (event.score, event.sector, event.ring)
+        with self._lock:
+            keys = [('board', event.board_id)] + ([('player', event.player)] if event.player else [])
+            for kind, name in keys:
+                self.group(kind, name).correct(event.board_x, event.board_y, event.info['final'],
+                                               event.info['previous'], right, event.camera_scores)
+
+    def load(self, throw_log, **filters):
+        ''' Adds the history of a throw log (throw_log.ThrowLog), vectorized per group '''
+        names = ('board_x', 'board_y', 'score', 'sector', 'ring', 'score_r', 'score_l', 'score_c', 'corrected_score',
+                 'corrected_sector', 'corrected_ring')
+        for kind in ('board', 'player'):
+            for name in throw_log.distinct(kind, **filters):
+                columns = throw_log.columns(names, **{**filters, kind: name})
+                placed = ~np.isnan(columns['board_x'])
+                if not placed.any():
+                    continue
+                columns = {column: values[placed] for column, values in columns.items()}
+                # the segments of the corrected throws are counted as corrected
+                corrected = ~np.isnan(columns['corrected_score'])
+                right = np.where(corrected, columns['corrected_score'], columns['score'])
+                sectors = np.where(corrected, columns['corrected_sector'], columns['sector'])
+                rings = np.where(corrected, columns['corrected_ring'], columns['ring'])
+                with self._lock:
+                    self.group(kind, name).add_many(
+                        columns['board_x'], columns['board_y'], columns['score'], sectors, rings,
+                        np.stack([columns['score_r'], columns['score_l'], columns['score_c']], 1), right)
+
+    def summary(self, kind, name):
+        with self._lock:
+            stats = self.groups.get((kind, name))
+            return None if stats is None else stats.summary()
+
+    def heatmap(self, kind, name):
+        with self._lock:
+            stats = self.groups.get((kind, name))
+            return None if stats is None else stats.heatmap.copy()
+
+    def camera_error_maps(self, kind, name):
+        with self._lock:
+            stats = self.groups.get((kind, name))
+            return None if stats is None else stats.camera_error_maps()
+
+    def camera_errors(self, kind, name):
+        with self._lock:
+            stats = self.groups.get((kind, name))
+            if stats is None:
+                return None
+            return {'bin_px': stats.error_map_bin_px, 'bins': stats.camera_error_bins()}
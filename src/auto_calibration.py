@@ -0,0 +1,259 @@
+"""
+auto_calibration.py
+
+Function:
+This file calibrates a camera without clicking: it finds the board in the camera image and solves the perspective
+matrix (drawn board -> camera image, like Calibration.calibrate) from many points instead of 4.
+
+    1. The red and green segments of the double and triple rings are found by color (HSV).
+    2. An ellipse is fitted to the outside of the double ring, which gives a first (affine) matrix.
+    3. With the current matrix, the two rings are walked around and every red/green change is a sector wire
+       (20 per ring, known angle). Along the middle of every sector, the 4 edges of the rings are found (known
+       radius). That is up to 120 board point <-> camera point pairs.
+    4. cv2.findHomography with RANSAC solves the matrix from these pairs, and steps 3 and 4 are repeated with the
+       new matrix.
+The result has the reprojection error of the pairs, in camera pixels and in mm on the board.
+
+The sector wires only tell which sector is which up to the red/green pattern (every 2 sectors), so the first matrix
+has to be less than a sector (18 degrees) off: it puts the top of the drawn board (the 20|1 wire) near up_point,
+the projection of the drawn top with the current matrix of the camera, or the top of the ellipse when there is none.
+"""
+import math
+import time
+from dataclasses import dataclass
+
+from board_layout import NUM_SECTORS, SECTOR_ANGLE, get_layout
+from cv_context import lazy_import
+
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+
+NONE, RED, GREEN = 0, 1, 2
+# hue ranges (opencv hue is 0-180)
+RED_HUES = ((0, 10), (170, 180))
+GREEN_HUES = ((35, 90),)
+
+ANGLE_SAMPLES = 1440   # samples around a ring (0.25 degree)
+RADIUS_STEP_MM = 0.25  # radial sampling step
+EDGE_SEARCH_MM = 4.0   # how far from the expected radius a ring edge may be
+
+
+@dataclass
+class CalibrationResult:
+    matrix: object         # drawn board -> camera image (3x3)
+    error_px: float        # RMS reprojection error of the inliers, camera pixels
+    error_mm: float        # the same error measured on the board
+    inliers: int
+    pairs: int
+    seconds: float
+
+    def summary(self):
+        return (f"error {self.error_px:.2f} px / {self.error_mm:.2f} mm, {self.inliers}/{self.pairs} points, "
+                f"{self.seconds:.2f} s")
+
+
+def ring_colors(image, constants):
+    ''' NONE/RED/GREEN per pixel '''
+    hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+    hue = hsv[:, :, 0]
+    colored = (hsv[:, :, 1] >= constants.AUTO_CAL_MIN_SATURATION) & (hsv[:, :, 2] >= constants.AUTO_CAL_MIN_VALUE)
+    classes = np.zeros(hue.shape, np.uint8)
+    for color, hue_ranges in ((RED, RED_HUES), (GREEN, GREEN_HUES)):
+        in_range = np.zeros(hue.shape, bool)
+        for low, high in hue_ranges:
+            in_range |= (hue >= low) & (hue < high)
+        classes[colored & in_range] = color
+    return classes
+
+
+def fit_board_ellipse(classes):
+    ''' cv2.fitEllipse of the outside of the double ring (the biggest colored blob), None when there is none '''
+    mask = cv2.morphologyEx((classes > 0).astype(np.uint8), cv2.MORPH_CLOSE, np.ones((5, 5), np.uint8))
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
+    if not contours:
+        return None
+    contour = max(contours, key=cv2.contourArea)
+    if len(contour) < 20 or cv2.contourArea(contour) < 0.01 * mask.size:
+        return None
+    return cv2.fitEllipse(contour)
+
+
+def ellipse_matrix(ellipse, constants, up_point=None):
+    ''' affine matrix drawn board -> camera that puts the double ring on the ellipse, its top near up_point '''
+    (cx, cy), (width, height), angle = ellipse
+    a, b = width / 2, height / 2
+    alpha = math.radians(angle)
+    cos_a, sin_a = math.cos(alpha), math.sin(alpha)
+
+    # ellipse point of parameter t: c + R(alpha) (a cos t, b sin t)
+    if up_point is None:
+        t_up = math.atan2(-b * cos_a, -a * sin_a)  # the lowest y
+    else:
+        dx, dy = up_point[0] - cx, up_point[1] - cy
+        t_up = math.atan2((-dx * sin_a + dy * cos_a) / b, (dx * cos_a + dy * sin_a) / a)
+    # the drawn top is at the angle -90 degrees
+    t0 = t_up + math.pi / 2
+    radius = constants.DOUBLE_RING_OUTER_RADIUS_MM * constants.PIXELS_PER_MM
+
+    to_unit = np.array([[1 / radius, 0, -constants.center[0] / radius],
+                        [0, 1 / radius, -constants.center[1] / radius],
+                        [0, 0, 1]])
+    rotate = np.array([[math.cos(t0), -math.sin(t0), 0], [math.sin(t0), math.cos(t0), 0], [0, 0, 1]])
+    to_ellipse = np.array([[a * cos_a, -b * sin_a, cx], [a * sin_a, b * cos_a, cy], [0, 0, 1]])
+    return to_ellipse @ rotate @ to_unit
+
+
+def project(matrix, points):
+    return cv2.perspectiveTransform(np.asarray(points, np.float64).reshape(-1, 1, 2), matrix).reshape(-1, 2)
+
+
+def board_points(constants, radii, angles):
+    center = np.asarray(constants.center, np.float64)
+    return center + np.stack([radii * np.cos(angles), radii * np.sin(angles)], axis=-1)
+
+
+def sample(classes, image_points):
+    ''' class at each image point, NONE outside the image '''
+    x = np.round(image_points[:, 0]).astype(np.intp)
+    y = np.round(image_points[:, 1]).astype(np.intp)
+    rows, cols = classes.shape
+    inside = (x >= 0) & (x < cols) & (y >= 0) & (y < rows)
+    values = np.zeros(len(image_points), np.uint8)
+    values[inside] = classes[y[inside], x[inside]]
+    return values
+
+
+def wire_pairs(classes, matrix, constants):
+    ''' (board points, camera points) of the sector wires, found as red/green changes around both rings '''
+    layout = get_layout(constants)
+    red_parity = layout.sector_order.index(constants.AUTO_CAL_RED_SECTOR) % 2
+    pixels_per_mm = constants.PIXELS_PER_MM
+    ring_radii = [(constants.TRIPLE_RING_INNER_RADIUS_MM + constants.TRIPLE_RING_OUTER_RADIUS_MM) / 2,
+                  (constants.DOUBLE_RING_INNER_RADIUS_MM + constants.DOUBLE_RING_OUTER_RADIUS_MM) / 2]
+    angles = layout.rotation + np.arange(ANGLE_SAMPLES) * (2 * math.pi / ANGLE_SAMPLES)
+    max_gap = ANGLE_SAMPLES // (NUM_SECTORS * 4)  # the wire between two colors, at most a quarter of a sector
+
+    board, camera = [], []
+    for radius_mm in ring_radii:
+        radius = radius_mm * pixels_per_mm
+        image_points = project(matrix, board_points(constants, np.full(ANGLE_SAMPLES, radius), angles))
+        values = sample(classes, image_points)
+        colored = np.flatnonzero(values)
+        if len(colored) < 2:
+            continue
+        # consecutive colored samples (around the ring) that are not the same color
+        following = np.roll(colored, -1)
+        gaps = (following - colored) % ANGLE_SAMPLES
+        changes = (values[colored] != values[following]) & (gaps <= max_gap)
+        for before, after, gap in zip(colored[changes], following[changes], gaps[changes]):
+            position = (before + gap / 2) % ANGLE_SAMPLES
+            angle = layout.rotation + position * 2 * math.pi / ANGLE_SAMPLES
+            # the sector after the wire (clockwise) has the color of `after`: its index parity is known, so the
+            # wire is the nearest one with that parity
+            parity = red_parity if values[after] == RED else 1 - red_parity
+            steps = (angle - layout.rotation) / SECTOR_ANGLE - parity
+            index = (2 * round(steps / 2) + parity) % NUM_SECTORS
+            board.append(board_points(constants, radius, layout.sector_start_angle(index)))
+            camera.append(project(matrix, board_points(constants, radius, angle))[0])
+    return board, camera
+
+
+def edge_pairs(classes, matrix, constants):
+    ''' (board points, camera points) of the inside and outside edges of both rings, in the middle of each sector '''
+    layout = get_layout(constants)
+    pixels_per_mm = constants.PIXELS_PER_MM
+    # (radius, colored inside) of the 4 edges
+    edges = [(constants.TRIPLE_RING_INNER_RADIUS_MM, False), (constants.TRIPLE_RING_OUTER_RADIUS_MM, True),
+             (constants.DOUBLE_RING_INNER_RADIUS_MM, False), (constants.DOUBLE_RING_OUTER_RADIUS_MM, True)]
+    radii_mm = np.arange(constants.TRIPLE_RING_INNER_RADIUS_MM - EDGE_SEARCH_MM,
+                         constants.DOUBLE_RING_OUTER_RADIUS_MM + EDGE_SEARCH_MM, RADIUS_STEP_MM)
+    middles = (radii_mm[:-1] + radii_mm[1:]) / 2
+
+    board, camera = [], []
+    for index in range(NUM_SECTORS):
+        angle = layout.sector_start_angle(index + 0.5)
+        image_points = project(matrix, board_points(constants, radii_mm * pixels_per_mm, np.full(len(radii_mm), angle)))
+        colored = sample(classes, image_points) > 0
+        changes = np.flatnonzero(colored[:-1] != colored[1:])
+        for radius_mm, colored_inside in edges:
+            candidates = changes[colored[changes] == colored_inside]
+            if len(candidates) == 0:
+                continue
+            nearest = candidates[np.argmin(np.abs(middles[candidates] - radius_mm))]
+            if abs(middles[nearest] - radius_mm) > EDGE_SEARCH_MM:
+                continue
+            board.append(board_points(constants, radius_mm * pixels_per_mm, angle))
+            camera.append(project(matrix, board_points(constants, middles[nearest] * pixels_per_mm, angle))[0])
+    return board, camera
+
+
+def reprojection_errors(matrix, board, camera, constants):
+    ''' per pair: distance in camera pixels, and in mm on the board '''
+    error_px = np.linalg.norm(project(matrix, board) - camera, axis=1)
+    error_mm = np.linalg.norm(project(np.linalg.inv(matrix), camera) - board, axis=1) / constants.PIXELS_PER_MM
+    return error_px, error_mm
+
+
+def matrix_drift(old, new, constants, rings=12, spokes=40):
+    '''
+    How far apart two matrices put the board, over points of the scoring area: (mean, max) in camera pixels, and
+    (mean, max) in mm on the board (where the points of the old matrix really are according to the new one)
+    '''
+    radii = np.linspace(0, constants.DOUBLE_RING_OUTER_RADIUS_MM * constants.PIXELS_PER_MM, rings)
+    angles = np.linspace(0, 2 * math.pi, spokes, endpoint=False)
+    radius_grid, angle_grid = np.meshgrid(radii, angles)
+    board = board_points(constants, radius_grid.ravel(), angle_grid.ravel())
+    camera = project(old, board)
+    drift_px = np.linalg.norm(project(new, board) - camera, axis=1)
+    drift_mm = np.linalg.norm(project(np.linalg.inv(new), camera) - board, axis=1) / constants.PIXELS_PER_MM
+    return float(drift_px.mean()), float(drift_px.max()), float(drift_mm.mean()), float(drift_mm.max())
+
+
+def auto_calibrate(image, constants, up_point=None, iterations=3):
+    '''
+    CalibrationResult for a BGR camera image of the (empty) board, None when the board is not found.
+    up_point: camera point near the top of the drawn board (see the module docstring)
+    '''
+    start = time.perf_counter()
+    classes = ring_colors(image, constants)
+    ellipse = fit_board_ellipse(classes)
+    if ellipse is None:
+        return None
+    matrix = ellipse_matrix(ellipse, constants, up_point)
+
+    board = camera = inliers = None
+    for iteration in range(iterations):
+        board, camera = wire_pairs(classes, matrix, constants)
+        # the first matrix is only affine, the angles along the rings are not good enough for the edges yet
+        if iteration > 0:
+            edge_board, edge_camera = edge_pairs(classes, matrix, constants)
+            board += edge_board
+            camera += edge_camera
+        if len(board) < 8:
+            return None
+        board = np.float64(board)
+        camera = np.float64(camera)
+        solved, mask = cv2.findHomography(board, camera, cv2.RANSAC, constants.AUTO_CAL_RANSAC_THRESHOLD)
+        if solved is None:
+            return None
+        matrix = solved
+        inliers = mask.ravel().astype(bool)
+
+    error_px, error_mm = reprojection_errors(matrix, board[inliers], camera[inliers], constants)
+    return CalibrationResult(
+        matrix=matrix,
+        error_px=float(np.sqrt(np.mean(error_px ** 2))),
+        error_mm=float(np.sqrt(np.mean(error_mm ** 2))),
+        inliers=int(inliers.sum()),
+        pairs=len(board),
+        seconds=time.perf_counter() - start,
+    )
+
+
+def drawn_top(constants):
+    return constants.center[0], constants.center[1] - constants.DOUBLE_RING_OUTER_RADIUS_PX
+
+
+def up_point_from(matrix, constants):
+    ''' up_point for auto_calibrate from the current matrix of the camera '''
+    return tuple(project(matrix, [drawn_top(constants)])[0])
@@ -0,0 +1,137 @@
+"""
+board_assets.py
+
+Function:
+This file keeps the drawn dartboard (utils.draw_dartboard) as a cached asset instead of drawing it for every
+DartBoard_CV. The board is drawn once per set of board constants, in one batch for all the sizes:
+    display:   IMAGE_WIDTH x IMAGE_HEIGHT, for the score popup (saved as .npy, loads without decoding)
+    web:       for the web UI (png)
+    thumbnail: small png (ie: the board list)
+The files are named after a hash of the constants the drawing depends on, so editing the board constants makes
+a new set (and any other config edit reuses the old one). They are kept in config/board_assets/ (not in git).
+"""
+import hashlib
+import os
+import threading
+
+from cv_context import CONFIG_DIR, lazy_import
+
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+
+ASSET_DIR = os.path.join(CONFIG_DIR, "board_assets")
+ASSET_VERSION = 2  # bump when draw_dartboard changes
+# width in pixels, None = the camera image size (IMAGE_WIDTH)
+SIZES = {'display': None, 'web': 480, 'thumbnail': 160}
+
+# constants draw_dartboard uses
+ASSET_CONSTANTS = ('IMAGE_WIDTH', 'IMAGE_HEIGHT', 'DARTBOARD_DIAMETER_MM', 'BULLSEYE_RADIUS_MM', 'OUTER_BULL_RADIUS_MM',
+                   'TRIPLE_RING_INNER_RADIUS_MM', 'TRIPLE_RING_OUTER_RADIUS_MM', 'DOUBLE_RING_INNER_RADIUS_MM',
+                   'DOUBLE_RING_OUTER_RADIUS_MM', 'SECTOR_ORDER', 'BOARD_ROTATION_DEG')
+
+_lock = threading.Lock()
+_images = {}  # (key, size) -> image, so every board with the same constants shares one copy
+_pngs = {}  # (key, size) -> encoded png, only used when the asset files could not be saved
+
+
+def asset_key(constants):
+    values = repr([ASSET_VERSION] + [getattr(constants, name) for name in ASSET_CONSTANTS])
+    return hashlib.sha256(values.encode()).hexdigest()[:16]
+
+
+def asset_path(constants, size, asset_dir=ASSET_DIR):
+    extension = "npy" if size == 'display' else "png"
+    return os.path.join(asset_dir, f"dartboard_{asset_key(constants)}_{size}.{extension}")
+
+
+def _write(path, image):
+    # atomic, another process may be reading the same asset
+    root, extension = os.path.splitext(path)
+    tmp_path = f"{root}.{os.getpid()}.tmp{extension}"
+    if extension == ".npy":
+        np.save(tmp_path, image)
+    else:
+        cv2.imwrite(tmp_path, image)
+    os.replace(tmp_path, path)
+
+
+def _read(path):
+    if not os.path.exists(path):
+        return None
+    try:
+        if path.endswith(".npy"):
+            return np.load(path)
+        return cv2.imread(path, cv2.IMREAD_COLOR)
+    except (OSError, ValueError) as e:
+        print(f"Could not read board asset {path}: {str(e)}")
+        return None
+
+
+def generate_board_assets(constants, asset_dir=ASSET_DIR):
+    ''' Draws the board once and saves every size, returns {size: image} '''
+    from utils import draw_dartboard
+
+    display = draw_dartboard(constants)
+    images = {}
+    for size, width in SIZES.items():
+        if width is None or width == display.shape[1]:
+            images[size] = display
+        else:
+            height = round(display.shape[0] * width / display.shape[1])
+            interpolation = cv2.INTER_AREA if width < display.shape[1] else cv2.INTER_CUBIC
+            images[size] = cv2.resize(display, (width, height), interpolation=interpolation)
+
+    try:
+        os.makedirs(asset_dir, exist_ok=True)
+        for size, image in images.items():
+            _write(asset_path(constants, size, asset_dir), image)
+    except OSError as e:
+        # read-only install: the images are still used from memory
+        print(f"Could not save the board assets: {str(e)}")
+    return images
+
+
+def board_image(constants, size='display', asset_dir=ASSET_DIR):
+    ''' The board image for these constants: from memory, else from disk, else drawn (all sizes at once) '''
+    key = (asset_key(constants), size)
+    image = _images.get(key)
+    if image is not None:
+        return image
+    with _lock:
+        image = _images.get(key)
+        if image is None:
+            image = _read(asset_path(constants, size, asset_dir))
+        if image is None:
+            for other_size, other_image in generate_board_assets(constants, asset_dir).items():
+                _images[(key[0], other_size)] = other_image
+            image = _images[key]
+        # shared by all the boards, nobody should draw on it
+        image.setflags(write=False)
+        _images[key] = image
+    return image
+
+
+def board_image_path(constants, size='web', asset_dir=ASSET_DIR):
+    ''' Path of the asset file (generated if needed), for serving it as is. It may not exist, see board_png '''
+    path = asset_path(constants, size, asset_dir)
+    if not os.path.exists(path):
+        board_image(constants, size, asset_dir)
+    return path
+
+
+def board_png(constants, size='web', asset_dir=ASSET_DIR):
+    ''' The board image encoded as png, for serving it when its asset file could not be saved (read-only install) '''
+    key = (asset_key(constants), size)
+    png = _pngs.get(key)
+    if png is None:
+        _, png = cv2.imencode(".png", board_image(constants, size, asset_dir))
+        png = _pngs.setdefault(key, png.tobytes())
+    return png
+
+
+if __name__ == '__main__':
+    from cv_config import load_config
+
+    constants = load_config()
+    for size, image in generate_board_assets(constants).items():
+        print(f"{size}: {image.shape[1]}x{image.shape[0]} -> {asset_path(constants, size)}")
@@ -0,0 +1,179 @@
+"""
+board_layout.py
+
+Function:
+This file is the model of the dartboard used for scoring: the sector order, the rotation of the sectors and the
+ring radii (in pixels of the drawn board). It classifies arrays of points (board coordinates) in one pass with
+numpy, giving the score, the sector and the ring of every point, for the live scoring (utils.classify_hit) as well
+as for scoring a whole replay at once.
+
+Angles are measured like atan2(dy, dx) in image coordinates (0 = +x, 90 = down). Sector sector_order[0] starts
+at the angle BOARD_ROTATION_DEG and the next ones follow every 18 degrees. With the calibration points on the
+20|1, 6|10, 19|3 and 11|14 intersections the rotation is 0, measure_rotation() gives it from board points that
+are known to be on sector boundaries.
+"""
+import functools
+import math
+from dataclasses import dataclass
+
+from cv_context import lazy_import
+
+np = lazy_import("numpy")
+
+DEFAULT_SECTOR_ORDER = (10, 15, 2, 17, 3, 19, 7, 16, 8, 11, 14, 9, 12, 5, 20, 1, 18, 4, 13, 6)
+NUM_SECTORS = 20
+SECTOR_ANGLE = 2 * math.pi / NUM_SECTORS
+
+# ring ids of classify_points, the names are the ones used everywhere else (LEDs, events)
+RING_NAMES = ('miss', 'inner_bull', 'outer_bull', 'inner_single', 'triple', 'outer_single', 'double')
+MISS, INNER_BULL, OUTER_BULL, INNER_SINGLE, TRIPLE, OUTER_SINGLE, DOUBLE = range(len(RING_NAMES))
+# score multiplier of the sector number per ring id (bulls are fixed scores)
+RING_MULTIPLIERS = (0, 0, 0, 1, 3, 1, 2)
+BULL_SCORES = {INNER_BULL: 50, OUTER_BULL: 25}
+
+
+@dataclass(frozen=True)
+class BoardLayout:
+    center: tuple
+    bullseye_radius: float
+    outer_bull_radius: float
+    triple_inner_radius: float
+    triple_outer_radius: float
+    double_inner_radius: float
+    double_outer_radius: float
+    sector_order: tuple = DEFAULT_SECTOR_ORDER
+    rotation: float = 0.0  # radians
+
+    @classmethod
+    def from_constants(cls, constants):
+        return cls(
+            center=constants.center,
+            bullseye_radius=constants.BULLSEYE_RADIUS_PX,
+            outer_bull_radius=constants.OUTER_BULL_RADIUS_PX,
+            triple_inner_radius=constants.TRIPLE_RING_INNER_RADIUS_PX,
+            triple_outer_radius=constants.TRIPLE_RING_OUTER_RADIUS_PX,
+            double_inner_radius=constants.DOUBLE_RING_INNER_RADIUS_PX,
+            double_outer_radius=constants.DOUBLE_RING_OUTER_RADIUS_PX,
+            sector_order=tuple(constants.SECTOR_ORDER),
+            rotation=math.radians(constants.BOARD_ROTATION_DEG),
+        )
+
+    def sector_indices(self, angles):
+        ''' index in sector_order for angles (radians, any range) '''
+        shifted = np.mod(np.asarray(angles, np.float64) - self.rotation, 2 * math.pi)
+        return np.floor(shifted / SECTOR_ANGLE).astype(np.intp) % NUM_SECTORS
+
+    def ring_ids(self, distances):
+        d = np.asarray(distances, np.float64)
+        # same order of the checks as the original classify_hit
+        conditions = [
+            d <= self.bullseye_radius,
+            d <= self.outer_bull_radius,
+            (self.triple_inner_radius < d) & (d <= self.triple_outer_radius),
+            (self.double_inner_radius < d) & (d <= self.double_outer_radius),
+            d <= self.triple_inner_radius,
+            d <= self.double_outer_radius,
+        ]
+        return np.select(conditions, [INNER_BULL, OUTER_BULL, TRIPLE, DOUBLE, INNER_SINGLE, OUTER_SINGLE], MISS)
+
+    def classify_polar(self, distances, angles):
+        ''' (scores, sectors, ring ids) arrays, sector is 25 for the bulls and 0 for a miss '''
+        ring = self.ring_ids(distances)
+        numbers = np.asarray(self.sector_order, np.intp)[self.sector_indices(angles)]
+        scores = numbers * np.asarray(RING_MULTIPLIERS, np.intp)[ring]
+        sectors = numbers.copy()
+        for ring_id, bull_score in BULL_SCORES.items():
+            is_bull = ring == ring_id
+            scores[is_bull] = bull_score
+            sectors[is_bull] = 25
+        sectors[ring == MISS] = 0
+        return scores, sectors, ring
+
+    def classify_points(self, points):
+        ''' points: (N, 2) board coordinates -> (scores, sectors, ring ids) arrays of length N '''
+        points = np.asarray(points, np.float64).reshape(-1, 2)
+        dx = points[:, 0] - self.center[0]
+        dy = points[:, 1] - self.center[1]
+        return self.classify_polar(np.hypot(dx, dy), np.arctan2(dy, dx))
+
+    def classify_point(self, x, y):
+        ''' (score, sector, ring name) of one point '''
+        scores, sectors, rings = self.classify_points([[x, y]])
+        return int(scores[0]), int(sectors[0]), RING_NAMES[rings[0]]
+
+    def sector_start_angle(self, index):
+        return self.rotation + index * SECTOR_ANGLE
+
+    def sector_center_angle(self, sector):
+        ''' angle (radians) of the middle of a sector number '''
+        return self.sector_start_angle(self.sector_order.index(sector) + 0.5)
+
+    def measure_rotation(self, points, boundaries):
+        '''
+        Rotation (degrees) that puts the given board points on their sector boundaries. boundaries[i] is the index
+        in sector_order of the sector that starts at points[i] (ie: 15 for the 20|1 intersection of the default
+        order). Uses the circular mean, so the points can be all around the board
+        '''
+        points = np.asarray(points, np.float64).reshape(-1, 2)
+        observed = np.arctan2(points[:, 1] - self.center[1], points[:, 0] - self.center[0])
+        offsets = observed - np.asarray(boundaries, np.float64) * SECTOR_ANGLE
+        return math.degrees(math.atan2(np.sin(offsets).mean(), np.cos(offsets).mean()))
+
+    def ring_radii(self, ring):
+        ''' (inner, outer) radius of a ring id '''
+        return {
+            INNER_BULL: (0.0, self.bullseye_radius),
+            OUTER_BULL: (self.bullseye_radius, self.outer_bull_radius),
+            INNER_SINGLE: (self.outer_bull_radius, self.triple_inner_radius),
+            TRIPLE: (self.triple_inner_radius, self.triple_outer_radius),
+            OUTER_SINGLE: (self.triple_outer_radius, self.double_inner_radius),
+            DOUBLE: (self.double_inner_radius, self.double_outer_radius),
+            MISS: (self.double_outer_radius, math.inf),
+        }[ring]
+
+    def nearest_in_segment(self, x, y, sector, ring, margin=0.0):
+        '''
+        The point of the segment (sector number, ring id) closest to (x, y) (in polar coordinates, exact enough for
+        points near the segment), at least margin pixels inside its wires. (x, y) itself when it is inside already
+        '''
+        if self.classify_point(x, y)[1:] == (sector, RING_NAMES[ring]):
+            return x, y
+        dx, dy = x - self.center[0], y - self.center[1]
+        distance, angle = math.hypot(dx, dy), math.atan2(dy, dx)
+        inner, outer = self.ring_radii(ring)
+        if inner + margin <= outer - margin:
+            inner, outer = inner + margin, outer - margin
+        else:
+            inner = outer = (inner + outer) / 2
+        radius = min(max(distance, inner), outer)
+        if ring not in (INNER_BULL, OUTER_BULL, MISS):
+            middle = self.sector_center_angle(sector)
+            half = SECTOR_ANGLE / 2 - min(margin / max(radius, 1.0), SECTOR_ANGLE / 4)
+            offset = (angle - middle + math.pi) % (2 * math.pi) - math.pi
+            angle = middle + min(max(offset, -half), half)
+        return self.center[0] + radius * math.cos(angle), self.center[1] + radius * math.sin(angle)
+
+
+def segment_score(sector, ring):
+    ''' score of a segment (sector number, ring id) '''
+    if ring in BULL_SCORES:
+        return BULL_SCORES[ring]
+    return sector * RING_MULTIPLIERS[ring]
+
+
+def valid_segment(sector, ring):
+    ''' whether (sector number, ring name) is a segment of the board: 25 for the bulls, 0 for a miss, else 1-20 '''
+    if ring not in RING_NAMES or isinstance(sector, bool) or not isinstance(sector, int):
+        return False
+    ring = RING_NAMES.index(ring)
+    if ring in BULL_SCORES:
+        return sector == 25
+    if ring == MISS:
+        return sector == 0
+    return 1 <= sector <= NUM_SECTORS
+
+
+@functools.lru_cache(maxsize=8)
+def get_layout(constants):
+    ''' the layout of a config (CVConfig is frozen, so it can be the cache key) '''
+    return BoardLayout.from_constants(constants)
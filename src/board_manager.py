@@ -0,0 +1,228 @@
+"""
+board_manager.py
+
+Function:
+This file runs several dartboards in one process. Each board (from config/boards.yaml) gets its own camera group,
+its own perspective matrices (matrix_dir) and its own DartBoard. Instead of one thread per board sleeping in
+run_loop, a small pool of worker threads (one per cpu core by default) steps the boards: DartBoard.step() does
+one iteration and says when it wants to run again, and the board that is due the earliest is stepped next.
+A board is only ever stepped by one worker at a time, and a slow board can not starve the others.
+
+Per board, the step latency (how long a step took) and the lateness (how long after it was due it started) are
+kept, to measure how the boards behave when they compete for the cpu.
+"""
+import collections
+import heapq
+import itertools
+import os
+import threading
+import time
+
+from capture import open_cameras
+from cv_context import CONFIG_DIR, PROJECT_ROOT, CVContext, lazy_import
+from darts import DartBoard
+from LEDs import LEDs
+from preview import PreviewHub
+from throw_log import ThrowLog
+
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+yaml = lazy_import("yaml")
+
+DEFAULT_BOARDS_PATH = os.path.join(CONFIG_DIR, "boards.yaml")
+
+
+def load_boards_config(path=DEFAULT_BOARDS_PATH):
+    with open(path, "r") as file:
+        return yaml.safe_load(file)
+
+
+class BoardPublisher:
+    """ Publisher for one board, hands its events to the manager's callback with the board name """
+
+    def __init__(self, name, on_event):
+        self.name = name
+        self.on_event = on_event
+
+    def publish(self, event):
+        event.board_id = self.name
+        self.on_event(self.name, event)
+        return event
+
+
+class BoardStats:
+
+    def __init__(self, window=500):
+        self.steps = 0
+        self.step_times = collections.deque(maxlen=window)
+        self.lateness = collections.deque(maxlen=window)
+        self.event_latency = collections.deque(maxlen=window)  # dart detected -> event handed to the app
+
+    def add(self, step_time, lateness):
+        self.steps += 1
+        self.step_times.append(step_time)
+        self.lateness.append(lateness)
+
+    def summary(self):
+        if not self.step_times:
+            return {'steps': self.steps}
+        step_ms = np.array(self.step_times) * 1000
+        late_ms = np.array(self.lateness) * 1000
+        summary = {
+            'steps': self.steps,
+            'step_ms_mean': float(step_ms.mean()),
+            'step_ms_p95': float(np.percentile(step_ms, 95)),
+            'late_ms_mean': float(late_ms.mean()),
+            'late_ms_p95': float(np.percentile(late_ms, 95)),
+        }
+        if self.event_latency:
+            summary['event_ms_mean'] = float(np.mean(self.event_latency) * 1000)
+        return summary
+
+
+class BoardManager:
+
+    def __init__(self, boards_config, on_event=None, workers=None, preview=False):
+        self.boards_config = boards_config
+        self.on_event = on_event
+        # one PreviewHub per board (camera feeds for the web app), encoding only while someone watches
+        self.preview = preview
+        self.previews = {}
+        # every board logs its throws to the same file (the rows have the board name)
+        throw_log_path = boards_config.get('throw_log')
+        self.throw_log = ThrowLog(os.path.join(PROJECT_ROOT, throw_log_path)) if throw_log_path else None
+        self.num_workers = workers or boards_config.get('workers') or os.cpu_count() or 1
+        self.boards = {}
+        self.cameras = {}
+        self.stats = {}
+        self._heap = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._workers = []
+        self._running = False
+
+    def open_board(self, board_config):
+        name = board_config['name']
+        cameras = open_cameras(board_config['cameras'])
+        if cameras is None:
+            print(f"Board {name}: failed to open one or more cameras {board_config['cameras']}")
+            return None
+
+        matrix_dir = os.path.join(PROJECT_ROOT, board_config.get('matrix_dir', '.'))
+        context = CVContext(config_path=board_config.get('config_path'), matrix_dir=matrix_dir)
+        # only the board that is wired to the led strip drives it, the others get a mock strip
+        leds = LEDs(use_mock=not board_config.get('leds', False))
+        preview = PreviewHub() if self.preview else None
+        board = DartBoard(*cameras, publisher=BoardPublisher(name, self._publish), show_display=False,
+                          context=context, leds=leds, name=name, preview=preview, throw_log=self.throw_log)
+        if not board.start():
+            print(f"Board {name}: cv initialization failed")
+            board.close()
+            for cam in cameras:
+                cam.release()
+            if preview is not None:
+                preview.close()
+            return None
+
+        self.cameras[name] = cameras
+        if preview is not None:
+            self.previews[name] = preview
+        return board
+
+    def start(self):
+        # the boards run in parallel already, so keep opencv from starting its own threads on every core as well
+        cv2.setNumThreads(1)
+        if self.throw_log is not None:
+            self.throw_log.start()
+        for board_config in self.boards_config['boards']:
+            board = self.open_board(board_config)
+            if board is not None:
+                self.boards[board.name] = board
+                self.stats[board.name] = BoardStats()
+                self._schedule(board, time.monotonic())
+        print(f"Running {len(self.boards)} board(s) on {self.num_workers} worker thread(s)")
+
+        self._running = True
+        for i in range(self.num_workers):
+            worker = threading.Thread(target=self._work, name=f"board-worker-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        return len(self.boards)
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+        for name, board in self.boards.items():
+            board.close()
+            for cam in self.cameras[name]:
+                cam.release()
+        for preview in self.previews.values():
+            preview.close()
+        if self.throw_log is not None:
+            self.throw_log.close()
+
+    def _publish(self, name, event):
+        self.stats[name].event_latency.append(time.time() - event.detected_at)
+        if self.on_event is not None:
+            self.on_event(name, event)
+
+    def _schedule(self, board, due):
+        with self._condition:
+            heapq.heappush(self._heap, (due, next(self._counter), board))
+            self._condition.notify()
+
+    def _next_board(self):
+        ''' Waits for the board that is due first and takes it off the heap (so no other worker can step it) '''
+        with self._condition:
+            while self._running:
+                if not self._heap:
+                    self._condition.wait()
+                    continue
+                due, _, board = self._heap[0]
+                wait = due - time.monotonic()
+                if wait > 0:
+                    self._condition.wait(wait)
+                    continue
+                heapq.heappop(self._heap)
+                return due, board
+        return None, None
+
+    def _work(self):
+        while True:
+            due, board = self._next_board()
+            if board is None:
+                return
+            start = time.monotonic()
+            try:
+                delay = board.step()
+            except Exception as e:
+                print(f"Board {board.name}: step failed: {str(e)}")
+                delay = 1.0
+            end = time.monotonic()
+            self.stats[board.name].add(end - start, start - due)
+            if delay is None:
+                print(f"Board {board.name} stopped")
+                continue
+            self._schedule(board, end + delay)
+
+    def stats_summary(self):
+        summary = {}
+        for name, stats in self.stats.items():
+            summary[name] = stats.summary()
+            # idle/active mode and cpu savings of the frame scheduler
+            summary[name]['scheduler'] = self.boards[name].metrics()
+            # calibration drift checks
+            summary[name]['drift'] = self.boards[name].drift_monitor.metrics()
+            # offsets learned from the score corrections
+            summary[name]['camera_bias'] = self.boards[name].camera_bias.metrics()
+            # effective fps and frame age per camera
+            summary[name]['cameras'] = [cam.stats() for cam in self.cameras[name]]
+            if name in self.previews:
+                summary[name]['preview'] = self.previews[name].stats()
+        if self.throw_log is not None:
+            summary['throw_log'] = self.throw_log.stats()
+        return summary
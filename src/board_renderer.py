@@ -0,0 +1,67 @@
+"""
+board_renderer.py
+
+Function:
+This file draws the scores on the dartboard image for the GUI popup. The board itself (draw_dartboard) never
+changes, so it is kept as the base image and the frame shown is only touched where something changes: the
+rectangles of the markers/text drawn last time are copied back from the base, then the current visit's darts and
+the score are drawn again. When nothing changed since the last render, nothing is drawn (and nothing is shown).
+"""
+from cv_context import lazy_import
+
+cv2 = lazy_import("cv2")
+
+MARKER_RADIUS = 5
+MARKER_COLOR = (0, 0, 255)
+TEXT_COLOR = (0, 255, 0)
+TEXT_ORIGIN = (50, 50)
+
+
+class BoardRenderer:
+
+    def __init__(self, base_image):
+        self.base = base_image
+        self.frame = base_image.copy()
+        self.dirty = []    # (x0, y0, x1, y1) drawn over the base in the current frame
+        self.state = None  # what the current frame shows
+        self.renders = 0
+
+    def restore(self):
+        for x0, y0, x1, y1 in self.dirty:
+            self.frame[y0:y1, x0:x1] = self.base[y0:y1, x0:x1]
+        self.dirty = []
+
+    def mark(self, x0, y0, x1, y1):
+        rows, cols = self.frame.shape[:2]
+        x0, y0, x1, y1 = max(x0, 0), max(y0, 0), min(x1, cols), min(y1, rows)
+        if x0 < x1 and y0 < y1:
+            self.dirty.append((x0, y0, x1, y1))
+
+    def draw_text(self, text):
+        (width, height), baseline = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, 1, 2)
+        x, y = TEXT_ORIGIN
+        cv2.putText(self.frame, text, TEXT_ORIGIN, cv2.FONT_HERSHEY_SIMPLEX, 1, TEXT_COLOR, 2, cv2.LINE_AA)
+        self.mark(x - 2, y - height - 2, x + width + 2, y + baseline + 2)
+
+    def draw_marker(self, x, y):
+        cv2.circle(self.frame, (x, y), MARKER_RADIUS, MARKER_COLOR, -1)
+        self.mark(x - MARKER_RADIUS - 1, y - MARKER_RADIUS - 1, x + MARKER_RADIUS + 2, y + MARKER_RADIUS + 2)
+
+    def update(self, hits, majority_score=None):
+        '''
+        hits: (x, y) board coordinates of the darts of the current visit. Returns True if the frame changed
+        (and has to be shown again), False if it already shows this
+        '''
+        hits = tuple((int(x), int(y)) for x, y in hits)
+        state = (hits, majority_score)
+        if state == self.state:
+            return False
+
+        self.restore()
+        if majority_score is not None:
+            self.draw_text(f"Majority Score: {majority_score}")
+        for x, y in hits:
+            self.draw_marker(x, y)
+        self.state = state
+        self.renders += 1
+        return True
@@ -1,31 +1,53 @@
-import tkinter as tk
-from tkinter import messagebox
-import cv2
-import numpy as np
-import math
-import time
-from shapely.geometry import Point, LineString, Polygon
-from typing import List
 import os
-import sys
-import yaml
+
+from auto_calibration import auto_calibrate, up_point_from
+from board_layout import get_layout
+from camera_bias import reset_camera_bias
+from cv_context import get_context, lazy_import
+
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+
+# optional 5th point: anywhere on the wire between the 20 and the 1, used to measure BOARD_ROTATION_DEG
+ROTATION_POINT_SECTOR = 1  # the sector that starts (clockwise) at that wire
+
+def board_rotation(matrix, point, constants):
+    ''' BOARD_ROTATION_DEG measured from a camera point on the 20|1 wire, with the matrix of that camera '''
+    layout = get_layout(constants)
+    board_point = cv2.perspectiveTransform(np.float32([[point]]), np.linalg.inv(matrix))[0]
+    return layout.measure_rotation(board_point, [layout.sector_order.index(ROTATION_POINT_SECTOR)])
+
+def save_auto_calibration(context, camera_index, frame):
+    '''
+    Calibrates a camera from an image of the board (auto_calibration.py) and saves the matrix when the error is below
+    AUTO_CAL_MAX_ERROR_MM. Returns (CalibrationResult or None when the board was not found, saved)
+    '''
+    constants = context.constants
+    path = context.matrix_path(camera_index)
+    # the current matrix tells which sector is which, when there is one
+    up_point = up_point_from(np.load(path)['matrix'], constants) if os.path.exists(path) else None
+    result = auto_calibrate(frame, constants, up_point)
+    if result is None or result.error_mm > constants.AUTO_CAL_MAX_ERROR_MM:
+        return result, False
+    np.savez(path, matrix=result.matrix)
+    reset_camera_bias(context, camera_index)
+    return result, True
 
 class Calibration:
 
-    def __init__(self):
+    def __init__(self, context=None):
+        self.context = context or get_context()
         self.constants = self.load_constants()
         self.drawn_points = None
         self.perspective_matrices = []
 
     def load_constants(self):
-        # load yaml file with constagitnt paramters
-        with open("config/cv_constants.yaml", "r") as file:
-            constants = yaml.safe_load(file)
-        return constants
+        # constants are loaded (once) by the shared context
+        return self.context.constants
 
     def select_points_event(self,event, x, y, flags, param):
         frame, selected_points, camera_index = param
-        if event == cv2.EVENT_LBUTTONDOWN and len(selected_points) < 4:
+        if event == cv2.EVENT_LBUTTONDOWN and len(selected_points) < 5:
             selected_points.append([x, y])
             cv2.circle(frame, (x, y), 5, (0, 255, 0), -1)
             cv2.imshow(f"Camera {camera_index} - Select 4 Points", frame)
@@ -59,55 +81,101 @@ class Calibration:
             if cv2.waitKey(1) & 0xFF == 27:  # Press 'Esc' to exit early if needed
                 break
 
+        if len(selected_points) == 4:
+            print("Optional: select a point on the wire between the 20 and the 1 (any key to skip)")
+            while len(selected_points) < 5:
+                cv2.imshow(window_name, frame.copy())
+                if cv2.waitKey(1) & 0xFF != 255:
+                    break
+
         # Clean up resources
         cv2.destroyAllWindows()
         cap.release()
 
-        # Return selected points if we have 4
+        # Return selected points if we have 4 (5 with the rotation point)
         if len(selected_points) >= 4:
             return np.float32(selected_points)
             
-    def calibrate(self):
+    def calibrate(self, camera_indexes=None):
+        ''' The 4 points calibration of the given cameras (all of them by default), the others keep their matrix '''
+        if camera_indexes is None:
+            camera_indexes = range(self.constants.NUM_CAMERAS)
         print("Please select 4 points on each camera feed for calibration.")
         
-        center = (self.constants['IMAGE_WIDTH'] // 2, self.constants['IMAGE_HEIGHT'] // 2)
+        center = (self.constants.IMAGE_WIDTH // 2, self.constants.IMAGE_HEIGHT // 2)
         # Define the drawn_points variable
         self.drawn_points = np.float32([
-            [center[0], center[1] - self.constants['DOUBLE_RING_OUTER_RADIUS_PX']],
-            [center[0] + self.constants['DOUBLE_RING_OUTER_RADIUS_PX'], center[1]],
-            [center[0], center[1] + self.constants['DOUBLE_RING_OUTER_RADIUS_PX']],
-            [center[0] - self.constants['DOUBLE_RING_OUTER_RADIUS_PX'], center[1]],
+            [center[0], center[1] - self.constants.DOUBLE_RING_OUTER_RADIUS_PX],
+            [center[0] + self.constants.DOUBLE_RING_OUTER_RADIUS_PX, center[1]],
+            [center[0], center[1] + self.constants.DOUBLE_RING_OUTER_RADIUS_PX],
+            [center[0] - self.constants.DOUBLE_RING_OUTER_RADIUS_PX, center[1]],
         ])
         
-        for camera_index in range(self.constants['NUM_CAMERAS']):
-            live_feed_points = self.calibrate_camera(self.constants['CAMERA_ID'][camera_index])
+        rotations = []
+        for camera_index in camera_indexes:
+            live_feed_points = self.calibrate_camera(self.constants.CAMERA_ID[camera_index])
             if live_feed_points is not None:
-                M = cv2.getPerspectiveTransform(self.drawn_points, live_feed_points)
+                M = cv2.getPerspectiveTransform(self.drawn_points, live_feed_points[:4])
+                if len(live_feed_points) > 4:
+                    rotations.append(board_rotation(M, live_feed_points[4], self.constants))
+                    print(f"Camera {camera_index} - board rotation: {rotations[-1]:.2f} degrees")
                 self.perspective_matrices.append(M)
-                np.savez(f'perspective_matrix_camera_{camera_index}.npz', matrix=M)
+                np.savez(self.context.matrix_path(camera_index), matrix=M)
+                reset_camera_bias(self.context, camera_index)
             else:
                 print(f"Calibration Error: Failed to calibrate camera {camera_index}")
                 return
 
+        self.context.reload_perspective_matrices()
         print("Calibration completed successfully.")
+        if rotations:
+            print(f"Set BOARD_ROTATION_DEG: {np.mean(rotations):.2f} in cv_constants_base.yaml "
+                  f"(currently {self.constants.BOARD_ROTATION_DEG})")
+
+    def auto_calibrate(self):
+        ''' Calibrates every camera without clicks, returns the camera indexes that still need the 4 clicks '''
+        failed = []
+        for camera_index in range(self.constants.NUM_CAMERAS):
+            cap = cv2.VideoCapture(self.constants.CAMERA_ID[camera_index])
+            ret, frame = cap.read()
+            cap.release()
+            if not ret:
+                print(f"Calibration Error: Unable to capture frame from camera {camera_index}")
+                failed.append(camera_index)
+                continue
+
+            result, saved = save_auto_calibration(self.context, camera_index, frame)
+            if result is None:
+                print(f"Calibration Error: Board not found by camera {camera_index}")
+            else:
+                print(f"Camera {camera_index} - {result.summary()}{'' if saved else ', not saved'}")
+            if not saved:
+                failed.append(camera_index)
+
+        if not failed:
+            self.context.reload_perspective_matrices()
+        return failed
 
 class Calibration_App:
-    def __init__(self):
+    def __init__(self, context=None):
+        self.context = context or get_context()
         self.constants = self.load_constants()
 
     def load_constants(self):
-        with open("../config/cv_constants.yaml", "r") as file:
-            constants = yaml.safe_load(file)
-        return constants
+        return self.context.constants
 
     def save_perspective_matrix(self, camera_index, points):
-        center = (self.constants['IMAGE_WIDTH'] // 2, self.constants['IMAGE_HEIGHT'] // 2)
+        center = (self.constants.IMAGE_WIDTH // 2, self.constants.IMAGE_HEIGHT // 2)
         drawn_points = np.float32([
-            [center[0], center[1] - self.constants['DOUBLE_RING_OUTER_RADIUS_PX']],
-            [center[0] + self.constants['DOUBLE_RING_OUTER_RADIUS_PX'], center[1]],
-            [center[0], center[1] + self.constants['DOUBLE_RING_OUTER_RADIUS_PX']],
-            [center[0] - self.constants['DOUBLE_RING_OUTER_RADIUS_PX'], center[1]],
+            [center[0], center[1] - self.constants.DOUBLE_RING_OUTER_RADIUS_PX],
+            [center[0] + self.constants.DOUBLE_RING_OUTER_RADIUS_PX, center[1]],
+            [center[0], center[1] + self.constants.DOUBLE_RING_OUTER_RADIUS_PX],
+            [center[0] - self.constants.DOUBLE_RING_OUTER_RADIUS_PX, center[1]],
         ])
         live_feed_points = points
         M = cv2.getPerspectiveTransform(drawn_points, live_feed_points)
-        np.savez(f'../perspective_matrix_camera_{camera_index}.npz', matrix=M)
\ No newline at end of file
+        np.savez(self.context.matrix_path(camera_index), matrix=M)
+        reset_camera_bias(self.context, camera_index)
+
+    def auto_calibrate(self, camera_index, frame):
+        return save_auto_calibration(self.context, camera_index, frame)
\ No newline at end of file
@@ -0,0 +1,105 @@
+"""
+camera_bias.py
+
+Function:
+This file learns from the score corrections made in the app. A camera with a small systematic error (a tip found
+a little too low, a matrix slightly off) keeps putting the darts near a wire on the wrong side of it, and a new
+calibration is the only fix. Instead, every camera has an offset in board space (drawn board pixels) that
+utils.transform_to_board takes off its points, so it is used by all the scoring (classify_hit_from_coordinates,
+calculate_score_from_coordinates, DartBoard_CV.transform_score).
+
+When a throw is corrected, the right segment is known. For every camera that found the dart, its board point
+(with the current offset) is compared with the closest point of the right segment, CAMERA_BIAS_MARGIN_MM inside
+the wires. The offset moves CAMERA_BIAS_RATE of that distance, cameras that had the dart in the right segment do
+not move. So the offsets are fitted online, a correction at a time, and stop moving once the corrected darts land
+in the right segments. The offsets are capped at CAMERA_BIAS_MAX_MM (a bigger error needs a new calibration) and
+kept with the matrices (camera_bias.npz in matrix_dir), a new calibration of a camera resets its offset.
+"""
+import math
+import os
+import threading
+
+from board_layout import RING_NAMES, get_layout
+from cv_context import lazy_import
+from utils import transform_to_board
+
+np = lazy_import("numpy")
+
+
+def save_offsets(path, offsets, corrections):
+    # atomic, like the matrices (drift_monitor.save_matrix)
+    tmp_path = f"{path[:-len('.npz')]}.{os.getpid()}.tmp.npz"
+    np.savez(tmp_path, offsets=offsets, corrections=corrections)
+    os.replace(tmp_path, path)
+
+
+def reset_camera_bias(context, camera_index):
+    ''' After a new calibration of the camera: its offset (if any) no longer applies '''
+    path = context.bias_path()
+    if not os.path.exists(path):
+        return
+    data = np.load(path)
+    offsets, corrections = data['offsets'].copy(), data['corrections'].copy()
+    offsets[camera_index] = 0.0
+    corrections[camera_index] = 0
+    save_offsets(path, offsets, corrections)
+    context.update_camera_offsets(offsets)
+
+
+class CameraBias:
+
+    def __init__(self, context):
+        self.context = context
+        self._lock = threading.Lock()
+        path = context.bias_path()
+        num_cameras = context.constants.NUM_CAMERAS
+        self.corrections = np.load(path)['corrections'] if os.path.exists(path) else np.zeros(num_cameras, np.int64)
+
+    @property
+    def constants(self):
+        return self.context.constants
+
+    def residual(self, camera_index, tip, sector, ring):
+        ''' board space distance (x, y) from the camera's point of the dart to the right segment, with the offset '''
+        constants = self.constants
+        x, y = transform_to_board([tip], camera_index, self.context)[0]
+        target = get_layout(constants).nearest_in_segment(float(x), float(y), sector, RING_NAMES.index(ring),
+                                                          constants.CAMERA_BIAS_MARGIN_MM * constants.PIXELS_PER_MM)
+        return np.array([x - target[0], y - target[1]])
+
+    def learn(self, camera_tips, sector, ring):
+        '''
+        A corrected throw: camera_tips (camera pixels, None for the cameras that did not find the dart) and the
+        right sector/ring. Returns how far (mm) each camera's offset moved, None for the cameras without a tip
+        '''
+        constants = self.constants
+        if constants.CAMERA_BIAS_RATE <= 0:
+            return [None] * len(camera_tips)
+        max_offset = constants.CAMERA_BIAS_MAX_MM * constants.PIXELS_PER_MM
+        with self._lock:
+            offsets = self.context.camera_offsets.copy()
+            moved = []
+            for camera_index, tip in enumerate(camera_tips):
+                if tip is None:
+                    moved.append(None)
+                    continue
+                step = constants.CAMERA_BIAS_RATE * self.residual(camera_index, tip, sector, ring)
+                offset = offsets[camera_index] + step
+                length = math.hypot(*offset)
+                if length > max_offset:
+                    offset *= max_offset / length
+                moved.append(math.hypot(*(offset - offsets[camera_index])) / constants.PIXELS_PER_MM)
+                offsets[camera_index] = offset
+                self.corrections[camera_index] += 1
+            save_offsets(self.context.bias_path(), offsets, self.corrections)
+            # the scoring code uses the new offsets from the next dart on
+            self.context.update_camera_offsets(offsets)
+        return moved
+
+    def metrics(self):
+        offsets = self.context.camera_offsets
+        return {
+            'offsets_mm': [[round(float(value) / self.constants.PIXELS_PER_MM, 2) for value in offset]
+                           for offset in offsets],
+            'corrections': [int(count) for count in self.corrections],
+        }
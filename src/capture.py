@@ -0,0 +1,209 @@
+"""
+capture.py
+
+Function:
+This file opens the cameras with the settings from config/capture.yaml (pixel format, resolution, fps and driver
+buffer size), instead of the driver defaults. Three default (YUYV 640x480) streams do not fit on our USB hub, MJPG
+does. With the default buffer (4 frames on V4L2) read() returns frames that are already old, a buffer size of 1
+makes read() return the latest frame.
+
+The driver does not always grant what was asked, so open_camera reads the settings back and prints what differs.
+Camera keeps the effective fps and the age of the frames it returned (see scripts/get_fps.py).
+
+The cv only needs gray images. With luma on, opencv does not convert the frames to BGR (CAP_PROP_CONVERT_RGB=0)
+and read_gray() takes the luma straight from the raw frame: the Y plane of YUYV, or a gray-only jpeg decode for
+MJPG (see scripts/bench_gray.py).
+"""
+import collections
+import os
+import time
+from dataclasses import dataclass, fields
+
+from cv_context import CONFIG_DIR, lazy_import
+
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+yaml = lazy_import("yaml")
+
+DEFAULT_CAPTURE_PATH = os.path.join(CONFIG_DIR, "capture.yaml")
+
+
+@dataclass
+class CaptureProfile:
+    fourcc: str = "MJPG"
+    width: int = 640
+    height: int = 480
+    fps: int = 30
+    buffer_size: int = 1
+    luma: bool = True
+
+    @classmethod
+    def from_dict(cls, values):
+        names = {f.name for f in fields(cls)}
+        unknown = set(values) - names
+        if unknown:
+            print(f"Warning: unknown capture settings ignored: {sorted(unknown)}")
+        return cls(**{k: v for k, v in values.items() if k in names})
+
+
+def load_capture_profiles(path=DEFAULT_CAPTURE_PATH):
+    ''' {camera_id: CaptureProfile}, the 'default' profile is under None '''
+    with open(path, "r") as file:
+        data = yaml.safe_load(file) or {}
+    default = data.get('default', {})
+    profiles = {None: CaptureProfile.from_dict(default)}
+    for camera_id, overrides in (data.get('cameras') or {}).items():
+        profiles[camera_id] = CaptureProfile.from_dict({**default, **(overrides or {})})
+    return profiles
+
+
+def profile_for(camera_id, profiles=None):
+    if profiles is None:
+        profiles = load_capture_profiles() if os.path.exists(DEFAULT_CAPTURE_PATH) else {None: CaptureProfile()}
+    return profiles.get(camera_id, profiles[None])
+
+
+def decode_fourcc(value):
+    value = int(value)
+    return "".join(chr((value >> 8 * i) & 0xFF) for i in range(4))
+
+
+def apply_profile(cap, profile):
+    ''' Sets the profile on an opened capture and returns what the driver actually granted '''
+    # the format has to be set before the resolution, otherwise V4L2 resets it
+    cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*profile.fourcc))
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, profile.width)
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, profile.height)
+    cap.set(cv2.CAP_PROP_FPS, profile.fps)
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, profile.buffer_size)
+    # raw frames, read_gray() extracts the luma itself
+    cap.set(cv2.CAP_PROP_CONVERT_RGB, 0 if profile.luma else 1)
+    return granted_profile(cap)
+
+
+def granted_profile(cap):
+    return CaptureProfile(
+        fourcc=decode_fourcc(cap.get(cv2.CAP_PROP_FOURCC)),
+        width=int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        height=int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        fps=int(round(cap.get(cv2.CAP_PROP_FPS))),
+        buffer_size=int(cap.get(cv2.CAP_PROP_BUFFERSIZE)),
+        luma=cap.get(cv2.CAP_PROP_CONVERT_RGB) == 0,
+    )
+
+
+def profile_mismatches(requested, granted):
+    return {f.name: (getattr(requested, f.name), getattr(granted, f.name))
+            for f in fields(CaptureProfile) if getattr(requested, f.name) != getattr(granted, f.name)}
+
+
+def to_bgr(frame):
+    ''' BGR image of a frame in any of the formats the capture gives (raw YUYV/MJPG, gray, BGR) '''
+    if frame.ndim == 3 and frame.shape[2] == 3:
+        return frame
+    if frame.ndim == 3 and frame.shape[2] == 2:
+        return cv2.cvtColor(frame, cv2.COLOR_YUV2BGR_YUYV)
+    if frame.ndim == 1 or frame.shape[0] == 1:
+        return cv2.imdecode(frame, cv2.IMREAD_COLOR)
+    return cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+
+
+class Camera:
+    """
+    cv2.VideoCapture with a capture profile. Has the same read()/grab()/isOpened()/release() as the capture,
+    so it can be passed to DartBoard as is. It also keeps the time between frames and the frame age.
+    """
+
+    def __init__(self, camera_id, profile=None, window=120):
+        self.camera_id = camera_id
+        self.profile = profile or profile_for(camera_id)
+        self.cap = cv2.VideoCapture(camera_id)
+        self.granted = None
+        self.read_times = collections.deque(maxlen=window)
+        self.frame_ages = collections.deque(maxlen=window)
+        if self.cap.isOpened():
+            self.granted = apply_profile(self.cap, self.profile)
+            for name, (asked, got) in profile_mismatches(self.profile, self.granted).items():
+                print(f"Camera {camera_id}: asked {name}={asked}, driver granted {got}")
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def get(self, prop):
+        return self.cap.get(prop)
+
+    def set(self, prop, value):
+        return self.cap.set(prop, value)
+
+    def grab(self):
+        return self.cap.grab()
+
+    def read(self):
+        ''' BGR frame, like VideoCapture.read() '''
+        success, frame = self.cap.read()
+        if not success:
+            return False, None
+        self._frame_read()
+        return True, to_bgr(frame)
+
+    def retrieve(self):
+        ''' The last grabbed (or read) frame again, as the driver gives it (raw with luma on, see to_bgr) '''
+        return self.cap.retrieve()
+
+    def read_gray(self, dst=None):
+        ''' Gray frame without going through BGR, written into dst when it has the right size '''
+        success, frame = self.cap.read()
+        if not success:
+            return False, None
+        self._frame_read()
+        return True, self._to_gray(frame, dst)
+
+    @staticmethod
+    def _to_gray(frame, dst=None):
+        if frame.ndim == 3 and frame.shape[2] == 3:
+            # the backend converted anyway (CONVERT_RGB not supported)
+            return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=dst)
+        if frame.ndim == 3 and frame.shape[2] == 2:
+            # raw YUYV: channel 0 is Y
+            return cv2.extractChannel(frame, 0, dst=dst)
+        if frame.ndim == 1 or frame.shape[0] == 1:
+            # raw MJPG: the jpeg bytes, only the luma is decoded
+            return cv2.imdecode(frame, cv2.IMREAD_GRAYSCALE)
+        return frame
+
+    def _frame_read(self):
+        now = time.monotonic()
+        self.read_times.append(now)
+        # V4L2 reports the (monotonic clock) time the driver captured the buffer
+        captured_ms = self.cap.get(cv2.CAP_PROP_POS_MSEC)
+        age = now - captured_ms / 1000
+        if captured_ms > 0 and 0 <= age < 10:
+            self.frame_ages.append(age)
+
+    def release(self):
+        self.cap.release()
+
+    def stats(self):
+        stats = {'camera_id': self.camera_id, 'frames': len(self.read_times)}
+        if len(self.read_times) > 1:
+            span = self.read_times[-1] - self.read_times[0]
+            stats['effective_fps'] = (len(self.read_times) - 1) / span if span > 0 else None
+        if self.frame_ages:
+            ages_ms = np.array(self.frame_ages) * 1000
+            stats['frame_age_ms_mean'] = float(ages_ms.mean())
+            stats['frame_age_ms_p95'] = float(np.percentile(ages_ms, 95))
+        return stats
+
+
+def open_camera(camera_id, profiles=None):
+    return Camera(camera_id, profile_for(camera_id, profiles))
+
+
+def open_cameras(camera_ids, profiles=None):
+    ''' Opens all the cameras, or releases them and returns None if one could not be opened '''
+    cameras = [open_camera(camera_id, profiles) for camera_id in camera_ids]
+    if not all(cam.isOpened() for cam in cameras):
+        for cam in cameras:
+            cam.release()
+        return None
+    return cameras
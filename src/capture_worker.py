@@ -0,0 +1,164 @@
+"""
+capture_worker.py
+
+Function:
+This file keeps cameras open and read by background threads, for the services that show camera images (the web
+calibration page) instead of opening a cv2.VideoCapture and reading one frame for every request. A CaptureWorker
+owns one camera (capture.Camera, with its capture profile) and keeps only the latest frame. Clients take that frame
+or its jpeg (encoded once per frame, by the first client that asks for it, never by the capture thread) without
+ever waiting for the camera, except for the first frame.
+
+CaptureWorkers is the set of workers of a process: acquire() starts the worker of a camera on first use and
+release() stops it when its last user is gone, so several clients can share a camera or use different ones.
+"""
+import threading
+import time
+
+from capture import open_camera
+from cv_context import lazy_import
+
+cv2 = lazy_import("cv2")
+
+JPEG_QUALITY = 80
+RETRY_DELAY = 0.5  # after a failed read
+
+
+class CaptureWorker:
+
+    def __init__(self, camera_id, profiles=None, jpeg_quality=JPEG_QUALITY):
+        self.camera_id = camera_id
+        self.profiles = profiles
+        self.jpeg_quality = jpeg_quality
+        self.camera = None
+        self.error = None
+        self.frames = 0
+        self._condition = threading.Condition()
+        self._frame = None
+        self._seq = 0
+        self._jpeg_lock = threading.Lock()
+        self._jpeg = (0, None)  # (seq, bytes) of the last encoded frame
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._running = True
+            # opening the camera can take a second, so it is done by the thread as well
+            self._thread = threading.Thread(target=self._run, name=f"capture-{self.camera_id}", daemon=True)
+            self._thread.start()
+        return self
+
+    @property
+    def running(self):
+        return self._running
+
+    def stop(self):
+        if self._thread is None:
+            return
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        self.camera = open_camera(self.camera_id, self.profiles)
+        if not self.camera.isOpened():
+            with self._condition:
+                self.error = f"Unable to access camera {self.camera_id}"
+                self._running = False
+                self._condition.notify_all()
+            return
+
+        while self._running:
+            success, frame = self.camera.read()
+            with self._condition:
+                if success:
+                    self._frame = frame
+                    self._seq += 1
+                    self.frames += 1
+                    self.error = None
+                else:
+                    self.error = f"Camera {self.camera_id} failed to return a frame"
+                self._condition.notify_all()
+            if not success:
+                time.sleep(RETRY_DELAY)
+        self.camera.release()
+
+    def latest(self, after_seq=0, timeout=2.0):
+        '''
+        (seq, BGR frame) of a frame newer than after_seq, waiting up to timeout for it. (seq, None) when there is
+        none (see error)
+        '''
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while self._seq <= after_seq and self._running:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            if self._seq <= after_seq:
+                return after_seq, None
+            return self._seq, self._frame
+
+    def snapshot(self, after_seq=0, timeout=2.0):
+        '''
+        Like latest(), (seq, frame, jpeg bytes) of the same frame. Every frame is encoded at most once, by whoever
+        asks for it first
+        '''
+        seq, frame = self.latest(after_seq, timeout)
+        if frame is None:
+            return seq, None, None
+        with self._jpeg_lock:
+            if self._jpeg[0] != seq:
+                success, data = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+                self._jpeg = (seq, data.tobytes() if success else None)
+            return seq, frame, self._jpeg[1]
+
+    def jpeg(self, after_seq=0, timeout=2.0):
+        seq, _, jpeg = self.snapshot(after_seq, timeout)
+        return seq, jpeg
+
+
+class CaptureWorkers:
+
+    def __init__(self, profiles=None):
+        self.profiles = profiles
+        self._lock = threading.Lock()
+        self._workers = {}  # camera id -> (worker, users)
+
+    def acquire(self, camera_id):
+        with self._lock:
+            worker, users = self._workers.get(camera_id, (None, 0))
+            if worker is None:
+                worker = CaptureWorker(camera_id, self.profiles).start()
+            elif not worker.running:
+                # the camera failed to open last time, try again
+                worker.stop()
+                worker.start()
+            self._workers[camera_id] = (worker, users + 1)
+            return worker
+
+    def get(self, camera_id):
+        ''' The running worker of a camera (without becoming one of its users), None when nobody uses it '''
+        with self._lock:
+            return self._workers.get(camera_id, (None, 0))[0]
+
+    def release(self, camera_id):
+        with self._lock:
+            worker, users = self._workers.get(camera_id, (None, 0))
+            if worker is None:
+                return
+            if users > 1:
+                self._workers[camera_id] = (worker, users - 1)
+                return
+            del self._workers[camera_id]
+        # joins the capture thread, outside the lock so the other cameras are not held up
+        worker.stop()
+
+    def stop(self):
+        with self._lock:
+            workers = [worker for worker, _ in self._workers.values()]
+            self._workers.clear()
+        for worker in workers:
+            worker.stop()
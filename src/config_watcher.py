@@ -0,0 +1,73 @@
+"""
+config_watcher.py
+
+Function:
+This file watches config/cv_constants_base.yaml while the scorer is running. When the file is saved, the new
+constants are parsed on the watcher thread (so a slow/broken yaml never stalls the cv loop) and kept as "pending".
+The cv loop picks up the pending config between two iterations and swaps it in with DartBoard_CV.apply_config,
+so thresholds can be tuned during play without killing main.py and warming up the cameras again.
+
+"""
+import os
+import threading
+
+from cv_config import reload_config
+
+
+class ConfigWatcher:
+
+    def __init__(self, config_path, interval=1.0):
+        self.config_path = config_path
+        self.interval = interval
+        self._pending = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._last_stat = self._stat()
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.config_path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def start(self):
+        if self._thread is None:
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._watch, name="config-watcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _watch(self):
+        while not self._stop_event.wait(self.interval):
+            self.check()
+
+    def check(self):
+        ''' Reload the config if the file changed. Returns True when a new config is waiting to be applied '''
+        stat = self._stat()
+        if stat is None or stat == self._last_stat:
+            return False
+        self._last_stat = stat
+        try:
+            config = reload_config(self.config_path)
+        except Exception as e:
+            # keep running with the current constants until the file is fixed
+            print(f"Config reload failed, keeping the current constants: {str(e)}")
+            return False
+        with self._lock:
+            self._pending = config
+        print(f"Config change detected in {self.config_path}")
+        return True
+
+    def take_pending(self):
+        ''' Returns the new config (only once) or None if nothing changed '''
+        with self._lock:
+            config, self._pending = self._pending, None
+        return config
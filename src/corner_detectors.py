@@ -0,0 +1,95 @@
+"""
+corner_detectors.py
+
+Function:
+This file finds the points (corners) the dart shape is built from, in the blurred frame difference. The detector is
+picked with CORNER_DETECTOR in cv_constants_base.yaml:
+    harris:      goodFeaturesToTrack with the Harris response (the original getCorners)
+    shi_tomasi:  goodFeaturesToTrack with the min eigenvalue response
+    fast:        FAST keypoints on the thresholded difference
+    mask:        the non-zero pixels of the thresholded difference (no detector at all)
+All of them only look inside the bounding box of the thresholded difference (plus CORNER_ROI_MARGIN), not the
+full frame, and return at most CORNER_MAX_CORNERS points as an int array of shape (N, 1, 2), like getCorners.
+"""
+import functools
+
+from cv_context import lazy_import
+
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+
+
+def no_corners():
+    return np.empty((0, 1, 2), np.intp)
+
+
+def motion_roi(thresh, margin):
+    ''' (x0, y0, x1, y1) around the non-zero pixels of the threshold image, None when there are none '''
+    x, y, w, h = cv2.boundingRect(thresh)
+    if w == 0 or h == 0:
+        return None
+    rows, cols = thresh.shape[:2]
+    return max(x - margin, 0), max(y - margin, 0), min(x + w + margin, cols), min(y + h + margin, rows)
+
+
+def detect_harris(blur, thresh, constants):
+    return cv2.goodFeaturesToTrack(blur, constants.CORNER_MAX_CORNERS, constants.CORNER_QUALITY,
+                                   constants.CORNER_MIN_DISTANCE, mask=None, blockSize=constants.CORNER_BLOCK_SIZE,
+                                   useHarrisDetector=True, k=constants.HARRIS_K)
+
+
+def detect_shi_tomasi(blur, thresh, constants):
+    return cv2.goodFeaturesToTrack(blur, constants.CORNER_MAX_CORNERS, constants.CORNER_QUALITY,
+                                   constants.CORNER_MIN_DISTANCE, mask=None, blockSize=constants.CORNER_BLOCK_SIZE,
+                                   useHarrisDetector=False)
+
+
+@functools.lru_cache(maxsize=None)
+def fast_detector(threshold):
+    return cv2.FastFeatureDetector_create(threshold=threshold, nonmaxSuppression=True)
+
+
+def detect_fast(blur, thresh, constants):
+    keypoints = fast_detector(constants.FAST_THRESHOLD).detect(thresh)
+    if not keypoints:
+        return None
+    keypoints = sorted(keypoints, key=lambda keypoint: keypoint.response, reverse=True)[:constants.CORNER_MAX_CORNERS]
+    return np.array([keypoint.pt for keypoint in keypoints], np.float32).reshape(-1, 1, 2)
+
+
+def detect_mask(blur, thresh, constants):
+    points = cv2.findNonZero(thresh)
+    if points is None:
+        return None
+    # evenly spread subset when there are too many pixels
+    step = -(-len(points) // constants.CORNER_MAX_CORNERS)
+    return points[::step]
+
+
+CORNER_DETECTORS = {
+    'harris': detect_harris,
+    'shi_tomasi': detect_shi_tomasi,
+    'fast': detect_fast,
+    'mask': detect_mask,
+}
+
+
+def resolve_corner_detector(name):
+    if name not in CORNER_DETECTORS:
+        raise ValueError(f"Unknown CORNER_DETECTOR '{name}', expected one of {sorted(CORNER_DETECTORS)}")
+    return name
+
+
+def find_corners(blur, thresh, constants, detector='harris'):
+    roi = motion_roi(thresh, constants.CORNER_ROI_MARGIN)
+    if roi is None:
+        return no_corners()
+    x0, y0, x1, y1 = roi
+    corners = CORNER_DETECTORS[detector](blur[y0:y1, x0:x1], thresh[y0:y1, x0:x1], constants)
+    if corners is None or len(corners) == 0:
+        return no_corners()
+    # back to full frame coordinates
+    corners = np.intp(corners).reshape(-1, 1, 2)
+    corners[:, 0, 0] += x0
+    corners[:, 0, 1] += y0
+    return corners
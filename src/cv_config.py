@@ -0,0 +1,248 @@
+"""
+cv_config.py
+
+Function:
+This file holds the typed configuration used by the computer vision. The constants are read from
+config/cv_constants_base.yaml, the pixel constants (radii in px, center, pixels per mm) are derived from the mm
+values, and the result is stored as a binary snapshot (config/cv_constants_base.cache) next to the yaml file.
+The next process start loads the snapshot instead of parsing the yaml again, as long as the yaml file did not
+change (checked by mtime/size first, then by hash). This replaces running generate_cv_constants.py by hand.
+
+Run this file to rebuild the snapshot and print the constants.
+"""
+import dataclasses
+import hashlib
+import os
+import pickle
+import threading
+from dataclasses import dataclass
+
+from cv_context import CONFIG_DIR, lazy_import
+
+yaml = lazy_import("yaml")
+
+BASE_CONFIG_PATH = os.path.join(CONFIG_DIR, "cv_constants_base.yaml")
+CACHE_SUFFIX = ".cache"
+# bump this when the fields or the derived constants change, so old snapshots are rebuilt
+CACHE_VERSION = 10
+
+
+@dataclass(frozen=True, slots=True)
+class CVConfig:
+    NUM_CAMERAS: int
+    CAMERA_ID: tuple
+    IMAGE_WIDTH: int
+    IMAGE_HEIGHT: int
+    DARTBOARD_DIAMETER_MM: float
+
+    # dartboard radii in mm
+    BULLSEYE_RADIUS_MM: float
+    OUTER_BULL_RADIUS_MM: float
+    TRIPLE_RING_INNER_RADIUS_MM: float
+    TRIPLE_RING_OUTER_RADIUS_MM: float
+    DOUBLE_RING_INNER_RADIUS_MM: float
+    DOUBLE_RING_OUTER_RADIUS_MM: float
+    TIP_RADIUS_MM: float
+
+    # kalman filter parameters
+    DT: float
+    U_X: float
+    U_Y: float
+    STD_ACC: float
+    X_STD_MEAS: float
+    Y_STD_MEAS: float
+
+    # takeout parameters
+    TAKEOUT_THRESHOLD: int
+    TAKEOUT_DELAY: float
+
+    # detection limits
+    DIFF_THRESHOLD: int = 60
+    MOTION_MIN_PIXELS: int = 1000
+    MOTION_MAX_PIXELS: int = 7500
+    DART_MAX_PIXELS: int = 15000
+    CORNERS_MIN_SIZE: int = 40
+    FILTERED_CORNERS_MIN_SIZE: int = 30
+    # diff2blur blur: auto (fastest exact backend on this cpu), filter2d, box, separable, integral or gaussian
+    BLUR_BACKEND: str = "auto"
+    # corner detection (see corner_detectors.py)
+    CORNER_DETECTOR: str = "harris"
+    CORNER_ROI_MARGIN: int = 20
+    CORNER_MAX_CORNERS: int = 640
+    CORNER_QUALITY: float = 0.0008
+    CORNER_MIN_DISTANCE: float = 1
+    CORNER_BLOCK_SIZE: int = 3
+    HARRIS_K: float = 0.06
+    FAST_THRESHOLD: int = 20
+    # dart segmentation: corners or components (see dart_segmentation.py)
+    DART_SEGMENTATION: str = "corners"
+    SEGMENT_MIN_AREA: int = 50
+    SEGMENT_MIN_ELONGATION: float = 3.0
+
+    # board layout (see board_layout.py): sector numbers from the angle BOARD_ROTATION_DEG on, every 18 degrees
+    SECTOR_ORDER: tuple = (10, 15, 2, 17, 3, 19, 7, 16, 8, 11, 14, 9, 12, 5, 20, 1, 18, 4, 13, 6)
+    BOARD_ROTATION_DEG: float = 0.0
+
+    # automatic calibration (see auto_calibration.py)
+    AUTO_CAL_MIN_SATURATION: int = 90
+    AUTO_CAL_MIN_VALUE: int = 50
+    AUTO_CAL_RED_SECTOR: int = 20
+    AUTO_CAL_RANSAC_THRESHOLD: float = 2.0
+    AUTO_CAL_MAX_ERROR_MM: float = 2.0
+
+    # calibration drift checks while idle (see drift_monitor.py)
+    DRIFT_CHECK_INTERVAL: float = 60.0
+    DRIFT_MAX_DUTY: float = 0.02
+    DRIFT_IGNORE_MM: float = 0.5
+    DRIFT_REFINE_MAX_MM: float = 3.0
+    DRIFT_REFINE_RATE: float = 0.5
+    DRIFT_MIN_INLIERS: float = 0.8
+
+    # per camera offsets learned from the score corrections (see camera_bias.py)
+    CAMERA_BIAS_RATE: float = 0.3
+    CAMERA_BIAS_MARGIN_MM: float = 0.5
+    CAMERA_BIAS_MAX_MM: float = 5.0
+
+    # frame scheduler (see frame_scheduler.py)
+    IDLE_CAMERA: str = "center"
+    IDLE_POLL_INTERVAL: float = 0.5
+    ACTIVE_POLL_INTERVAL: float = 0.1
+    IDLE_QUIET_PERIOD: float = 30.0
+
+    # derived from the values above (see derive_constants)
+    PIXELS_PER_MM: float = 0.0
+    BULLSEYE_RADIUS_PX: int = 0
+    OUTER_BULL_RADIUS_PX: int = 0
+    TRIPLE_RING_INNER_RADIUS_PX: int = 0
+    TRIPLE_RING_OUTER_RADIUS_PX: int = 0
+    DOUBLE_RING_INNER_RADIUS_PX: int = 0
+    DOUBLE_RING_OUTER_RADIUS_PX: int = 0
+    center: tuple = (0, 0)
+
+    # hash of the yaml file this was built from
+    source_hash: str = ""
+
+    @classmethod
+    def from_dict(cls, data, source_hash=""):
+        names = {field.name for field in dataclasses.fields(cls)}
+        unknown = sorted(set(data) - names)
+        if unknown:
+            print(f"Ignoring unknown cv constants: {', '.join(unknown)}")
+        values = {key: value for key, value in data.items() if key in names}
+        values['CAMERA_ID'] = tuple(values.get('CAMERA_ID', ()))
+        if 'SECTOR_ORDER' in values:
+            values['SECTOR_ORDER'] = tuple(values['SECTOR_ORDER'])
+            if sorted(values['SECTOR_ORDER']) != list(range(1, 21)):
+                raise ValueError(f"SECTOR_ORDER must contain the numbers 1 to 20 once: {values['SECTOR_ORDER']}")
+        if values.get('IDLE_CAMERA', 'center') not in ('right', 'left', 'center'):
+            raise ValueError(f"IDLE_CAMERA must be right, left or center: {values['IDLE_CAMERA']!r}")
+        values.update(derive_constants(values))
+        return cls(**values, source_hash=source_hash)
+
+    def replace(self, **changes):
+        return dataclasses.replace(self, **changes)
+
+    def as_dict(self):
+        return {field.name: getattr(self, field.name) for field in dataclasses.fields(self)}
+
+
+def derive_constants(data):
+    """Calculate the pixel constants from the mm values."""
+    pixels_per_mm = data['IMAGE_HEIGHT'] / data['DARTBOARD_DIAMETER_MM']
+    return {
+        'PIXELS_PER_MM': pixels_per_mm,
+        #convert mm measurements into pixels
+        'BULLSEYE_RADIUS_PX': int(data['BULLSEYE_RADIUS_MM'] * pixels_per_mm),
+        'OUTER_BULL_RADIUS_PX': int(data['OUTER_BULL_RADIUS_MM'] * pixels_per_mm),
+        'TRIPLE_RING_INNER_RADIUS_PX': int(data['TRIPLE_RING_INNER_RADIUS_MM'] * pixels_per_mm),
+        'TRIPLE_RING_OUTER_RADIUS_PX': int(data['TRIPLE_RING_OUTER_RADIUS_MM'] * pixels_per_mm),
+        'DOUBLE_RING_INNER_RADIUS_PX': int(data['DOUBLE_RING_INNER_RADIUS_MM'] * pixels_per_mm),
+        'DOUBLE_RING_OUTER_RADIUS_PX': int(data['DOUBLE_RING_OUTER_RADIUS_MM'] * pixels_per_mm),
+        'center': (data['IMAGE_WIDTH'] // 2, data['IMAGE_HEIGHT'] // 2),
+    }
+
+
+def cache_path_for(yaml_path):
+    return os.path.splitext(yaml_path)[0] + CACHE_SUFFIX
+
+
+def _read_snapshot(cache_path):
+    try:
+        with open(cache_path, "rb") as file:
+            snapshot = pickle.load(file)
+    except (OSError, ImportError, pickle.UnpicklingError, EOFError, AttributeError, TypeError):
+        return None
+    if not isinstance(snapshot, dict) or snapshot.get('version') != CACHE_VERSION:
+        return None
+    return snapshot
+
+
+def _write_snapshot(cache_path, snapshot):
+    # write to a temp file first so a reader never sees half a snapshot
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as file:
+            pickle.dump(snapshot, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"Could not write the cv constants cache ({e}), continuing without it")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def build_config(yaml_path=BASE_CONFIG_PATH, use_cache=True):
+    """Return the CVConfig for yaml_path, from the binary snapshot when it is still valid."""
+    cache_path = cache_path_for(yaml_path)
+    stat = os.stat(yaml_path)
+
+    snapshot = _read_snapshot(cache_path) if use_cache else None
+    if snapshot is not None and snapshot['mtime_ns'] == stat.st_mtime_ns and snapshot['size'] == stat.st_size:
+        return snapshot['config']
+
+    with open(yaml_path, "rb") as file:
+        raw = file.read()
+    source_hash = hashlib.sha256(raw).hexdigest()
+
+    if snapshot is not None and snapshot['config'].source_hash == source_hash:
+        # file was touched but not changed, keep the snapshot and just refresh its mtime
+        config = snapshot['config']
+    else:
+        config = CVConfig.from_dict(yaml.safe_load(raw) or {}, source_hash=source_hash)
+
+    if use_cache:
+        _write_snapshot(cache_path, {'version': CACHE_VERSION, 'mtime_ns': stat.st_mtime_ns,
+                                     'size': stat.st_size, 'config': config})
+    return config
+
+
+_configs = {}
+_configs_lock = threading.Lock()
+
+
+def load_config(yaml_path=BASE_CONFIG_PATH):
+    """Shared entry point: every caller in the process gets the same CVConfig object."""
+    yaml_path = os.path.abspath(yaml_path)
+    with _configs_lock:
+        config = _configs.get(yaml_path)
+        if config is None:
+            config = _configs[yaml_path] = build_config(yaml_path)
+    return config
+
+
+def reload_config(yaml_path=BASE_CONFIG_PATH):
+    """Rebuild the config after the yaml file changed and make it the shared one."""
+    yaml_path = os.path.abspath(yaml_path)
+    config = build_config(yaml_path)
+    with _configs_lock:
+        _configs[yaml_path] = config
+    return config
+
+
+if __name__ == '__main__':
+    cache_path = cache_path_for(BASE_CONFIG_PATH)
+    if os.path.exists(cache_path):
+        os.remove(cache_path)
+    config = build_config()
+    print(f"Snapshot written to {cache_path_for(BASE_CONFIG_PATH)}")
+    for key, value in config.as_dict().items():
+        print(f"{key}: {value}")
@@ -0,0 +1,129 @@
+"""
+cv_context.py
+
+Function:
+This file holds the context object that the computer vision code gets its constants and perspective matrices
+from. Nothing is read from disk when this module (or utils/darts_cv) is imported, the constants (see cv_config.py)
+and the .npz matrices are only loaded the first time they are asked for. Paths are resolved from the project root instead of
+the current working directory, so the scoring code can be imported from the tools, the web apps or a python shell.
+
+"""
+import importlib
+import os
+import threading
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONFIG_DIR = os.path.join(PROJECT_ROOT, "config")
+DEFAULT_CONFIG_PATH = os.path.join(CONFIG_DIR, "cv_constants_base.yaml")
+
+
+class LazyModule:
+    """Stand-in for a heavy module (cv2, numpy, shapely). The real import happens on first attribute access."""
+
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+
+    def __getattr__(self, attr):
+        module = importlib.import_module(self.__dict__['_name'])
+        value = getattr(module, attr)
+        # cache it on the instance so the next lookup is a plain attribute read
+        self.__dict__[attr] = value
+        return value
+
+    def __repr__(self):
+        return f"<lazy module '{self.__dict__['_name']}'>"
+
+
+def lazy_import(name):
+    return LazyModule(name)
+
+
+np = lazy_import("numpy")
+
+
+class CVContext:
+
+    def __init__(self, config_path=None, matrix_dir=None):
+        self.config_path = config_path or DEFAULT_CONFIG_PATH
+        self.matrix_dir = matrix_dir or PROJECT_ROOT
+        self._lock = threading.Lock()
+        self._constants = None
+        self._perspective_matrices = None
+        self._inverse_matrices = None
+        self._camera_offsets = None
+
+    @property
+    def constants(self):
+        if self._constants is None:
+            from cv_config import load_config
+            with self._lock:
+                if self._constants is None:
+                    self._constants = load_config(self.config_path)
+        return self._constants
+
+    def update_constants(self, constants):
+        # a single reference swap, readers either see the old or the new config and never a mix
+        self._constants = constants
+
+    def matrix_path(self, camera_index):
+        return os.path.join(self.matrix_dir, f'perspective_matrix_camera_{camera_index}.npz')
+
+    @property
+    def perspective_matrices(self):
+        if self._perspective_matrices is None:
+            self._perspective_matrices = self.load_perspective_matrices()
+        return self._perspective_matrices
+
+    @property
+    def inverse_matrices(self):
+        # the scoring code maps camera -> board space, so invert the matrices once instead of once per dart
+        if self._inverse_matrices is None:
+            self._inverse_matrices = [np.linalg.inv(matrix) for matrix in self.perspective_matrices]
+        return self._inverse_matrices
+
+    def load_perspective_matrices(self):
+        perspective_matrices = []
+        for camera_index in range(self.constants.NUM_CAMERAS):
+            path = self.matrix_path(camera_index)
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"Perspective matrix file not found for camera {camera_index} ({path}). Please calibrate the cameras first.")
+            perspective_matrices.append(np.load(path)['matrix'])
+        return perspective_matrices
+
+    def reload_perspective_matrices(self):
+        self._perspective_matrices = None
+        self._inverse_matrices = None
+        return self.perspective_matrices
+
+    def bias_path(self):
+        return os.path.join(self.matrix_dir, 'camera_bias.npz')
+
+    @property
+    def camera_offsets(self):
+        ''' (NUM_CAMERAS, 2) board space offset taken off the points of each camera (see camera_bias.py) '''
+        if self._camera_offsets is None:
+            path = self.bias_path()
+            if os.path.exists(path):
+                self._camera_offsets = np.load(path)['offsets']
+            else:
+                self._camera_offsets = np.zeros((self.constants.NUM_CAMERAS, 2))
+        return self._camera_offsets
+
+    def update_camera_offsets(self, offsets):
+        # a single reference swap, like update_constants
+        self._camera_offsets = offsets
+
+
+_context = None
+
+
+def get_context():
+    global _context
+    if _context is None:
+        _context = CVContext()
+    return _context
+
+
+def set_context(context):
+    global _context
+    _context = context
@@ -0,0 +1,82 @@
+"""
+dart_segmentation.py
+
+Function:
+This file finds the dart directly in the thresholded frame difference, without corners (DART_SEGMENTATION:
+components in cv_constants_base.yaml). The connected components of the threshold image are measured all at once
+(areas, centroids and second order moments with np.bincount, no loop over the pixels), the dart is the biggest
+component that is elongated enough, and the tip is the end of its principal (long) axis that is the lowest in
+the image, like the lowest point of the skeleton in the corners path. Only the bounding box of the non-zero pixels
+is labelled, not the full frame.
+"""
+import math
+
+from cv_context import lazy_import
+
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+
+
+def component_shapes(thresh):
+    '''
+    Per connected component (label 0 is the background): labels of the non-zero pixels, their x/y, the areas,
+    centroids and the central second moments (mu20, mu02, mu11 divided by the area)
+    '''
+    count, labels, stats, centroids = cv2.connectedComponentsWithStats(thresh, connectivity=8)
+    points = cv2.findNonZero(thresh)
+    if count < 2 or points is None:
+        return None
+    points = points.reshape(-1, 2)
+    x = points[:, 0].astype(np.float64)
+    y = points[:, 1].astype(np.float64)
+    point_labels = labels[points[:, 1], points[:, 0]]
+
+    areas = stats[:, cv2.CC_STAT_AREA].astype(np.float64)
+    dx = x - centroids[point_labels, 0]
+    dy = y - centroids[point_labels, 1]
+    mxx = np.bincount(point_labels, dx * dx, minlength=count) / areas
+    myy = np.bincount(point_labels, dy * dy, minlength=count) / areas
+    mxy = np.bincount(point_labels, dx * dy, minlength=count) / areas
+    return point_labels, dx, dy, areas, centroids, mxx, myy, mxy
+
+
+def segment_dart(thresh, min_area=50, min_elongation=3.0):
+    ''' The dart component and its tip (full frame coordinates), or None when no component looks like a dart '''
+    x0, y0, w, h = cv2.boundingRect(thresh)
+    if w == 0 or h == 0:
+        return None
+    shapes = component_shapes(thresh[y0:y0 + h, x0:x0 + w])
+    if shapes is None:
+        return None
+    point_labels, dx, dy, areas, centroids, mxx, myy, mxy = shapes
+
+    # eigenvalues of the covariance matrix: spread along the long and the short axis
+    half_trace = (mxx + myy) / 2
+    root = np.sqrt(((mxx - myy) / 2) ** 2 + mxy ** 2)
+    major = half_trace + root
+    minor = np.maximum(half_trace - root, 1e-6)
+    elongation = np.sqrt(major / minor)
+
+    candidates = (areas >= min_area) & (elongation >= min_elongation)
+    candidates[0] = False
+    if not candidates.any():
+        return None
+    label = int(np.argmax(np.where(candidates, areas, -1)))
+
+    # principal axis, and the two ends of the component along it
+    angle = 0.5 * math.atan2(2 * mxy[label], mxx[label] - myy[label])
+    axis = np.array([math.cos(angle), math.sin(angle)])
+    in_component = point_labels == label
+    projection = dx[in_component] * axis[0] + dy[in_component] * axis[1]
+    centroid = centroids[label] + (x0, y0)
+    ends = [centroid + projection.min() * axis, centroid + projection.max() * axis]
+    tip = max(ends, key=lambda end: end[1])
+
+    return {
+        'tip': (int(round(tip[0])), int(round(tip[1]))),
+        'centroid': (float(centroid[0]), float(centroid[1])),
+        'axis': (float(axis[0]), float(axis[1])),
+        'length': float(projection.max() - projection.min()),
+        'area': int(areas[label]),
+        'elongation': float(elongation[label]),
+    }
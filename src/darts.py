@@ -9,73 +9,302 @@ Within run_loop, the app/led interation should be added. I do not want to clutte
 
 """
 
+import collections
+import itertools
+import threading
 import time
-import os
-import sys
-import yaml
 import cv2
+from board_layout import RING_NAMES, segment_score, valid_segment
+from camera_bias import CameraBias
 from darts_cv import DartBoard_CV
+from config_watcher import ConfigWatcher
+from drift_monitor import DriftMonitor
+from event_bus import ScoreEvent
+from frame_scheduler import AdaptiveScheduler, IDLE
 from LEDs import LEDs
 
+SETTLE_DELAY = 0.2  # after motion, lets the dart settle before looking for it
+RECENT_THROWS = 30  # throws kept in memory for corrections (older ones are read from the throw log)
+
 class DartBoard:
 
     #whatever is in the constructor is what is shared between the app/led/camera
-    def __init__(self,cam_R,cam_L,cam_C):
+    def __init__(self,cam_R,cam_L,cam_C, publisher=None, show_display=True, context=None, leds=None, name="board",
+                 preview=None, throw_log=None):
+        self.name = name
+        self.player = None  # recorded with the throws, set from the app (set_player)
         self.score = None 
         self.game_mode = "501" #make this the default
         self.single_color = None
         self.double_color = None
         self.triple_color = None
         self.success = False
-        self.db_cv = DartBoard_CV(cam_R,cam_L,cam_C) #call the constructor
-        #TODO: call the LED constrcutor
-        self.leds = LEDs() #call the constructor
+        self.db_cv = DartBoard_CV(cam_R,cam_L,cam_C, context, preview) #call the constructor
+        self.leds = leds if leds is not None else LEDs() #call the constructor
+        # picks up edits to the cv constants while the loop is running
+        self.config_watcher = ConfigWatcher(self.db_cv.context.config_path)
 
+        # sends the scores to the user app (event_bus.ScorePublisher), optional
+        self.publisher = publisher
+        # keeps every scored dart (throw_log.ThrowLog), optional
+        self.throw_log = throw_log
+        # False when running inside a server or with --headless (no GUI popup, the board is never drawn)
+        self.show_display = show_display
 
-        #TODO: maybe pass in the app constructor (intialize it in main??)
+        # 'watch' for movement -> 'confirm' the dart after it settled, 'takeout' while the darts are removed
+        self.state = 'watch'
+        self.takeout_until = 0.0
+        # idle (one camera, slow) / active (all cameras, full rate) polling
+        self.frame_scheduler = AdaptiveScheduler(self.db_cv.constants)
+        # re-checks the calibration in idle frames
+        self.drift_monitor = DriftMonitor(self.db_cv.context)
+        # per camera offsets learned from the score corrections
+        self.camera_bias = CameraBias(self.db_cv.context)
+        # throw id -> what correct_score needs, filled by the loop and read by the app's thread
+        self.recent_throws = collections.OrderedDict()
+        self._throws_lock = threading.Lock()
+        self._throw_ids = itertools.count(1)  # when there is no throw log to give the ids
 
+    def stop(self):
+        # the loop exits at the start of the next step
+        self.success = False
 
-    #TODO: Potentially have different run_loops for each game mode
-    def run_loop(self):
+    def publish_score(self, detected_at, throw_id=None):
+        if self.publisher is None or self.db_cv.majority_hit is None:
+            return
+        score, sector, ring = self.db_cv.majority_hit
+        board_x, board_y = self.db_cv.dart_coordinates
+        camera_scores = self.db_cv.camera_scores
+        self.publisher.publish(ScoreEvent(
+            score=score, sector=sector, ring=ring, board_x=board_x, board_y=board_y,
+            confidence=camera_scores.count(score) / len(camera_scores),
+            camera_scores=list(camera_scores), player=self.player, throw_id=throw_id, detected_at=detected_at))
+
+    def record_throw(self, detected_at, timings):
+        ''' Queues the scored dart in the throw log (if any) and keeps it for corrections, returns its id '''
+        if self.db_cv.majority_hit is None:
+            return None
+        score, sector, ring = self.db_cv.majority_hit
+        board_x, board_y = self.db_cv.dart_coordinates
+        camera_scores = self.db_cv.camera_scores
+        if self.throw_log is not None:
+            throw_id = self.throw_log.record(
+                self.name, detected_at, board_x, board_y, score, sector, ring,
+                confidence=camera_scores.count(score) / len(camera_scores),
+                camera_tips=self.db_cv.camera_tips, camera_scores=camera_scores, player=self.player, **timings)
+        else:
+            throw_id = next(self._throw_ids)
+        with self._throws_lock:
+            self.recent_throws[throw_id] = {
+                'final': (score, sector, ring), 'right': (score, sector, ring), 'board_x': board_x,
+                'board_y': board_y, 'camera_tips': list(self.db_cv.camera_tips),
+                'camera_scores': list(camera_scores), 'player': self.player}
+            while len(self.recent_throws) > RECENT_THROWS:
+                self.recent_throws.popitem(last=False)
+        return throw_id
+
+    def find_throw(self, throw_id):
+        with self._throws_lock:
+            throw = self.recent_throws.get(throw_id)
+        if throw is not None or self.throw_log is None:
+            return throw
+        row = self.throw_log.throw(throw_id)
+        if row is None or row['board'] != self.name:
+            return None
+        final = (row['score'], row['sector'], RING_NAMES[row['ring']])
+        right = final if row['corrected_score'] is None else (
+            row['corrected_score'], row['corrected_sector'], RING_NAMES[row['corrected_ring']])
+        tips = [None if row[f"tip_{camera}_x"] is None else (row[f"tip_{camera}_x"], row[f"tip_{camera}_y"])
+                for camera in ('r', 'l', 'c')]
+        return {'final': final, 'right': right, 'board_x': row['board_x'], 'board_y': row['board_y'],
+                'camera_tips': tips, 'camera_scores': [row['score_r'], row['score_l'], row['score_c']],
+                'player': row['player']}
+
+    def correct_score(self, throw_id, sector, ring):
+        '''
+        The app says the right segment of a throw (sector number, 25 for the bulls, 0 for a miss, and the ring
+        name). Logs it, moves the camera offsets (camera_bias.py) and publishes a score_corrected event.
+        Called from the app's thread. Returns the event, None when the throw is unknown, raises ValueError for a
+        sector/ring pair that is not on the board (before anything is changed)
+        '''
+        if not valid_segment(sector, ring):
+            raise ValueError(f"Invalid segment {sector} {ring}")
+        throw = self.find_throw(throw_id)
+        if throw is None:
+            return None
+        score = segment_score(sector, RING_NAMES.index(ring))
+        # the offsets first: the log correction is queued to the writer thread and can't be taken back
+        bias_mm = self.camera_bias.learn(throw['camera_tips'], sector, ring)
+        if self.throw_log is not None:
+            self.throw_log.correct(throw_id, score, sector, ring)
+        previous = throw['right']
+        throw['right'] = (score, sector, ring)
+        event = ScoreEvent(
+            kind="score_corrected", score=score, sector=sector, ring=ring, board_x=throw['board_x'],
+            board_y=throw['board_y'], camera_scores=throw['camera_scores'], player=throw['player'],
+            throw_id=throw_id, info={'final': throw['final'], 'previous': previous, 'bias_mm': bias_mm})
+        if self.publisher is not None:
+            self.publisher.publish(event)
+        return event
 
+    def start(self):
         self.success = self.db_cv.cv_intilization()
+        self.state = 'watch'
+        if self.success:
+            self.config_watcher.start()
+        return self.success
 
-        while self.success:
+    def close(self):
+        self.config_watcher.stop()
+        self.drift_monitor.stop()
+        self.leds.close()
+        if self.show_display:
+            self.db_cv.destroy()
 
-            self.db_cv.check_camera_working()
-            if not self.db_cv.get_success_value():
-                break
+    def metrics(self):
+        return self.frame_scheduler.metrics()
+
+    def step(self):
+        '''
+        One iteration of the loop. Nothing in here sleeps, it returns how long to wait before the next step
+        (or None when the board is done) so several boards can share the same threads (see board_manager.py)
+        '''
+        if not self.success:
+            return None
+        # cpu time of this thread only, so boards stepped in parallel do not count each other
+        cpu_start = time.thread_time()
+        delay = self._step()
+        self.frame_scheduler.record_step(time.thread_time() - cpu_start)
+        return delay
+
+    def _step(self):
+        if not self.success:
+            return None
+
+        # swap in edited constants between iterations (the yaml was already parsed by the watcher thread)
+        new_config = self.config_watcher.take_pending()
+        if new_config is not None:
+            self.db_cv.apply_config(new_config)
+            self.frame_scheduler.constants = new_config
+
+        if self.state == 'takeout':
+            # keep updating the reference frames until the hand is gone
+            if time.time() < self.takeout_until:
+                self.db_cv.update_reference_frame()
+                return self.frame_scheduler.interval()
+            print("Takeout procedure completed.")
+            self.state = 'watch'
+            return self.update_display()
+
+        if self.state == 'confirm':
+            self.state = 'watch'
+            if not self.confirm_dart():
+                #move to the next iteration (false movement)
+                return self.frame_scheduler.interval()
+            return self.update_display()
+
+        now = time.monotonic()
+        self.frame_scheduler.update(now)
+        if self.frame_scheduler.mode == IDLE:
+            return self.idle_step(now)
 
-            time.sleep(0.1)
-
-            found_movement = self.db_cv.check_thresholds()
-            #detect movement? could be dart?
-            if found_movement:
-                time.sleep(0.2)
-                #confirmed to be a dart
-                if self.db_cv.dart_detection():
-                    try:
-                        self.db_cv.calculate_score()
-                        #TODO: add the turn on LED light here
-                        #TODO: send the score update to the user app
-                    except Exception as e:
-                        print(f"Something went wrong in finding the dart's location: {str(e)}")
-                        continue
-                    # Update the reference frames after a dart has been detected
-                    self.success = self.db_cv.update_reference_frame()
-                else:
-                    #move to the next iteration (false movement)
-                    continue
-            else:
-                self.db_cv.takeout_procedure()
-            
-            #plot the score on a GUI popup
+        self.db_cv.check_camera_working()
+        if not self.db_cv.get_success_value():
+            self.success = False
+            return None
+
+        found_movement = self.db_cv.check_thresholds()
+        if max(self.db_cv.non_zero_counts) > self.db_cv.constants.MOTION_MIN_PIXELS:
+            # anything moving in front of the board (dart, hand, player) keeps it active
+            self.frame_scheduler.on_motion(now)
+        #detect movement? could be dart?
+        if found_movement:
+            self.state = 'confirm'
+            return SETTLE_DELAY
+
+        if self.db_cv.check_takeout():
+            self.leds.clearAll()
+            if self.publisher is not None:
+                self.publisher.publish(ScoreEvent(kind="takeout"))
+            self.state = 'takeout'
+            self.takeout_until = time.time() + self.db_cv.constants.TAKEOUT_DELAY
+            return self.frame_scheduler.interval()
+
+        return self.update_display()
+
+    def idle_step(self, now):
+        ''' Nobody is playing: only check one camera, at the idle rate '''
+        mount = self.db_cv.constants.IDLE_CAMERA
+        non_zero = self.db_cv.check_motion(mount)
+        if non_zero is None:
+            self.success = False
+            return None
+        self.db_cv.grab_frames(skip_mount=mount)
+
+        constants = self.db_cv.constants
+        if non_zero > constants.MOTION_MIN_PIXELS:
+            self.frame_scheduler.on_motion(now)
+            if non_zero < constants.MOTION_MAX_PIXELS:
+                # looks like a dart, confirm it with all three cameras
+                self.state = 'confirm'
+                return SETTLE_DELAY
+            return self.frame_scheduler.interval()
+
+        # nothing moves: spare time for a calibration check (budgeted, usually not due, fitted on its own thread)
+        drift = self.drift_monitor.idle_check(now, [self.db_cv.cam_R, self.db_cv.cam_L, self.db_cv.cam_C])
+        if drift is not None and self.publisher is not None:
+            self.publisher.publish(ScoreEvent(kind="calibration_drift", key=f"calibration_drift_{drift['camera']}",
+                                              info=drift))
+        return self.update_display()
+
+    def confirm_dart(self):
+        #confirmed to be a dart
+        start = time.perf_counter()
+        if not self.db_cv.dart_detection():
+            return False
+        detected_at = time.time()
+        detected = time.perf_counter()
+        try:
+            self.db_cv.calculate_score()
+            scored = time.perf_counter()
+            # light up the segment that was hit (queued, shows on the next LED frame)
+            if self.db_cv.majority_hit is not None:
+                _, sector, ring = self.db_cv.majority_hit
+                color = {'double': self.double_color, 'triple': self.triple_color}.get(ring, self.single_color)
+                self.leds.hitSeg(sector, ring, color)
+            # the throw id goes out with the event, the row itself is written by the log's thread
+            throw_id = self.record_throw(detected_at, {'detect_ms': (detected - start) * 1000,
+                                                       'score_ms': (scored - detected) * 1000})
+            # send the score update to the user app
+            self.publish_score(detected_at, throw_id)
+        except Exception as e:
+            print(f"Something went wrong in finding the dart's location: {str(e)}")
+            return False
+        # Update the reference frames after a dart has been detected
+        self.success = self.db_cv.update_reference_frame()
+        return True
+
+    def update_display(self):
+        #plot the score on a GUI popup
+        if self.show_display:
             self.db_cv.plot_score()
             key = cv2.waitKey(1) & 0xFF
 
             # Check for 'q' (quit)
             if key == ord('q'):
+                self.success = False
+                return None
+        # scores are corrected from the app (correct_score)
+        return self.frame_scheduler.interval()
+
+    #TODO: Potentially have different run_loops for each game mode
+    def run_loop(self):
+
+        self.start()
+        while True:
+            delay = self.step()
+            if delay is None:
                 break
-            #TODO: add option to correct the score on the app
-        
-        self.db_cv.destroy()
+            time.sleep(delay)
+
+        self.close()
@@ -7,30 +7,44 @@ used for the computer vision to recognize and calculte the score. Ideally, the s
 the dart is being removed
 
 """
-import yaml
-import os
-import sys
 import time
-import cv2
-from kalman_filter import KalmanFilter
-from utils import *
-import numpy as np
-import math
-from shapely.geometry import Point, LineString, Polygon
-from typing import List
+from cv_context import get_context, lazy_import
+from board_assets import board_image
+from board_renderer import BoardRenderer
+from corner_detectors import find_corners, resolve_corner_detector
+from dart_segmentation import segment_dart
+from frame_workspace import FrameWorkspace
+from utils import (cam2gray, diff2blur, filterCorners, filterCornersLine, get_threshold, get_hits,
+                   load_perspective_matrices, generate_kalman_filters, resolve_blur_backend, transform_to_board)
+
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+# shapely is only needed once a dart is found, so it is not imported until then
+geometry = lazy_import("shapely.geometry")
+
+# constants that, when changed by a config reload, require rebuilding what was derived from them
+KALMAN_CONSTANTS = ('DT', 'U_X', 'U_Y', 'STD_ACC', 'X_STD_MEAS', 'Y_STD_MEAS')
+SEGMENTATIONS = ('corners', 'components')
+BOARD_CONSTANTS = ('IMAGE_WIDTH', 'IMAGE_HEIGHT', 'DARTBOARD_DIAMETER_MM', 'BULLSEYE_RADIUS_MM', 'OUTER_BULL_RADIUS_MM',
+                   'TRIPLE_RING_INNER_RADIUS_MM', 'TRIPLE_RING_OUTER_RADIUS_MM', 'DOUBLE_RING_INNER_RADIUS_MM',
+                   'DOUBLE_RING_OUTER_RADIUS_MM')
 
 class DartBoard_CV:
 
-    def __init__(self,cam_R, cam_L, cam_C):
+    def __init__(self,cam_R, cam_L, cam_C, context=None, preview=None):
         #TODO: clean this up/group em
 
         self.cam_R = cam_R
         self.cam_L = cam_L
         self.cam_C = cam_C
+        self.context = context or get_context()
         self.constants = self.load_constants()
         self.camera_scores = [None, None, None]
-        #self.camera_scores = [None] * self.constants['NUM_CAMERAS']  # Initialize camera_scores list
+        self.camera_hits = [None, None, None]
+        self.camera_tips = [None, None, None]  # tip found by each camera (camera pixels), for the throw log
+        #self.camera_scores = [None] * self.constants.NUM_CAMERAS  # Initialize camera_scores list
         self.majority_score = None
+        self.majority_hit = None  # (score, sector, ring) of the majority camera
         self.dart_coordinates = None
         self.prev_tip_point_R = None
         self.prev_tip_point_L = None
@@ -42,7 +56,9 @@ class DartBoard_CV:
         self.thresh_C = None
         self.thresh_L = None
         self.thresh_R = None
-        self.dartboard_image = draw_dartboard()
+        self._dartboard_image = None  # only drawn when the score is plotted (never when running headless)
+        self.renderer = None
+        self.visit_hits = []  # board coordinates of the darts since the last takeout
         self.perspective_matrices = []
         self.score_images = None
         self.kalman_filter_R = None
@@ -54,28 +70,77 @@ class DartBoard_CV:
         self.blur_R = None
         self.blur_L = None
         self.blur_C = None
+        self.non_zero_counts = (0, 0, 0)
+        self.blur_backend = 'filter2d'  # resolved from BLUR_BACKEND once the frame size is known
+        self.corner_detector = 'harris'
+        self.segmentation = 'corners'
+        self.segments = {'right': None, 'left': None, 'center': None}  # components segmentation results
+        # reused image buffers, one set per camera
+        self.workspaces = {'right': FrameWorkspace(), 'left': FrameWorkspace(), 'center': FrameWorkspace()}
+        # remote camera preview (preview.PreviewHub), optional
+        self.preview = preview
     
+    @property
+    def dartboard_image(self):
+        if self._dartboard_image is None:
+            # drawn once per set of board constants and cached on disk (board_assets.py)
+            self._dartboard_image = board_image(self.constants)
+        return self._dartboard_image
+
     def get_success_value(self):
         return self.success
 
+    def read_reference(self, mount):
+        # the new reference overwrites the old one in place
+        cam = self.get_mount(mount)[0]
+        ws = self.workspaces[mount]
+        success, t = cam2gray(cam, ws.get('reference'))
+        return success, ws.keep('reference', t)
+
     def update_reference_frame(self):
-        self.success, self.t_R = cam2gray(self.cam_R)
-        _, self.t_L = cam2gray(self.cam_L)
-        _, self.t_C = cam2gray(self.cam_C)
+        self.success, self.t_R = self.read_reference('right')
+        _, self.t_L = self.read_reference('left')
+        _, self.t_C = self.read_reference('center')
         return self.success
 
     def check_camera_working(self):
         for camera_index, cam in enumerate([self.cam_R, self.cam_L, self.cam_C]):
-            ret, frame = cam.read()
+            # grab only, the frame itself is not needed (no decoding)
+            ret = cam.grab()
             if not ret:
                 print(f"Error: Camera {camera_index} failed to return a frame.")
                 self.success = False  # Exit the while loop
                 break  
 
     def load_constants(self):
-        # load yaml file with constant paramters
-        with open("config/cv_constants.yaml", "r") as file:
-            constants = yaml.safe_load(file)
+        # constants are loaded (once) by the shared context
+        return self.context.constants
+
+    def apply_config(self, config):
+        '''
+        Swaps in a new config (from the ConfigWatcher) between two loop iterations and rebuilds the state that
+        was derived from the old constants. Everything else just reads self.constants on the next iteration
+        '''
+        old_config = self.constants
+        changed = [name for name, value in config.as_dict().items()
+                   if name != 'source_hash' and getattr(old_config, name) != value]
+        self.context.update_constants(config)
+        self.constants = config
+
+        if self.kalman_filter_R is not None and any(name in KALMAN_CONSTANTS for name in changed):
+            self.kalman_filter_R, self.kalman_filter_L, self.kalman_filter_C = generate_kalman_filters(self.context)
+        if any(name in BOARD_CONSTANTS for name in changed):
+            self._dartboard_image = None
+            self.renderer = None
+        if 'BLUR_BACKEND' in changed and self.t_R is not None:
+            self.select_blur_backend()
+        if 'CORNER_DETECTOR' in changed:
+            self.select_corner_detector()
+        if 'DART_SEGMENTATION' in changed:
+            self.select_segmentation()
+
+        print(f"Applied new constants: {', '.join(changed) if changed else 'no changes'}")
+        return changed
 
     def initialize_test_cameras(self):
         # Read first image twice to start loop
@@ -85,28 +150,87 @@ class DartBoard_CV:
     
     def cv_intilization(self):
         self.initialize_test_cameras()
-        self.perspective_matrices = load_perspective_matrices()
+        try:
+            self.perspective_matrices = load_perspective_matrices(self.context)
+        except FileNotFoundError:
+            self.success = False
+            return self.success
         # initialize Kalman filters for each camera
-        self.kalman_filter_R, self.kalman_filter_L, self.kalman_filter_C = generate_kalman_filters()
+        self.kalman_filter_R, self.kalman_filter_L, self.kalman_filter_C = generate_kalman_filters(self.context)
+        if self.success:
+            self.select_blur_backend()
+            self.select_corner_detector()
+            self.select_segmentation()
         return self.success
 
+    def select_blur_backend(self):
+        # 'auto' runs a short benchmark of the blur backends on a frame of the camera size
+        try:
+            self.blur_backend = resolve_blur_backend(self.constants.BLUR_BACKEND, self.t_R.shape)
+        except ValueError as e:
+            print(f"{str(e)}, using filter2d")
+            self.blur_backend = 'filter2d'
+
+    def select_corner_detector(self):
+        try:
+            self.corner_detector = resolve_corner_detector(self.constants.CORNER_DETECTOR)
+        except ValueError as e:
+            print(f"{str(e)}, using harris")
+            self.corner_detector = 'harris'
+
+    def select_segmentation(self):
+        self.segmentation = self.constants.DART_SEGMENTATION
+        if self.segmentation not in SEGMENTATIONS:
+            print(f"Unknown DART_SEGMENTATION '{self.segmentation}', expected one of {list(SEGMENTATIONS)}, using corners")
+            self.segmentation = 'corners'
+
+    def get_mount(self, mount):
+        return {'right': (self.cam_R, self.t_R), 'left': (self.cam_L, self.t_L), 'center': (self.cam_C, self.t_C)}[mount]
+
+    def check_motion(self, mount):
+        ''' 
+        Idle version of check_thresholds: only looks at one camera. Returns the number of non-zero pixels
+        in its threshold image, or None if the camera failed
+        '''
+        cam, t = self.get_mount(mount)
+        try:
+            thresh = get_threshold(cam, t, self.constants.DIFF_THRESHOLD, self.workspaces[mount])
+        except cv2.error:
+            print(f"Error: Camera {mount} failed to return a frame.")
+            self.success = False
+            return None
+        self.offer_preview(mount)
+        return cv2.countNonZero(thresh)
+
+    def grab_frames(self, skip_mount=None):
+        # grab (no decoding) so the camera buffers do not fill up with old frames while they are not read
+        for mount in ('right', 'left', 'center'):
+            if mount != skip_mount:
+                self.get_mount(mount)[0].grab()
+
     def check_thresholds(self):
         ''' 
         Counts the number of non-zero pixels in the threshold images. It checks if the nnz is within 
-        a range of 1000-7500. This likely indicates a movement ( ie: dart being thrown). There is a upper 
+        a range of MOTION_MIN_PIXELS-MOTION_MAX_PIXELS (1000-7500). This likely indicates a movement ( ie: dart being thrown). There is a upper 
         limit as that could be caused by too much noise/movement
         '''
-        self.thresh_R = get_threshold(self.cam_R, self.t_R)
-        self.thresh_L = get_threshold(self.cam_L, self.t_L)
-        self.thresh_C = get_threshold(self.cam_C, self.t_C)
+        threshold = self.constants.DIFF_THRESHOLD
+        self.thresh_R = get_threshold(self.cam_R, self.t_R, threshold, self.workspaces['right'])
+        self.thresh_L = get_threshold(self.cam_L, self.t_L, threshold, self.workspaces['left'])
+        self.thresh_C = get_threshold(self.cam_C, self.t_C, threshold, self.workspaces['center'])
+        for mount in ('right', 'left', 'center'):
+            self.offer_preview(mount)
 
         non_zero_R = cv2.countNonZero(self.thresh_R)
         non_zero_L = cv2.countNonZero(self.thresh_L)
         non_zero_C = cv2.countNonZero(self.thresh_C)
+        # kept for the takeout check (the threshold images are cleared below)
+        self.non_zero_counts = (non_zero_R, non_zero_L, non_zero_C)
 
-        if ((1000 < non_zero_R < 7500) or 
-            (1000 < non_zero_L < 7500) or 
-            (1000 < non_zero_C < 7500)):
+        low, high = self.constants.MOTION_MIN_PIXELS, self.constants.MOTION_MAX_PIXELS
+        if ((low < non_zero_R < high) or 
+            (low < non_zero_L < high) or 
+            (low < non_zero_C < high)):
             return True
         else:
             self.thresh_C = None
@@ -114,36 +238,63 @@ class DartBoard_CV:
             self.thresh_R = None
             return False
 
+    def offer_preview(self, mount):
+        # the frame and threshold image of the last get_threshold, only copied when someone is watching
+        if self.preview is not None:
+            ws = self.workspaces[mount]
+            self.preview.offer(mount, ws.get('gray'), mount)
+            self.preview.offer(f"{mount}_mask", ws.get('thresh'))
+
     def corner_detection(self,blur_R, blur_L, blur_C):
         ''' 
         Applies a diff operation (frame subtraction). followed by a blurring to highlihgt any changes 
-        in the frame. It then detects corners (features) in the blurred frame to find the dart
+        in the frame. It then detects corners (features) in the blurred frame to find the dart, only inside
+        the bounding box of the thresholded diff (the threshold images have to be computed first)
         '''
 
-        corners_R = getCorners(blur_R)
-        corners_L = getCorners(blur_L)
-        corners_C = getCorners(blur_C)
+        corners_R = find_corners(blur_R, self.thresh_R, self.constants, self.corner_detector)
+        corners_L = find_corners(blur_L, self.thresh_L, self.constants, self.corner_detector)
+        corners_C = find_corners(blur_C, self.thresh_C, self.constants, self.corner_detector)
 
-        if corners_R.size < 40 and corners_L.size < 40 and corners_C.size < 40:
+        min_size = self.constants.CORNERS_MIN_SIZE
+        if corners_R.size < min_size and corners_L.size < min_size and corners_C.size < min_size:
             print("---- Dart Not Detected -----")
             return False, None, None, None
         return True, corners_R, corners_L, corners_C
 
     def filtered_corner_detection(self,corners_R, corners_L, corners_C):
-        corners_f_R = filterCorners(corners_R)
-        corners_f_L = filterCorners(corners_L)
-        corners_f_C = filterCorners(corners_C)
+        # a camera that did not see the dart can have no corners at all (the search is limited to its motion box)
+        corners_f_R = filterCorners(corners_R) if len(corners_R) else corners_R
+        corners_f_L = filterCorners(corners_L) if len(corners_L) else corners_L
+        corners_f_C = filterCorners(corners_C) if len(corners_C) else corners_C
 
-        if corners_f_R.size < 30 and corners_f_L.size < 30 and corners_f_C.size < 30:
+        min_size = self.constants.FILTERED_CORNERS_MIN_SIZE
+        if corners_f_R.size < min_size and corners_f_L.size < min_size and corners_f_C.size < min_size:
             print("---- Filtered Dart Not Detected -----")
             return False, None, None, None
         return True, corners_f_R, corners_f_L, corners_f_C
 
+    def line_corners(self, corners_f, blur):
+        ''' the corners along the dart line, None when the camera has too few corners to fit it '''
+        if corners_f is None or corners_f.size < self.constants.FILTERED_CORNERS_MIN_SIZE:
+            return None
+        rows, cols = blur.shape[:2]
+        corners_final = filterCornersLine(corners_f, rows, cols)
+        return corners_final if len(corners_final) else None
+
     def dart_detection(self):
         #applies frame subtraction
-        t_plus_R, self.blur_R = diff2blur(self.cam_R, self.t_R)
-        t_plus_L, self.blur_L = diff2blur(self.cam_L, self.t_L)
-        t_plus_C, self.blur_C = diff2blur(self.cam_C, self.t_C)
+        t_plus_R, self.blur_R = diff2blur(self.cam_R, self.t_R, self.workspaces['right'], self.blur_backend)
+        t_plus_L, self.blur_L = diff2blur(self.cam_L, self.t_L, self.workspaces['left'], self.blur_backend)
+        t_plus_C, self.blur_C = diff2blur(self.cam_C, self.t_C, self.workspaces['center'], self.blur_backend)
+
+        threshold = self.constants.DIFF_THRESHOLD
+        self.thresh_R = self.threshold_blur('right', self.blur_R, threshold)
+        self.thresh_L = self.threshold_blur('left', self.blur_L, threshold)
+        self.thresh_C = self.threshold_blur('center', self.blur_C, threshold)
+
+        if self.segmentation == 'components':
+            return self.component_detection()
 
         found_corner_detection, corners_R, corners_L, corners_C = self.corner_detection(self.blur_R, self.blur_L, self.blur_C)
         if not found_corner_detection:
@@ -154,49 +305,70 @@ class DartBoard_CV:
         if not found_filter_corner_detection:
             return False
 
-        rows, cols = self.blur_R.shape[:2]
-        self.corners_final_R = filterCornersLine(corners_f_R, rows, cols)
-        rows, cols = self.blur_L.shape[:2]
-        self.corners_final_L = filterCornersLine(corners_f_L, rows, cols)
-        rows, cols = self.blur_C.shape[:2]
-        self.corners_final_C = filterCornersLine(corners_f_C, rows, cols)
+        # only the cameras that saw the dart, the others stay None (like the components path)
+        self.corners_final_R = self.line_corners(corners_f_R, self.blur_R)
+        self.corners_final_L = self.line_corners(corners_f_L, self.blur_L)
+        self.corners_final_C = self.line_corners(corners_f_C, self.blur_C)
 
         #final dart detection
-        _,self.thresh_R = cv2.threshold(self.blur_R, 60, 255, 0)
-        _, self.thresh_L = cv2.threshold(self.blur_L, 60, 255, 0)
-        _, self.thresh_C = cv2.threshold(self.blur_C, 60, 255, 0)
+        max_pixels = self.constants.DART_MAX_PIXELS
+        if cv2.countNonZero(self.thresh_R) > max_pixels or cv2.countNonZero(self.thresh_L) > max_pixels or cv2.countNonZero(self.thresh_C) > max_pixels:
+            return False
+
+        print("Dart detected")
+        return True
 
-        if cv2.countNonZero(self.thresh_R) > 15000 or cv2.countNonZero(self.thresh_L) > 15000 or cv2.countNonZero(self.thresh_C) > 15000:
+    def component_detection(self):
+        ''' Finds the dart as a connected component of the threshold images (see dart_segmentation.py) '''
+        max_pixels = self.constants.DART_MAX_PIXELS
+        if cv2.countNonZero(self.thresh_R) > max_pixels or cv2.countNonZero(self.thresh_L) > max_pixels or cv2.countNonZero(self.thresh_C) > max_pixels:
+            return False
+
+        for mount, thresh in (('right', self.thresh_R), ('left', self.thresh_L), ('center', self.thresh_C)):
+            self.segments[mount] = segment_dart(thresh, self.constants.SEGMENT_MIN_AREA, self.constants.SEGMENT_MIN_ELONGATION)
+        if all(segment is None for segment in self.segments.values()):
+            print("---- Dart Not Detected -----")
             return False
 
         print("Dart detected")
         return True
+
+    def threshold_blur(self, mount, blur, threshold):
+        ws = self.workspaces[mount]
+        _, thresh = cv2.threshold(blur, threshold, 255, 0, dst=ws.get('thresh'))
+        return ws.keep('thresh', thresh)
     
     def getRealLocation(self, mount):
+        if self.segmentation == 'components':
+            return self.component_location(mount)
+
         if mount == "right":
             blur = self.blur_R
             prev_tip_point = self.prev_tip_point_R
             kalman_filter = self.kalman_filter_R
             corners_final = self.corners_final_R
-            loc = np.argmax(corners_final, axis=0)
         elif mount == "center":
             blur = self.blur_C
             prev_tip_point = self.prev_tip_point_C
             kalman_filter = self.kalman_filter_C    
             corners_final = self.corners_final_C
-            loc = np.argmin(corners_final, axis=0)
         elif mount == "left":
             blur = self.blur_L
             prev_tip_point = self.prev_tip_point_L
             kalman_filter = self.kalman_filter_L 
             corners_final = self.corners_final_L
-            loc = np.argmin(corners_final, axis=0)
+        if corners_final is None:
+            return None, None
+        loc = np.argmax(corners_final, axis=0) if mount == "right" else np.argmin(corners_final, axis=0)
 
         locationofdart = corners_final[loc]
         
         # Skeletonize the dart contour
         dart_contour = corners_final.reshape((-1, 1, 2))
-        skeleton = cv2.ximgproc.thinning(cv2.drawContours(np.zeros_like(blur), [dart_contour], -1, 255, thickness=cv2.FILLED))
+        ws = self.workspaces[mount]
+        mask = cv2.drawContours(ws.zeros_like('mask', blur), [dart_contour], -1, 255, thickness=cv2.FILLED)
+        # thinning always allocates its output (it ignores dst), only once per dart though
+        skeleton = cv2.ximgproc.thinning(mask)
         
         # Detect the dart tip using skeletonization and Kalman filter
         dart_tip = self.find_dart_tip(skeleton, prev_tip_point, mount)
@@ -211,6 +383,24 @@ class DartBoard_CV:
         
         return locationofdart, dart_tip
 
+    def component_location(self, mount):
+        segment = self.segments[mount]
+        if segment is None:
+            return None, None
+        tip_x, tip_y = segment['tip']
+        self.track_tip(mount, tip_x, tip_y)
+        blur = {'right': self.blur_R, 'left': self.blur_L, 'center': self.blur_C}[mount]
+        if blur is not None:
+            cv2.circle(blur, (tip_x, tip_y), 5, (0, 255, 0), 2)
+        return (tip_x, tip_y), (tip_x, tip_y)
+
+    def track_tip(self, mount, tip_x, tip_y):
+        # Predict the dart tip position, then update the Kalman filter with the observed dart tip position
+        kalman_filter = {'right': self.kalman_filter_R, 'left': self.kalman_filter_L, 'center': self.kalman_filter_C}[mount]
+        predicted_tip = kalman_filter.predict()
+        kalman_filter.update(np.array([[tip_x], [tip_y]]))
+        return predicted_tip
+
     def find_dart_tip(self,skeleton, prev_tip_point, mount):
 
 
@@ -222,14 +412,14 @@ class DartBoard_CV:
             dart_contour = max(contours, key=cv2.contourArea)
 
             # Convert the contour to a Shapely Polygon
-            dart_polygon = Polygon(dart_contour.reshape(-1, 2))
+            dart_polygon = geometry.Polygon(dart_contour.reshape(-1, 2))
 
             # Find the lowest point of the dart contour
             dart_points = dart_polygon.exterior.coords
             lowest_point = max(dart_points, key=lambda x: x[1])
 
             # Adjust the tip coordinates by half of the tip's diameter
-            tip_radius_px = constants['TIP_RADIUS_MM'] * constants['PIXELS_PER_MM']
+            tip_radius_px = self.constants.TIP_RADIUS_MM * self.constants.PIXELS_PER_MM
 
             # Determine the adjustment direction based on the camera's perspective
             adjustment_direction = 0  # Adjust towards the dartboard center (negative direction)
@@ -238,20 +428,7 @@ class DartBoard_CV:
             adjusted_tip_x = lowest_point[0] + adjustment_direction * tip_radius_px
             adjusted_tip_y = lowest_point[1]
 
-            if mount == "right":
-                # Predict the dart tip position using the Kalman filter
-                predicted_tip = self.kalman_filter_R.predict()
-                
-                # Update the Kalman filter with the observed dart tip position
-                self.kalman_filter_R.update(np.array([[adjusted_tip_x], [adjusted_tip_y]]))
-            
-            elif mount == "center":
-                predicted_tip = self.kalman_filter_C.predict()
-                self.kalman_filter_R.update(np.array([[adjusted_tip_x], [adjusted_tip_y]]))
-
-            elif mount == "left":
-                predicted_tip = self.kalman_filter_L.predict()
-                self.kalman_filter_L.update(np.array([[adjusted_tip_x], [adjusted_tip_y]]))
+            predicted_tip = self.track_tip(mount, adjusted_tip_x, adjusted_tip_y)
 
             return int(adjusted_tip_x), int(adjusted_tip_y)
         
@@ -269,9 +446,8 @@ class DartBoard_CV:
         return None
         
     def transform_score(self, majority_camera_index):
-        x, y = self.dart_coordinates
-        inverse_matrix = cv2.invert(self.perspective_matrices[majority_camera_index])[1]
-        transformed_coords = cv2.perspectiveTransform(np.array([[[x, y]]], dtype=np.float32), inverse_matrix)[0][0]
+        # same transform (and camera bias) as the score of that camera
+        transformed_coords = transform_to_board([self.dart_coordinates], majority_camera_index, self.context)[0]
         self.dart_coordinates = tuple(map(int, transformed_coords))
 
 
@@ -279,46 +455,71 @@ class DartBoard_CV:
         locationofdart_R, self.prev_tip_point_R = self.getRealLocation("right")
         locationofdart_L, self.prev_tip_point_L = self.getRealLocation("left")
         locationofdart_C, self.prev_tip_point_C = self.getRealLocation("center")
-
-        self.camera_scores = get_score(locationofdart_R, locationofdart_L, locationofdart_C)
+        if self.preview is not None:
+            for mount, location, corners in (('right', locationofdart_R, self.corners_final_R),
+                                             ('left', locationofdart_L, self.corners_final_L),
+                                             ('center', locationofdart_C, self.corners_final_C)):
+                self.preview.annotate(mount, corners if self.segmentation == 'corners' else None, location)
+
+        # (x, y) of every camera that found the dart: the corners path gives an array when the tip was not found
+        locationofdart_R, locationofdart_L, locationofdart_C = (
+            None if location is None else tuple(float(v) for v in np.ravel(location)[:2])
+            for location in (locationofdart_R, locationofdart_L, locationofdart_C))
+        self.camera_tips = [locationofdart_R, locationofdart_L, locationofdart_C]
+        self.camera_hits = get_hits(locationofdart_R, locationofdart_L, locationofdart_C, self.context)
+        self.camera_scores = [hit[0] if hit is not None else None for hit in self.camera_hits]
 
         self.majority_score = self.calculate_majority_score()
         
         if self.majority_score is not None:
             majority_camera_index = self.camera_scores.index(self.majority_score)
+            self.majority_hit = self.camera_hits[majority_camera_index]
             self.dart_coordinates = (locationofdart_R, locationofdart_L, locationofdart_C)[majority_camera_index]
             self.transform_score(majority_camera_index)
+            self.visit_hits.append(self.dart_coordinates)
             print(f"Final Score (Majority Rule): {self.majority_score}")
         else:
+            self.majority_hit = None
             print("No majority score found.")
 
 
-    def takeout_procedure(self):
-        if cv2.countNonZero(self.thresh_R) > constants['TAKEOUT_THRESHOLD'] or cv2.countNonZero(self.thresh_L) > constants['TAKEOUT_THRESHOLD'] or cv2.countNonZero(self.thresh_C) > constants['TAKEOUT_THRESHOLD']:
+    def check_takeout(self):
+        ''' 
+        Checks (with the counts from the last check_thresholds) if the darts are being removed. If so the 
+        dart variables are reset, the caller then has to wait TAKEOUT_DELAY while updating the reference frames
+        '''
+        if any(non_zero > self.constants.TAKEOUT_THRESHOLD for non_zero in self.non_zero_counts):
             #reset variables
             self.prev_tip_point_R = None
             self.prev_tip_point_L = None
             self.prev_tip_point_C = None
             self.majority_score = None
+            self.majority_hit = None
             self.dart_coordinates = None
+            self.visit_hits = []
+            if self.preview is not None:
+                self.preview.clear_annotations()
+            return True
+        return False
 
+    def takeout_procedure(self):
+        if self.check_takeout():
             # Wait for the specified delay to allow hand removal
             start_time = time.time()
-            while time.time() - start_time < constants['TAKEOUT_DELAY']:
+            while time.time() - start_time < self.constants.TAKEOUT_DELAY:
                 self.update_reference_frame()
                 time.sleep(0.1)
 
             print("Takeout procedure completed.")
+            return True
+        return False
 
     def plot_score(self):
-        # Display the scores and dart coordinates on the dartboard image
-        dartboard_image_copy = self.dartboard_image.copy()
-        if self.majority_score is not None:
-            cv2.putText(dartboard_image_copy, f"Majority Score: {self.majority_score}", (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2, cv2.LINE_AA)
-        if self.dart_coordinates is not None:
-            x, y = self.dart_coordinates
-            cv2.circle(dartboard_image_copy, (int(x), int(y)), 5, (0, 0, 255), -1)
-        cv2.imshow('Dartboard', dartboard_image_copy)
+        # Display the scores and the visit's darts on the dartboard image, only redrawn/shown when they changed
+        if self.renderer is None:
+            self.renderer = BoardRenderer(self.dartboard_image)
+        if self.renderer.update(self.visit_hits, self.majority_score):
+            cv2.imshow('Dartboard', self.renderer.frame)
 
 
 
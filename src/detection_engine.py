@@ -0,0 +1,236 @@
+"""
+detection_engine.py
+
+Function:
+This file holds the detection engines the SocketIO app can run. They all produce event_bus.ScoreEvents and hand
+them to the app through the on_event callback, so the app does not care where the darts come from:
+
+    SimulatedEngine  random darts every few seconds (what darts_cv_simulation.DartDetection used to do)
+    ReplayEngine     replays a recording (.jsonl of ScoreEvents) with the original timing
+    LiveEngine       opens the cameras and runs the real cv pipeline (DartBoard) on its own thread
+
+Any engine can also record the events it produces (record_path), which is how the recordings for ReplayEngine
+are made.
+"""
+import abc
+import json
+import math
+import queue
+import random
+import threading
+import time
+
+from board_layout import get_layout
+from cv_context import get_context
+from event_bus import ScoreEvent
+
+
+class DetectionEngine(abc.ABC):
+    name = None
+
+    def __init__(self, socketio, on_event, board_id="board", record_path=None):
+        self.socketio = socketio
+        self.on_event = on_event
+        self.board_id = board_id
+        self.record_path = record_path
+        self.cv_running = False
+        self.seq = 0
+        self._record_file = None
+
+    def initialize(self):
+        """ Opens whatever the engine needs (cameras, recording) before the darts start coming in """
+        pass
+
+    def start(self):
+        if not self.cv_running:
+            self.cv_running = True
+            if self.record_path is not None and self._record_file is None:
+                self._record_file = open(self.record_path, "a")
+            self.socketio.start_background_task(self.run)
+
+    def stop(self):
+        self.cv_running = False #stop the dart deteciton
+
+    def close(self):
+        """ Stops the engine and releases what initialize/start opened, when the app exits """
+        self.stop()
+        if self._record_file is not None:
+            self._record_file.close()
+            self._record_file = None
+
+    @abc.abstractmethod
+    def run(self):
+        """ Produces the events (through emit) while cv_running, started as a background task by start() """
+
+    def emit(self, event):
+        self.seq += 1
+        event.seq = self.seq
+        event.board_id = self.board_id
+        if self._record_file is not None:
+            self._record_file.write(json.dumps(event.to_dict()) + "\n")
+            self._record_file.flush()
+        self.on_event(event)
+
+
+class SimulatedEngine(DetectionEngine):
+    name = "simulated"
+
+    def __init__(self, socketio, on_event, interval=5.0, **kwargs):
+        super().__init__(socketio, on_event, **kwargs)
+        self.interval = interval
+
+    def generate_random_hit(self):
+        """ (score, sector, ring) in the same form as utils.classify_hit """
+        dartboard_numbers = list(range(1, 21)) + [25] #25 is bullseye
+        sector = random.choice(dartboard_numbers)
+
+        if sector == 25: #no triple for bullseye
+            return random.choice([(50, 25, 'inner_bull'), (25, 25, 'outer_bull')])
+
+        ring = random.choices(["inner_single", "outer_single", "double", "triple"], weights=[30, 30, 20, 20])[0]
+        multiplier = {'double': 2, 'triple': 3}.get(ring, 1)
+        return sector * multiplier, sector, ring
+
+    def board_location(self, sector, ring):
+        """ A point inside the segment, so the simulated darts can be plotted like real ones """
+        constants = get_context().constants
+        radii = {
+            'inner_bull': (0, constants.BULLSEYE_RADIUS_PX),
+            'outer_bull': (constants.BULLSEYE_RADIUS_PX, constants.OUTER_BULL_RADIUS_PX),
+            'inner_single': (constants.OUTER_BULL_RADIUS_PX, constants.TRIPLE_RING_INNER_RADIUS_PX),
+            'triple': (constants.TRIPLE_RING_INNER_RADIUS_PX, constants.TRIPLE_RING_OUTER_RADIUS_PX),
+            'outer_single': (constants.TRIPLE_RING_OUTER_RADIUS_PX, constants.DOUBLE_RING_INNER_RADIUS_PX),
+            'double': (constants.DOUBLE_RING_INNER_RADIUS_PX, constants.DOUBLE_RING_OUTER_RADIUS_PX),
+        }[ring]
+        radius = random.uniform(*radii)
+        if sector == 25:
+            angle = random.uniform(0, 2 * math.pi)
+        else:
+            layout = get_layout(constants)
+            angle = layout.sector_center_angle(sector) + (random.random() - 0.5) * 2 * math.pi / 20
+        return constants.center[0] + radius * math.cos(angle), constants.center[1] + radius * math.sin(angle)
+
+    def run(self):
+        while self.cv_running:
+            self.socketio.sleep(self.interval)  # Simulate deteciton time
+            if not self.cv_running:
+                break
+            score, sector, ring = self.generate_random_hit()
+            board_x, board_y = self.board_location(sector, ring)
+            self.emit(ScoreEvent(score=score, sector=sector, ring=ring, board_x=board_x, board_y=board_y,
+                                 confidence=1.0))
+
+
+class ReplayEngine(DetectionEngine):
+    name = "replay"
+
+    def __init__(self, socketio, on_event, recording_path, speed=1.0, loop=False, **kwargs):
+        super().__init__(socketio, on_event, **kwargs)
+        self.recording_path = recording_path
+        self.speed = speed
+        self.loop = loop
+        self.events = []
+
+    def initialize(self):
+        with open(self.recording_path) as file:
+            self.events = [json.loads(line) for line in file if line.strip()]
+        print(f"Loaded {len(self.events)} events from {self.recording_path}")
+
+    def run(self):
+        while self.cv_running and self.events:
+            start = time.time()
+            first = self.events[0]['detected_at']
+            for data in self.events:
+                # keep the recorded spacing between the events
+                delay = (data['detected_at'] - first) / self.speed - (time.time() - start)
+                if delay > 0:
+                    self.socketio.sleep(delay)
+                if not self.cv_running:
+                    return
+                event = ScoreEvent.from_dict(dict(data, detected_at=time.time(), published_at=None))
+                self.emit(event)
+            if not self.loop:
+                break
+        self.cv_running = False
+
+
+class QueuePublisher:
+    """ Stands in for event_bus.ScorePublisher when DartBoard runs in the same process as the app """
+
+    def __init__(self):
+        self.events = queue.Queue()
+
+    def publish(self, event):
+        self.events.put(event)
+        return event
+
+
+class LiveEngine(DetectionEngine):
+    name = "live"
+
+    def __init__(self, socketio, on_event, camera_ids=None, **kwargs):
+        super().__init__(socketio, on_event, **kwargs)
+        self.camera_ids = camera_ids
+        self.cameras = None
+        self.dartboard = None
+        self.publisher = QueuePublisher()
+        self._thread = None
+
+    def initialize(self):
+        from capture import open_cameras
+        from darts import DartBoard
+
+        if self.cv_running:
+            # start_game while the game runs: keep the running board (start() would not run a new one anyway)
+            return
+        if self._thread is not None:
+            # stopped but maybe not done with its last step, only one board may read the cameras
+            self._thread.join()
+            self._thread = None
+        camera_ids = self.camera_ids or get_context().constants.CAMERA_ID
+        if self.cameras is None:
+            self.cameras = open_cameras(camera_ids)
+        if self.cameras is None or not all(cam.isOpened() for cam in self.cameras):
+            raise RuntimeError(f"Failed to open one or more cameras {list(camera_ids)}")
+        self.dartboard = DartBoard(*self.cameras, publisher=self.publisher, show_display=False)
+
+    def start(self):
+        if self.cv_running:
+            return
+        super().start()
+        # the cv loop is blocking (opencv calls), so it gets a real thread, the events come back through the queue
+        self._thread = threading.Thread(target=self.dartboard.run_loop, name=f"cv-{self.board_id}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        super().stop()
+        if self.dartboard is not None:
+            self.dartboard.stop()
+
+    def close(self):
+        super().close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.cameras is not None:
+            for cam in self.cameras:
+                cam.release()
+            self.cameras = None
+
+    def run(self):
+        while self.cv_running or not self.publisher.events.empty():
+            try:
+                while True:
+                    self.emit(self.publisher.events.get_nowait())
+            except queue.Empty:
+                pass
+            self.socketio.sleep(0.02)
+
+
+ENGINES = {engine.name: engine for engine in (SimulatedEngine, ReplayEngine, LiveEngine)}
+
+
+def create_engine(name, socketio, on_event, **kwargs):
+    if name not in ENGINES:
+        raise ValueError(f"Unknown detection engine '{name}', pick one of {', '.join(ENGINES)}")
+    return ENGINES[name](socketio, on_event, **kwargs)
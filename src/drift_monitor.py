@@ -0,0 +1,205 @@
+"""
+drift_monitor.py
+
+Function:
+This file watches the calibration while the board is used. A camera that gets bumped keeps scoring with its old
+perspective matrix (perspective_matrix_camera_{i}.npz), and the only sign used to be a run of wrong scores.
+
+Now and then, while the board is idle and nothing moves (DartBoard.idle_step), one camera (in turn) takes a color
+frame and the board is found again with auto_calibration.auto_calibrate. The drift is how far the stored and the
+new matrix put the board apart (mean/max, camera pixels and mm). Then:
+    below DRIFT_IGNORE_MM:            nothing to do (noise)
+    up to DRIFT_REFINE_MAX_MM:        the stored matrix is moved DRIFT_REFINE_RATE of the way to the new one and
+                                      saved, if the new one is good (reprojection error, inliers)
+    more (or a poor fit):             nothing is changed, the camera is reported as drifted (recalibrate)
+The checks are budgeted: at most one camera per idle step, not before DRIFT_CHECK_INTERVAL seconds after the last
+check, and never more than DRIFT_MAX_DUTY of the time (a slow check pushes the next one further away). They never
+start while darts are being thrown (the board is active then).
+
+The fit itself (tens of ms) runs on the monitor's own thread: the idle step only takes the frame the camera already
+has (retrieve after the step's read/grab, no waiting for a new one) and hands a copy over. The result, and the
+refined matrix, are applied by a later idle step, so the matrices only change on the board's thread and a dart
+that lands during a check is seen on time. A fit that fails (opencv, singular matrix) is reported as 'error'.
+"""
+import os
+import queue
+import threading
+import time
+
+from auto_calibration import auto_calibrate, matrix_drift, up_point_from
+from capture import to_bgr
+from cv_context import lazy_import
+
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+
+OK, REFINED, DRIFTED, UNCERTAIN, NOT_FOUND, ERROR = 'ok', 'refined', 'drifted', 'uncertain', 'not_found', 'error'
+
+
+def blend_matrices(old, new, rate):
+    ''' moves old rate of the way to new (both scaled so [2, 2] is 1, fine for the small drifts refined here) '''
+    old = old / old[2, 2]
+    new = new / new[2, 2]
+    return old + rate * (new - old)
+
+
+def save_matrix(path, matrix):
+    # atomic, the scoring code or the calibration page may be loading it
+    tmp_path = f"{path[:-len('.npz')]}.{os.getpid()}.tmp.npz"
+    np.savez(tmp_path, matrix=matrix)
+    os.replace(tmp_path, path)
+
+
+class DriftMonitor:
+
+    def __init__(self, context):
+        self.context = context
+        self.next_check = time.monotonic() + context.constants.DRIFT_CHECK_INTERVAL
+        self.next_camera = 0
+        self.checks = 0
+        self.refinements = 0
+        self.errors = 0
+        self.check_seconds = 0.0
+        self.cameras = {}  # camera index -> result of its last check
+        self._jobs = queue.Queue()
+        self._done = queue.Queue()
+        self._busy = False  # a check was handed to the thread and its result not applied yet
+        self._thread = None
+
+    @property
+    def constants(self):
+        return self.context.constants
+
+    def due(self, now):
+        return self.constants.DRIFT_CHECK_INTERVAL > 0 and now >= self.next_check
+
+    def idle_check(self, now, cameras):
+        '''
+        Called from the idle step when nothing moves (cameras are in camera index order). Applies the result of a
+        finished check and returns it (else None), then hands the next camera's frame to the thread when a check
+        is due. Never waits for the fit
+        '''
+        result = self.apply_done()
+        if self._busy or not self.due(now):
+            return result
+        camera_index = self.next_camera
+        self.next_camera = (self.next_camera + 1) % len(cameras)
+        # the frame the step just read/grabbed, copied: the capture reuses its buffer
+        ret, frame = cameras[camera_index].retrieve()
+        self.next_check = now + self.constants.DRIFT_CHECK_INTERVAL
+        if ret and frame is not None:
+            self.start()
+            self._busy = True
+            self._jobs.put((camera_index, frame.copy(), self.context.perspective_matrices[camera_index]))
+        return result
+
+    def apply_done(self):
+        ''' On the board's thread: the result of a finished check (refines the matrix), None when there is none '''
+        try:
+            camera_index, stored, result, refined, elapsed = self._done.get_nowait()
+        except queue.Empty:
+            return None
+        self._busy = False
+        self.check_seconds += elapsed
+        # a slow check pushes the next one further away
+        self.next_check = max(self.next_check, time.monotonic() + elapsed / self.constants.DRIFT_MAX_DUTY)
+        if refined is not None:
+            if self.context.perspective_matrices[camera_index] is stored:
+                self.refine(camera_index, refined)
+            else:
+                # recalibrated (or reloaded) during the check, the refinement was for the old matrix
+                result['status'] = UNCERTAIN
+        return self.record(result)
+
+    def check(self, camera_index, frame):
+        ''' Compares a color frame of the board with the stored matrix of the camera, refines it when it is safe '''
+        stored = self.context.perspective_matrices[camera_index]
+        result, refined = self.evaluate(camera_index, frame, stored)
+        if refined is not None:
+            self.refine(camera_index, refined)
+        return self.record(result)
+
+    def evaluate(self, camera_index, frame, stored):
+        ''' (result, refined matrix or None), touches nothing so it can run on the thread '''
+        constants = self.constants
+        result = {'camera': camera_index}
+        try:
+            fit = auto_calibrate(frame, constants, up_point_from(stored, constants))
+            if fit is None:
+                result['status'] = NOT_FOUND
+                return result, None
+            mean_px, max_px, mean_mm, max_mm = matrix_drift(stored, fit.matrix, constants)
+        except (cv2.error, np.linalg.LinAlgError, ValueError) as e:
+            result.update(status=ERROR, error=str(e))
+            return result, None
+        result.update({'drift_px': mean_px, 'max_drift_px': max_px, 'drift_mm': mean_mm, 'max_drift_mm': max_mm,
+                       'fit_error_mm': fit.error_mm, 'inliers': fit.inliers, 'pairs': fit.pairs})
+        confident = (fit.error_mm <= constants.AUTO_CAL_MAX_ERROR_MM
+                     and fit.inliers >= constants.DRIFT_MIN_INLIERS * fit.pairs)
+        if mean_mm < constants.DRIFT_IGNORE_MM:
+            result['status'] = OK
+        elif not confident:
+            result['status'] = UNCERTAIN
+        elif max_mm <= constants.DRIFT_REFINE_MAX_MM:
+            result['status'] = REFINED
+            return result, blend_matrices(stored, fit.matrix, constants.DRIFT_REFINE_RATE)
+        else:
+            result['status'] = DRIFTED
+        return result, None
+
+    def record(self, result):
+        self.checks += 1
+        if result['status'] == ERROR:
+            self.errors += 1
+        result['checked_at'] = time.time()
+        self.cameras[result['camera']] = result
+        if result['status'] in (DRIFTED, UNCERTAIN, REFINED, ERROR):
+            print(f"Calibration drift: {self.summary(result)}")
+        return result
+
+    def refine(self, camera_index, refined):
+        save_matrix(self.context.matrix_path(camera_index), refined)
+        # the scoring code picks the new matrices up on the next dart
+        self.context.reload_perspective_matrices()
+        self.refinements += 1
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="drift-monitor", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self._jobs.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            camera_index, frame, stored = job
+            start = time.perf_counter()
+            result, refined = self.evaluate(camera_index, to_bgr(frame), stored)
+            self._done.put((camera_index, stored, result, refined, time.perf_counter() - start))
+
+    @staticmethod
+    def summary(result):
+        if 'error' in result:
+            return f"camera {result['camera']} {result['status']}: {result['error']}"
+        if 'drift_mm' not in result:
+            return f"camera {result['camera']} {result['status']}"
+        return (f"camera {result['camera']} {result['status']}, drift {result['drift_mm']:.2f} mm "
+                f"(max {result['max_drift_mm']:.2f} mm, {result['drift_px']:.1f} px)")
+
+    def metrics(self):
+        return {
+            'checks': self.checks,
+            'refinements': self.refinements,
+            'errors': self.errors,
+            'busy': self._busy,
+            'check_seconds': self.check_seconds,
+            'cameras': {index: dict(result) for index, result in sorted(self.cameras.items())},
+        }
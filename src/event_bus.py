@@ -0,0 +1,172 @@
+"""
+event_bus.py
+
+Function:
+This file is the link between the cv process (main.py) and the SocketIO server that talks to the user app.
+The cv loop publishes score events, a sender thread batches them and sends them as datagrams over a local unix
+socket, and the server side (ScoreSubscriber) reads them and emits them to the browsers.
+
+The cv loop can never be slowed down by the app: publish() only appends to a bounded buffer, when the buffer is
+full the oldest events are dropped, and if the server is not running or not reading fast enough (socket buffer
+full) the batch is dropped instead of waiting. Bursts are sent as one datagram, and status events that have a key
+(ie: the board state) are coalesced so only the latest one is sent.
+"""
+import collections
+import json
+import os
+import socket
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+
+DEFAULT_SOCKET_PATH = "/tmp/dartboard_events.sock"
+MAX_BATCH = 64
+
+
+@dataclass
+class ScoreEvent:
+    kind: str = "dart_detected"
+    score: int = None
+    sector: int = None           # board number, 25 for the bulls, 0 for a miss
+    ring: str = None             # see utils.classify_hit
+    board_x: float = None        # location on the drawn dartboard (DartBoard_CV.dart_coordinates)
+    board_y: float = None
+    confidence: float = None     # fraction of the cameras that agree with the final score
+    camera_scores: list = None
+    player: str = None           # who threw it (DartBoard.player), when the app said so
+    throw_id: int = None         # row of the throw in the throw log (throw_log.py), to correct it later
+    board_id: str = "board"
+    seq: int = 0
+    key: str = None              # events with the same key are coalesced, None means always deliver
+    info: dict = None            # data of the status events (ie: calibration_drift)
+    detected_at: float = field(default_factory=time.time)
+    published_at: float = None
+
+    def to_dict(self):
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+    def to_app(self):
+        ''' Payload in the form the user app already understands (score, is_double, is_triple) plus the extra info '''
+        payload = self.to_dict()
+        if self.ring in ('inner_bull', 'outer_bull'):
+            payload.update(score=25, is_double=self.ring == 'inner_bull', is_triple=False)
+        else:
+            payload.update(score=self.sector, is_double=self.ring == 'double', is_triple=self.ring == 'triple')
+        payload['total'] = self.score
+        return payload
+
+
+class ScorePublisher:
+
+    def __init__(self, socket_path=DEFAULT_SOCKET_PATH, board_id="board", max_pending=256):
+        self.socket_path = socket_path
+        self.board_id = board_id
+        self._pending = collections.deque()
+        self._max_pending = max_pending
+        self._condition = threading.Condition()
+        self._seq = 0
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.setblocking(False)
+        self._thread = None
+        self._running = False
+        self.sent = 0
+        self.dropped = 0
+
+    def publish(self, event):
+        ''' Never blocks. Returns the event (with its sequence number) '''
+        with self._condition:
+            self._seq += 1
+            event.seq = self._seq
+            event.board_id = self.board_id
+            if len(self._pending) >= self._max_pending:
+                self._pending.popleft()
+                self.dropped += 1
+            self._pending.append(event)
+            self._condition.notify()
+        return event
+
+    def start(self):
+        if self._thread is None:
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name="score-publisher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is None:
+            return
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        self._thread.join()
+        self._thread = None
+        self._sock.close()
+
+    def _take_batch(self):
+        with self._condition:
+            while self._running and not self._pending:
+                self._condition.wait()
+            events = list(self._pending)
+            self._pending.clear()
+
+        # only the latest event per key survives, unkeyed events are all kept (in order)
+        latest = {event.key: i for i, event in enumerate(events) if event.key is not None}
+        self.dropped += sum(1 for event in events if event.key is not None) - len(latest)
+        return [event for i, event in enumerate(events) if event.key is None or latest[event.key] == i]
+
+    def _send(self, events):
+        now = time.time()
+        for event in events:
+            event.published_at = now
+        data = json.dumps([event.to_dict() for event in events]).encode()
+        try:
+            self._sock.sendto(data, self.socket_path)
+            self.sent += len(events)
+        except (FileNotFoundError, ConnectionRefusedError, BlockingIOError, OSError):
+            # no server, or it is not keeping up: drop rather than wait
+            self.dropped += len(events)
+
+    def _run(self):
+        while True:
+            events = self._take_batch()
+            for i in range(0, len(events), MAX_BATCH):
+                self._send(events[i:i + MAX_BATCH])
+            if not self._running:
+                break
+
+
+class ScoreSubscriber:
+
+    def __init__(self, socket_path=DEFAULT_SOCKET_PATH, buffer_size=1 << 20):
+        self.socket_path = socket_path
+        if os.path.exists(socket_path):
+            os.remove(socket_path)  # left over from a previous run
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, buffer_size)
+        self._sock.bind(socket_path)
+        self._sock.setblocking(False)
+        self.received = 0
+
+    def poll(self):
+        ''' Returns every event that has arrived so far (never blocks, so it is safe in a green thread) '''
+        events = []
+        while True:
+            try:
+                data = self._sock.recv(1 << 20)
+            except (BlockingIOError, InterruptedError):
+                break
+            try:
+                events.extend(ScoreEvent.from_dict(item) for item in json.loads(data))
+            except (ValueError, TypeError) as e:
+                print(f"Ignoring a malformed score event: {str(e)}")
+        self.received += len(events)
+        return events
+
+    def close(self):
+        self._sock.close()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
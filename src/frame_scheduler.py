@@ -0,0 +1,87 @@
+"""
+frame_scheduler.py
+
+Function:
+This file decides how often the board looks for movement. While nobody is playing the board is 'idle': only one
+camera is read and checked every IDLE_POLL_INTERVAL seconds (the other cameras only grab, so their buffers stay
+fresh without decoding). As soon as movement is seen the board switches to 'active' (all three cameras every
+ACTIVE_POLL_INTERVAL), and goes back to idle after IDLE_QUIET_PERIOD seconds without movement.
+
+It also keeps the metrics: the current mode, time and cpu time spent in each mode, and an estimate of the cpu
+saved compared to always running at the active rate.
+"""
+import time
+
+IDLE = 'idle'
+ACTIVE = 'active'
+
+
+class AdaptiveScheduler:
+
+    def __init__(self, constants, start_mode=ACTIVE):
+        self.constants = constants
+        self.mode = start_mode
+        now = time.monotonic()
+        self.last_motion = now
+        self.mode_since = now
+        self.mode_changes = 0
+        self.time_in = {IDLE: 0.0, ACTIVE: 0.0}
+        self.cpu_in = {IDLE: 0.0, ACTIVE: 0.0}
+        self.steps_in = {IDLE: 0, ACTIVE: 0}
+
+    def interval(self):
+        if self.mode == IDLE:
+            return self.constants.IDLE_POLL_INTERVAL
+        return self.constants.ACTIVE_POLL_INTERVAL
+
+    def _switch(self, mode, now):
+        self.time_in[self.mode] += now - self.mode_since
+        self.mode = mode
+        self.mode_since = now
+        self.mode_changes += 1
+        print(f"Frame scheduler: switched to {mode}")
+
+    def on_motion(self, now=None):
+        ''' Returns True if this woke the board up '''
+        now = time.monotonic() if now is None else now
+        self.last_motion = now
+        if self.mode == IDLE:
+            self._switch(ACTIVE, now)
+            return True
+        return False
+
+    def update(self, now=None):
+        ''' Called before every step, returns True when the board just went idle '''
+        now = time.monotonic() if now is None else now
+        if self.mode == ACTIVE and now - self.last_motion > self.constants.IDLE_QUIET_PERIOD:
+            self._switch(IDLE, now)
+            return True
+        return False
+
+    def record_step(self, cpu_seconds):
+        self.steps_in[self.mode] += 1
+        self.cpu_in[self.mode] += cpu_seconds
+
+    def metrics(self):
+        now = time.monotonic()
+        time_in = dict(self.time_in)
+        time_in[self.mode] += now - self.mode_since
+        total_time = time_in[IDLE] + time_in[ACTIVE]
+        total_cpu = self.cpu_in[IDLE] + self.cpu_in[ACTIVE]
+
+        # cpu it would have taken to stay active the whole time, at the cpu rate measured while active
+        cpu_saved = None
+        if time_in[ACTIVE] > 0 and self.cpu_in[ACTIVE] > 0:
+            projected_cpu = self.cpu_in[ACTIVE] / time_in[ACTIVE] * total_time
+            cpu_saved = max(0.0, 1.0 - total_cpu / projected_cpu)
+
+        return {
+            'mode': self.mode,
+            'mode_changes': self.mode_changes,
+            'idle_seconds': time_in[IDLE],
+            'active_seconds': time_in[ACTIVE],
+            'idle_steps': self.steps_in[IDLE],
+            'active_steps': self.steps_in[ACTIVE],
+            'cpu_seconds': total_cpu,
+            'cpu_saved': cpu_saved,
+        }
@@ -0,0 +1,40 @@
+"""
+frame_workspace.py
+
+Function:
+This file keeps the image buffers of one camera between iterations. Every step of the image pipeline (gray frame,
+diff, blur, threshold, contour mask...) writes into its own named buffer (dst=) instead of allocating a new
+array every frame, which keeps the allocator and the GC quiet on the Pi (see scripts/bench_allocations.py).
+
+The pattern is: out = cv2.xxx(..., dst=ws.get(name)) then ws.keep(name, out). opencv writes into the buffer when
+it has the right size/type, and allocates a new one otherwise (first frame, resolution change), which keep() then
+stores for the next frame. A buffer is only valid until the same step runs again on that camera, anything that
+is kept longer needs its own name (ie: 'reference').
+"""
+from cv_context import lazy_import
+
+np = lazy_import("numpy")
+
+
+class FrameWorkspace:
+
+    def __init__(self):
+        self._buffers = {}
+        self.allocations = 0  # times a step could not reuse its buffer
+
+    def get(self, name):
+        return self._buffers.get(name)
+
+    def keep(self, name, image):
+        if image is not None and image is not self._buffers.get(name):
+            self._buffers[name] = image
+            self.allocations += 1
+        return image
+
+    def zeros_like(self, name, image):
+        buf = self._buffers.get(name)
+        if buf is None or buf.shape != image.shape or buf.dtype != image.dtype:
+            buf = self.keep(name, np.zeros_like(image))
+        else:
+            buf.fill(0)
+        return buf
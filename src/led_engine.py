@@ -0,0 +1,197 @@
+"""
+led_engine.py
+
+Function:
+This file holds the frame buffer engine for the LED strips. The LED methods (LEDs.py) only queue commands, the
+engine thread applies all queued commands to a frame buffer and pushes the frame to the strip with a single
+show() per frame, capped at max_fps. Nothing here sleeps on the caller's thread, so the LEDs can be driven from
+the cv loop without slowing it down.
+
+MockStrip has the same methods as rpi_ws281x's Adafruit_NeoPixel, it is used when the rpi_ws281x library (or the
+hardware) is not available, ie: on a dev machine.
+"""
+import queue
+import threading
+import time
+
+from cv_context import lazy_import
+
+np = lazy_import("numpy")
+
+
+def Color(red, green, blue, white=0):
+    # same packing as rpi_ws281x.Color
+    return (white << 24) | (red << 16) | (green << 8) | blue
+
+
+class MockStrip:
+
+    def __init__(self, num, *args, **kwargs):
+        self.num = num
+        self.pixels = [0] * num
+        self.brightness = 255
+        self.show_count = 0
+        self.frames = []  # last frames that were "shown", for debugging
+        self.max_frames = 100
+
+    def begin(self):
+        pass
+
+    def numPixels(self):
+        return self.num
+
+    def setPixelColor(self, n, color):
+        self.pixels[n] = color
+
+    def getPixelColor(self, n):
+        return self.pixels[n]
+
+    def setBrightness(self, brightness):
+        self.brightness = brightness
+
+    def show(self):
+        self.show_count += 1
+        self.frames.append(list(self.pixels))
+        del self.frames[:-self.max_frames]
+
+
+class _Wipe:
+    ''' Lights up the pixels one after the other, step_ms apart (what colorWipe used to do with sleeps) '''
+
+    def __init__(self, indices, color, step_ms, start):
+        self.indices = indices
+        self.color = color
+        self.step = step_ms / 1000.0
+        self.start = start
+        self.done = 0
+
+    def advance(self, framebuffer, now):
+        count = len(self.indices) if self.step <= 0 else min(len(self.indices), int((now - self.start) / self.step) + 1)
+        if count > self.done:
+            framebuffer[self.indices[self.done:count]] = self.color
+            self.done = count
+        return self.done < len(self.indices)
+
+
+class LEDEngine:
+
+    def __init__(self, strip, max_fps=60):
+        self.strip = strip
+        self.max_fps = max_fps
+        self.num_pixels = strip.numPixels()
+        self.framebuffer = np.zeros(self.num_pixels, dtype=np.uint32)
+        # what the strip currently shows, to only send the pixels that changed
+        self._shown = np.zeros(self.num_pixels, dtype=np.uint32)
+        self._queue = queue.Queue()
+        self._animations = []
+        self._syncs = []
+        self._dirty = False
+        self._last_show = 0.0
+        self._thread = None
+        self._running = False
+        self.frames_shown = 0
+
+    ############################## commands (safe to call from any thread, never block) ##############################
+
+    def set_pixels(self, indices, color):
+        self._queue.put(('set', np.asarray(indices, dtype=np.intp), color))
+
+    def fill(self, color):
+        self._queue.put(('fill', color))
+
+    def clear(self):
+        self.fill(0)
+
+    def wipe(self, indices, color, step_ms):
+        self._queue.put(('wipe', np.asarray(indices, dtype=np.intp), color, step_ms))
+
+    def set_brightness(self, brightness):
+        self._queue.put(('brightness', brightness))
+
+    def flush(self, timeout=1.0):
+        ''' Waits until every command queued so far is on the strip. Returns False on timeout '''
+        if not self._running:
+            return False
+        event = threading.Event()
+        self._queue.put(('sync', event))
+        return event.wait(timeout)
+
+    ############################## engine thread ##############################
+
+    def start(self):
+        if self._thread is None:
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name="led-engine", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, clear=True):
+        if self._thread is None:
+            return
+        if clear:
+            self.clear()
+        self.flush()
+        self._running = False
+        self._queue.put(('stop',))
+        self._thread.join()
+        self._thread = None
+
+    def _apply(self, command):
+        kind = command[0]
+        if kind == 'set':
+            self.framebuffer[command[1]] = command[2]
+        elif kind == 'fill':
+            self.framebuffer[:] = command[1]
+            self._animations.clear()
+        elif kind == 'wipe':
+            self._animations.append(_Wipe(command[1], command[2], command[3], time.monotonic()))
+        elif kind == 'brightness':
+            self.strip.setBrightness(command[1])
+        elif kind == 'sync':
+            self._syncs.append(command[1])
+            return
+        self._dirty = True
+
+    def _show(self):
+        changed = np.flatnonzero(self.framebuffer != self._shown)
+        for i in changed.tolist():
+            self.strip.setPixelColor(i, int(self.framebuffer[i]))
+        self.strip.show()
+        self._shown[:] = self.framebuffer
+        self._last_show = time.monotonic()
+        self._dirty = False
+        self.frames_shown += 1
+
+    def _run(self):
+        frame_interval = 1.0 / self.max_fps
+        while self._running:
+            if self._dirty or self._animations:
+                timeout = max(0.0, self._last_show + frame_interval - time.monotonic())
+            else:
+                timeout = None
+            try:
+                command = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                command = None
+
+            # apply everything that is queued, it all ends up in the same frame
+            while command is not None:
+                if command[0] == 'stop':
+                    break
+                self._apply(command)
+                try:
+                    command = self._queue.get_nowait()
+                except queue.Empty:
+                    command = None
+
+            now = time.monotonic()
+            if self._animations:
+                self._animations = [animation for animation in self._animations if animation.advance(self.framebuffer, now)]
+                self._dirty = True
+            if self._dirty and now - self._last_show >= frame_interval:
+                self._show()
+
+            if self._syncs and not self._dirty and not self._animations:
+                for event in self._syncs:
+                    event.set()
+                self._syncs.clear()
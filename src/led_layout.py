@@ -0,0 +1,99 @@
+"""
+led_layout.py
+
+Function:
+This file builds the lookup tables from a dartboard segment to the LED pixels that light it up. The strips are
+wired in a zig-zag, even strips start at the outside of the board (number ring) and odd strips start at the
+inside, so the pixel of a ring depends on the strip. Instead of working that out on every call, the tables are
+generated once from the strip geometry:
+
+    strip_table[strip, ring]  -> pixel indexes   (used by numSeg, tripleSeg, ...)
+    sector_table[sector, ring] -> pixel indexes  (sector is the board number 1-20, used to light up a hit)
+
+Each row is padded with -1, counts[...] holds the number of real pixels.
+"""
+from cv_context import lazy_import
+
+np = lazy_import("numpy")
+
+# LED rings along a strip, from the outside of the board to the inside
+NUMBER_RING = 0
+DOUBLE_RING = 1
+OUTER_SINGLE_RING = 2
+TRIPLE_RING = 3
+INNER_SINGLE_RING = 4
+NUM_LED_RINGS = 5
+
+# ring names returned by the scoring code (utils.classify_hit) -> LED ring
+HIT_RINGS = {
+    'double': DOUBLE_RING,
+    'outer_single': OUTER_SINGLE_RING,
+    'triple': TRIPLE_RING,
+    'inner_single': INNER_SINGLE_RING,
+}
+
+
+def ring_offsets(num_led_per_strip, num_ring, dbl_ring, trpl_ring):
+    ''' Pixel offsets of each ring inside an even strip (odd strips are the mirror image) '''
+    return {
+        NUMBER_RING: [num_ring],
+        DOUBLE_RING: [dbl_ring],
+        OUTER_SINGLE_RING: list(range(dbl_ring + 1, trpl_ring)),
+        TRIPLE_RING: [trpl_ring],
+        INNER_SINGLE_RING: list(range(trpl_ring + 1, num_led_per_strip)),
+    }
+
+
+class LEDLayout:
+
+    def __init__(self, num_strips, num_led_per_strip, num_ring, dbl_ring, trpl_ring, strip_sectors):
+        self.num_strips = num_strips
+        self.num_led_per_strip = num_led_per_strip
+        self.strip_sectors = list(strip_sectors)
+
+        offsets = ring_offsets(num_led_per_strip, num_ring, dbl_ring, trpl_ring)
+        width = max(len(ring) for ring in offsets.values())
+
+        self.strip_table = np.full((num_strips, NUM_LED_RINGS, width), -1, dtype=np.intp)
+        self.strip_counts = np.zeros((num_strips, NUM_LED_RINGS), dtype=np.intp)
+        for strip_num in range(num_strips):
+            base = strip_num * num_led_per_strip
+            for ring, ring_offsets_even in offsets.items():
+                if strip_num % 2 == 0: #even num strip
+                    pixels = [base + offset for offset in ring_offsets_even]
+                else: # odd num strip, wired the other way round
+                    pixels = sorted(base + num_led_per_strip - 1 - offset for offset in ring_offsets_even)
+                self.strip_table[strip_num, ring, :len(pixels)] = pixels
+                self.strip_counts[strip_num, ring] = len(pixels)
+
+        # board number -> strip, sectors without a strip get no pixels
+        self.sector_table = np.full((21, NUM_LED_RINGS, width), -1, dtype=np.intp)
+        self.sector_counts = np.zeros((21, NUM_LED_RINGS), dtype=np.intp)
+        for strip_num, sector in enumerate(self.strip_sectors[:num_strips]):
+            self.sector_table[sector] = self.strip_table[strip_num]
+            self.sector_counts[sector] = self.strip_counts[strip_num]
+
+        # a hit lights its segment and the number of the sector, precomputed as one index array per (sector, ring)
+        self.hit_table = np.full((21, NUM_LED_RINGS, width + 1), -1, dtype=np.intp)
+        self.hit_counts = np.zeros((21, NUM_LED_RINGS), dtype=np.intp)
+        for sector in range(21):
+            number_pixels = self.sector_pixels(sector, NUMBER_RING)
+            for ring in range(NUM_LED_RINGS):
+                pixels = np.union1d(self.sector_pixels(sector, ring), number_pixels)
+                self.hit_table[sector, ring, :len(pixels)] = pixels
+                self.hit_counts[sector, ring] = len(pixels)
+
+    def strip_pixels(self, strip_num, ring):
+        return self.strip_table[strip_num, ring, :self.strip_counts[strip_num, ring]]
+
+    def sector_pixels(self, sector, ring):
+        if not 0 < sector <= 20:
+            return self.sector_table[0, ring, :0]
+        return self.sector_table[sector, ring, :self.sector_counts[sector, ring]]
+
+    def hit_pixels(self, sector, ring_name):
+        ''' Pixels to light for a hit, (sector, ring) as returned by utils.classify_hit. Empty for bulls/misses '''
+        ring = HIT_RINGS.get(ring_name)
+        if ring is None or not 0 < sector <= 20:
+            return self.hit_table[0, 0, :0]
+        return self.hit_table[sector, ring, :self.hit_counts[sector, ring]]
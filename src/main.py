@@ -1,32 +1,68 @@
-import cv2
 import os 
 import sys
 import argparse
 from calibrate import Calibration
+from capture import open_cameras
 from darts import DartBoard
+from event_bus import ScorePublisher, DEFAULT_SOCKET_PATH
+from preview import PREVIEW_FPS, PreviewHub, PreviewServer
+from throw_log import DEFAULT_THROW_LOG_PATH, ThrowLog
 
 def main():
 
     #intilize command-line args
     parser = argparse.ArgumentParser(description="Automatic Dart Scoring")
     parser.add_argument("-c", "--calibration", action="store_true", help="Need calibration")
+    parser.add_argument("-a", "--auto-calibration", action="store_true",
+                        help="Calibration from the board itself (4 clicks only if it fails)")
+    parser.add_argument("--headless", action="store_true", help="No GUI popup (production board)")
+    parser.add_argument("--events-socket", default=DEFAULT_SOCKET_PATH, help="Unix socket the score events are sent to")
+    parser.add_argument("--preview-port", type=int, help="Serve the camera feeds (and cv overlays) on this http port")
+    parser.add_argument("--preview-fps", type=float, default=PREVIEW_FPS, help="Frame rate cap of the preview streams")
+    parser.add_argument("--throw-log", default=DEFAULT_THROW_LOG_PATH,
+                        help="SQLite file every scored dart is logged to (empty: no log)")
     args = parser.parse_args()
     
     if args.calibration:
         calibration = Calibration()
         #generate the persepctive matrix
         calibration.calibrate()
+    elif args.auto_calibration:
+        calibration = Calibration()
+        failed = calibration.auto_calibrate()
+        if failed:
+            print(f"Automatic calibration failed for cameras {failed}, select the 4 points instead.")
+            calibration.calibrate(failed)
     #TODO: CHECK/ADD a calibration for to minmize the latency btwn the camera + leds. Adjust timing parameters?
-    cam_R = cv2.VideoCapture(0)
-    cam_L = cv2.VideoCapture(2)
-    cam_C = cv2.VideoCapture(4)
+    # format/resolution/fps/buffer size from config/capture.yaml
+    cameras = open_cameras([0, 2, 4])
 
-    if not cam_R.isOpened() or not cam_L.isOpened() or not cam_C.isOpened():
+    if cameras is None:
         print("Failed to open one or more cameras.")
         sys.exit()
     else:
-        dartboard = DartBoard(cam_R, cam_L, cam_C)
+        cam_R, cam_L, cam_C = cameras
+        publisher = ScorePublisher(args.events_socket).start()
+        preview = preview_server = None
+        if args.preview_port:
+            preview = PreviewHub(fps=args.preview_fps)
+            preview_server = PreviewServer(preview, port=args.preview_port).start()
+        throw_log = ThrowLog(args.throw_log).start() if args.throw_log else None
+        dartboard = DartBoard(cam_R, cam_L, cam_C, publisher, show_display=not args.headless, preview=preview,
+                              throw_log=throw_log)
         dartboard.run_loop()
+        print(f"Frame scheduler: {dartboard.metrics()}")
+        print(f"Calibration drift: {dartboard.drift_monitor.metrics()}")
+        for cam in cameras:
+            print(f"Camera: {cam.stats()}")
+        if preview is not None:
+            print(f"Preview: {preview.stats()}")
+            preview_server.stop()
+            preview.close()
+        if throw_log is not None:
+            throw_log.close()
+            print(f"Throw log: {throw_log.stats()}")
+        publisher.stop()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
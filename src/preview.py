@@ -0,0 +1,208 @@
+"""
+preview.py
+
+Function:
+This file lets the camera feeds be watched remotely (instead of cv2.imshow), with the debug overlays of the cv:
+    <mount>        the gray frame of the camera, with the corners and the tip of the last dart
+    <mount>_mask   the thresholded frame difference
+for the mounts right, left and center. The scoring loop offers its images to a PreviewHub, which serves them as
+MJPEG over HTTP (PreviewServer here, or a route of webapp/app_boards.py) or as jpeg messages over the web socket.
+
+The scoring loop never waits for a viewer:
+    - nobody watches a stream: offer() is a dictionary lookup and nothing else
+    - somebody watches: at most fps frames per second are copied and handed to a small thread pool, which draws
+      the overlays and encodes the jpeg (not the scoring thread)
+    - the pool is still busy with the previous frame of a stream: the new one is dropped (counted in stats())
+Viewers always get the latest encoded frame, a slow viewer skips frames instead of queueing them.
+"""
+import collections
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from cv_context import lazy_import
+
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+
+MOUNTS = ('right', 'left', 'center')
+STREAMS = MOUNTS + tuple(f"{mount}_mask" for mount in MOUNTS)
+PREVIEW_FPS = 10
+PREVIEW_WORKERS = 2
+JPEG_QUALITY = 70
+CORNER_COLOR = (0, 200, 255)
+TIP_COLOR = (0, 0, 255)
+MJPEG_BOUNDARY = b"frame"
+
+
+class PreviewHub:
+
+    def __init__(self, fps=PREVIEW_FPS, workers=PREVIEW_WORKERS, jpeg_quality=JPEG_QUALITY):
+        self.fps = fps
+        self.jpeg_quality = jpeg_quality
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix="preview")
+        self._condition = threading.Condition()
+        self._viewers = collections.Counter()  # stream -> viewers
+        self._next_frame = {}                  # stream -> earliest time of the next offered frame
+        self._pending = set()                  # streams with a frame in the pool
+        self._jpegs = {}                       # stream -> (seq, jpeg bytes)
+        self._overlays = {}                    # mount -> {'corners': array, 'tip': (x, y)}
+        self.offered = 0
+        self.encoded = 0
+        self.dropped = 0
+        self.encode_seconds = 0.0
+
+    ############ scoring loop side (never blocks) ############
+
+    def offer(self, stream, image, mount=None):
+        ''' Returns True if the image was taken for encoding. mount: draw the overlays of that camera on it '''
+        if not self._viewers.get(stream) or image is None:
+            return False
+        now = time.monotonic()
+        if now < self._next_frame.get(stream, 0.0):
+            return False
+        if stream in self._pending:
+            # the pool did not keep up, this frame is skipped
+            self.dropped += 1
+            return False
+        self._next_frame[stream] = now + 1 / self.fps
+        # only the scoring thread adds and only the pool removes (single set operations, atomic)
+        self._pending.add(stream)
+        self.offered += 1
+        # the scoring loop overwrites its buffers on the next frame, so the pool gets its own copy
+        overlay = self._overlays.get(mount) if mount is not None else None
+        self._pool.submit(self._encode, stream, image.copy(), overlay)
+        return True
+
+    def annotate(self, mount, corners=None, tip=None):
+        ''' Overlays drawn on the frames of a camera from now on (the last dart) '''
+        corners = None if corners is None else np.array(corners).reshape(-1, 2)
+        tip = None if tip is None else tuple(int(v) for v in np.ravel(tip)[:2])
+        self._overlays[mount] = {'corners': corners, 'tip': tip}
+
+    def clear_annotations(self):
+        self._overlays = {}
+
+    ############ pool side ############
+
+    def _encode(self, stream, image, overlay):
+        started = time.perf_counter()
+        success = False
+        try:
+            if overlay:
+                image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR) if image.ndim == 2 else image
+                if overlay['corners'] is not None:
+                    for x, y in overlay['corners']:
+                        cv2.circle(image, (int(x), int(y)), 1, CORNER_COLOR, -1)
+                if overlay['tip'] is not None:
+                    cv2.circle(image, overlay['tip'], 6, TIP_COLOR, 2)
+            success, data = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        finally:
+            with self._condition:
+                self._pending.discard(stream)
+                if success:
+                    seq = self._jpegs.get(stream, (0, None))[0] + 1
+                    self._jpegs[stream] = (seq, data.tobytes())
+                    self.encoded += 1
+                self.encode_seconds += time.perf_counter() - started
+                self._condition.notify_all()
+
+    ############ viewer side ############
+
+    def frames(self, stream, timeout=5.0, stop=None):
+        ''' Yields the jpegs of a stream as they are encoded (skipping the ones a slow viewer missed) '''
+        with self._condition:
+            self._viewers[stream] += 1
+        seq = 0
+        try:
+            while stop is None or not stop.is_set():
+                with self._condition:
+                    self._condition.wait_for(lambda: self._jpegs.get(stream, (0, None))[0] > seq, timeout)
+                    new_seq, jpeg = self._jpegs.get(stream, (0, None))
+                if new_seq > seq:
+                    seq = new_seq
+                    yield jpeg
+        finally:
+            with self._condition:
+                self._viewers[stream] -= 1
+                if self._viewers[stream] <= 0:
+                    del self._viewers[stream]
+
+    def mjpeg(self, stream, stop=None):
+        ''' multipart/x-mixed-replace body '''
+        for jpeg in self.frames(stream, stop=stop):
+            yield b"--" + MJPEG_BOUNDARY + b"\r\nContent-Type: image/jpeg\r\n\r\n" + jpeg + b"\r\n"
+
+    def stats(self):
+        return {
+            'viewers': dict(self._viewers),
+            'offered': self.offered,
+            'encoded': self.encoded,
+            'dropped': self.dropped,
+            'encode_ms_mean': self.encode_seconds / self.encoded * 1000 if self.encoded else None,
+        }
+
+    def close(self):
+        self._pool.shutdown(wait=False)
+
+
+MJPEG_CONTENT_TYPE = f"multipart/x-mixed-replace; boundary={MJPEG_BOUNDARY.decode()}"
+INDEX_PAGE = """<!DOCTYPE html>
+<html><head><title>Camera preview</title></head>
+<body>{images}</body></html>"""
+
+
+class PreviewServer:
+    """ Standalone http server for a hub (main.py --preview-port): / shows every stream, /<stream>.mjpg """
+
+    def __init__(self, hub, host="0.0.0.0", port=8081):
+        self.hub = hub
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    def _handler(self):
+        hub = self.hub
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/':
+                    images = "".join(f'<figure><img src="/{stream}.mjpg"><figcaption>{stream}</figcaption></figure>'
+                                     for stream in STREAMS)
+                    body = INDEX_PAGE.format(images=images).encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/html")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+                stream = self.path.strip('/').removesuffix('.mjpg')
+                if stream not in STREAMS or not self.path.endswith('.mjpg'):
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", MJPEG_CONTENT_TYPE)
+                self.send_header("Cache-Control", "no-cache")
+                self.end_headers()
+                try:
+                    for chunk in hub.mjpeg(stream):
+                        self.wfile.write(chunk)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # the viewer left
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="preview-server", daemon=True)
+        self._thread.start()
+        host, port = self.server.server_address[:2]
+        print(f"Camera preview on http://{host}:{port}/")
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,348 @@
+"""
+throw_log.py
+
+Function:
+This file keeps every scored dart in an append-only log (a SQLite database in WAL mode, throws.db in the project
+root by default) for the analytics: heatmaps per player, misscore rates per camera over months of play, latency.
+One row per throw with:
+    board, player, detected_at (unix time)
+    board_x, board_y             where the dart is on the drawn board (DartBoard_CV.dart_coordinates)
+    tip_{r,l,c}_{x,y}            the tip found by each camera (camera pixels, NULL when it did not find the dart)
+    score_{r,l,c}                the score of each camera
+    score, sector, ring          the final score (ring is the board_layout ring id, see RING_NAMES)
+    confidence                   fraction of the cameras that agree with the final score
+    corrected, corrected_*       set by correct() when the score was corrected afterwards (in the app)
+    detect_ms, score_ms          time of the stages of DartBoard.confirm_dart (dart_detection, calculate_score)
+
+The scoring loop never waits for the disk: record() gives the throw its id and appends the row to a bounded buffer,
+a writer thread inserts the rows in batches (one transaction per batch, every FLUSH_INTERVAL seconds or BATCH_SIZE
+rows). With WAL the queries (their own connection, any thread or process) never block the writer and the other
+way round. The queries are aggregated by SQLite itself (GROUP BY on the indexed columns) and only the result is
+turned into numpy arrays, so they stay fast with millions of rows. The misscore counts are rolled up per day, board
+and player (table daily, updated with every batch) so the rates over months read a few hundred rows, not every
+throw.
+"""
+import collections
+import itertools
+import os
+import sqlite3
+import threading
+import time
+
+from board_layout import RING_NAMES
+from cv_context import PROJECT_ROOT, lazy_import
+
+np = lazy_import("numpy")
+
+DEFAULT_THROW_LOG_PATH = os.path.join(PROJECT_ROOT, "throws.db")
+BATCH_SIZE = 256
+FLUSH_INTERVAL = 1.0  # seconds
+MAX_PENDING = 10000
+
+COLUMNS = ('id', 'board', 'player', 'detected_at', 'board_x', 'board_y',
+           'tip_r_x', 'tip_r_y', 'tip_l_x', 'tip_l_y', 'tip_c_x', 'tip_c_y',
+           'score_r', 'score_l', 'score_c', 'score', 'sector', 'ring', 'confidence',
+           'corrected', 'corrected_score', 'corrected_sector', 'corrected_ring',
+           'detect_ms', 'score_ms')
+CAMERA_SCORE_COLUMNS = ('score_r', 'score_l', 'score_c')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS throws (
+    id INTEGER PRIMARY KEY,
+    board TEXT NOT NULL,
+    player TEXT,
+    detected_at REAL NOT NULL,
+    board_x REAL, board_y REAL,
+    tip_r_x REAL, tip_r_y REAL, tip_l_x REAL, tip_l_y REAL, tip_c_x REAL, tip_c_y REAL,
+    score_r INTEGER, score_l INTEGER, score_c INTEGER,
+    score INTEGER, sector INTEGER, ring INTEGER,
+    confidence REAL,
+    corrected INTEGER NOT NULL DEFAULT 0,
+    corrected_score INTEGER, corrected_sector INTEGER, corrected_ring INTEGER,
+    detect_ms REAL, score_ms REAL
+);
+-- the heatmap of a player only reads the index (covering), the time range queries use the other two
+CREATE INDEX IF NOT EXISTS throws_player ON throws (player, detected_at, board_x, board_y);
+CREATE INDEX IF NOT EXISTS throws_board ON throws (board, detected_at);
+CREATE INDEX IF NOT EXISTS throws_time ON throws (detected_at);
+-- day = unix days (UTC), player '' when not known. miss_*: throws the camera did not score right
+CREATE TABLE IF NOT EXISTS daily (
+    day INTEGER NOT NULL,
+    board TEXT NOT NULL,
+    player TEXT NOT NULL,
+    throws INTEGER NOT NULL,
+    corrected INTEGER NOT NULL,
+    miss_r INTEGER NOT NULL, miss_l INTEGER NOT NULL, miss_c INTEGER NOT NULL,
+    PRIMARY KEY (day, board, player)
+);
+"""
+
+DAILY_UPSERT = """
+INSERT INTO daily (day, board, player, throws, corrected, miss_r, miss_l, miss_c) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (day, board, player) DO UPDATE SET
+    throws = throws + excluded.throws, corrected = corrected + excluded.corrected,
+    miss_r = miss_r + excluded.miss_r, miss_l = miss_l + excluded.miss_l, miss_c = miss_c + excluded.miss_c
+"""
+
+PERIODS = {'day': '%Y-%m-%d', 'week': '%Y-%W', 'month': '%Y-%m', 'year': '%Y'}
+DAY_SECONDS = 24 * 3600
+
+
+def connect(path, readonly=False):
+    if readonly:
+        connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    else:
+        connection = sqlite3.connect(path)
+        connection.execute("PRAGMA journal_mode=WAL")
+        # with WAL, NORMAL only syncs on checkpoints: a power cut can lose the last batch, never corrupt the log
+        connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
+
+
+def ring_id(ring):
+    return None if ring is None else RING_NAMES.index(ring)
+
+
+def _filters(board=None, player=None, since=None, until=None):
+    ''' WHERE clause (possibly empty) and its parameters '''
+    clauses, params = [], []
+    for column, op, value in (('board', '=', board), ('player', '=', player),
+                              ('detected_at', '>=', since), ('detected_at', '<', until)):
+        if value is not None:
+            clauses.append(f"{column} {op} ?")
+            params.append(value)
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+
+def daily_rows(rows):
+    ''' The rows of a batch summed per (day, board, player), for DAILY_UPSERT '''
+    index = {name: COLUMNS.index(name) for name in ('board', 'player', 'detected_at', 'score', *CAMERA_SCORE_COLUMNS)}
+    daily = {}
+    for row in rows:
+        key = (int(row[index['detected_at']] // DAY_SECONDS), row[index['board']], row[index['player']] or '')
+        counts = daily.setdefault(key, [0, 0, 0, 0, 0])
+        counts[0] += 1
+        for i, column in enumerate(CAMERA_SCORE_COLUMNS):
+            counts[2 + i] += row[index[column]] != row[index['score']]
+    return [(*key, *counts) for key, counts in daily.items()]
+
+
+class ThrowLog:
+
+    def __init__(self, path=DEFAULT_THROW_LOG_PATH, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL,
+                 max_pending=MAX_PENDING):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        connection = connect(path)
+        with connection:
+            connection.executescript(SCHEMA)
+        last_id = connection.execute("SELECT MAX(id) FROM throws").fetchone()[0]
+        connection.close()
+        # ids are given out by record() (the events carry them, before the row is written)
+        self._ids = itertools.count((last_id or 0) + 1)
+        self._pending = collections.deque()
+        self._corrections = collections.deque()  # (throw id, score, sector, ring id), applied after the inserts
+        self._condition = threading.Condition()
+        self._readers = threading.local()
+        self._thread = None
+        self._running = False
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.write_seconds = 0.0
+        self.corrections_queued = 0
+
+    ############ scoring loop side (never blocks) ############
+
+    def record(self, board, detected_at, board_x, board_y, score, sector, ring, confidence,
+               camera_tips=(None, None, None), camera_scores=(None, None, None), player=None,
+               detect_ms=None, score_ms=None):
+        ''' Queues a throw, returns its id '''
+        throw_id = next(self._ids)
+        tips = []
+        for tip in camera_tips:
+            tips.extend((float(tip[0]), float(tip[1])) if tip is not None else (None, None))
+        row = (throw_id, board, player, detected_at, board_x, board_y, *tips, *camera_scores,
+               score, sector, ring_id(ring), confidence, 0, None, None, None, detect_ms, score_ms)
+        with self._condition:
+            if len(self._pending) >= self.max_pending:
+                self._pending.popleft()
+                self.dropped += 1
+            self._pending.append(row)
+            if len(self._pending) >= self.batch_size:
+                self._condition.notify()
+        return throw_id
+
+    def correct(self, throw_id, score, sector, ring):
+        ''' Queues the right score of a throw (the writer thread applies it, the throw may not be written yet) '''
+        with self._condition:
+            self._corrections.append((throw_id, score, sector, ring_id(ring)))
+        self.corrections_queued += 1
+
+    ############ writer ############
+
+    def start(self):
+        if self._thread is None:
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name="throw-log", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is None:
+            return
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        # the writer flushes what is left before it exits
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        connection = connect(self.path)
+        insert = f"INSERT INTO throws ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+        while True:
+            with self._condition:
+                if self._running and len(self._pending) < self.batch_size:
+                    self._condition.wait(self.flush_interval)
+                rows = list(self._pending)
+                self._pending.clear()
+                corrections = list(self._corrections)
+                self._corrections.clear()
+                running = self._running
+            if rows or corrections:
+                start = time.perf_counter()
+                with connection:
+                    connection.executemany(insert, rows)
+                    connection.executemany(DAILY_UPSERT, daily_rows(rows))
+                    for correction in corrections:
+                        self._apply_correction(connection, *correction)
+                self.write_seconds += time.perf_counter() - start
+                self.written += len(rows)
+                self.batches += 1
+            if not running:
+                break
+        connection.close()
+
+    @staticmethod
+    def _apply_correction(connection, throw_id, score, sector, ring):
+        row = connection.execute(
+            f"SELECT detected_at, board, player, score, corrected_score, {', '.join(CAMERA_SCORE_COLUMNS)} "
+            f"FROM throws WHERE id = ?", (throw_id,)).fetchone()
+        if row is None:
+            print(f"Throw log: no throw {throw_id} to correct")
+            return
+        detected_at, board, player, final_score, previous_score, *camera_scores = row
+        previous_score = final_score if previous_score is None else previous_score
+        connection.execute(
+            "UPDATE throws SET corrected = ?, corrected_score = ?, corrected_sector = ?, corrected_ring = ? "
+            "WHERE id = ?", (int(score != final_score), score, sector, ring, throw_id))
+        # the daily rollup counts the change only (the throw may have been corrected before)
+        connection.execute(DAILY_UPSERT, (
+            int(detected_at // DAY_SECONDS), board, player or '', 0,
+            int(score != final_score) - int(previous_score != final_score),
+            *[int(camera_score != score) - int(camera_score != previous_score) for camera_score in camera_scores]))
+
+    def stats(self):
+        return {
+            'written': self.written,
+            'pending': len(self._pending),
+            'dropped': self.dropped,
+            'corrections': self.corrections_queued,
+            'batches': self.batches,
+            'write_ms_per_batch': self.write_seconds / self.batches * 1000 if self.batches else None,
+        }
+
+    ############ queries (own read connection per thread) ############
+
+    def _reader(self):
+        connection = getattr(self._readers, 'connection', None)
+        if connection is None:
+            connection = self._readers.connection = connect(self.path, readonly=True)
+        return connection
+
+    def throw(self, throw_id):
+        ''' One throw as {column: value}, None when it is not (yet) written '''
+        row = self._reader().execute(f"SELECT {', '.join(COLUMNS)} FROM throws WHERE id = ?", (throw_id,)).fetchone()
+        return None if row is None else dict(zip(COLUMNS, row))
+
+    def count(self, board=None, player=None, since=None, until=None):
+        where, params = _filters(board, player, since, until)
+        return self._reader().execute(f"SELECT COUNT(*) FROM throws{where}", params).fetchone()[0]
+
+    def distinct(self, column, board=None, player=None, since=None, until=None):
+        ''' The boards or players (column) that have throws '''
+        where, params = _filters(board, player, since, until)
+        where += f"{' AND' if where else ' WHERE'} {column} IS NOT NULL"
+        return [row[0] for row in self._reader().execute(
+            f"SELECT DISTINCT {column} FROM throws{where} ORDER BY {column}", params)]
+
+    def columns(self, names=COLUMNS, board=None, player=None, since=None, until=None):
+        ''' The throws as {column: numpy array} (float, NULL -> nan), ordered by id '''
+        where, params = _filters(board, player, since, until)
+        rows = self._reader().execute(f"SELECT {', '.join(names)} FROM throws{where} ORDER BY id", params).fetchall()
+        data = np.array(rows, dtype=np.float64).reshape(len(rows), len(names))
+        return {name: data[:, i] for i, name in enumerate(names)}
+
+    def heatmap(self, bin_px=4, width=None, height=None, board=None, player=None, since=None, until=None):
+        '''
+        2D histogram (rows = y) of where the darts landed on the drawn board, bin_px pixels per bin. The binning is
+        done by SQLite, only the non empty bins are read
+        '''
+        where, params = _filters(board, player, since, until)
+        where += (" AND " if where else " WHERE ") + "board_x IS NOT NULL"
+        rows = self._reader().execute(
+            f"SELECT CAST(board_x / ? AS INTEGER) AS bx, CAST(board_y / ? AS INTEGER) AS by, COUNT(*) "
+            f"FROM throws{where} GROUP BY bx, by", [bin_px, bin_px, *params]).fetchall()
+        bins = np.array(rows, dtype=np.int64).reshape(-1, 3)
+        width = width or (int(bins[:, 0].max()) + 1 if len(bins) else 0) * bin_px
+        height = height or (int(bins[:, 1].max()) + 1 if len(bins) else 0) * bin_px
+        histogram = np.zeros((-(-height // bin_px), -(-width // bin_px)), dtype=np.int64)
+        inside = ((bins[:, 0] >= 0) & (bins[:, 0] < histogram.shape[1])
+                  & (bins[:, 1] >= 0) & (bins[:, 1] < histogram.shape[0]))
+        histogram[bins[inside, 1], bins[inside, 0]] = bins[inside, 2]
+        return histogram
+
+    def misscore_rates(self, period='month', board=None, player=None, since=None, until=None):
+        '''
+        Per period (see PERIODS): throws, corrected throws (the final score was wrong) and for every camera how
+        often its score was not the right one (the corrected score, else the final score)
+        '''
+        # from the daily rollup: since/until are rounded down to the day (UTC)
+        since = None if since is None else int(since // DAY_SECONDS)
+        until = None if until is None else int(until // DAY_SECONDS)
+        where, params = _filters(board, player, None, None)
+        for op, day in (('>=', since), ('<', until)):
+            if day is not None:
+                where += f"{' AND' if where else ' WHERE'} day {op} ?"
+                params.append(day)
+        rows = self._reader().execute(
+            f"SELECT strftime('{PERIODS[period]}', day * {DAY_SECONDS}, 'unixepoch') AS period, SUM(throws), "
+            f"SUM(corrected), SUM(miss_r), SUM(miss_l), SUM(miss_c) FROM daily{where} GROUP BY period ORDER BY period",
+            params).fetchall()
+        rates = []
+        for period_name, throws, corrected, *misses in rows:
+            rates.append({
+                'period': period_name,
+                'throws': throws,
+                'corrected': corrected,
+                'misscore_rate': corrected / throws,
+                'camera_misscore_rates': [miss / throws for miss in misses],
+            })
+        return rates
+
+    def latency(self, board=None, since=None, until=None):
+        ''' Mean time of the confirm stages (ms) '''
+        where, params = _filters(board, None, since, until)
+        detect, score = self._reader().execute(
+            f"SELECT AVG(detect_ms), AVG(score_ms) FROM throws{where}", params).fetchone()
+        return {'detect_ms': detect, 'score_ms': score}
+
+    def close(self):
+        self.stop()
+        connection = getattr(self._readers, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._readers.connection = None
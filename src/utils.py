@@ -1,55 +1,124 @@
-import os
-import sys
-import cv2
-import yaml
-from kalman_filter import KalmanFilter
-import numpy as np
-import math
-global constants
-global perspective_matrices
-
-
-with open("config/cv_constants.yaml", "r") as file:
-    constants = yaml.safe_load(file)
-
-def load_perspective_matrices():
-    perspective_matrices = []
-    for camera_index in range(constants['NUM_CAMERAS']):
-        try:
-            data = np.load(f'perspective_matrix_camera_{camera_index}.npz')
-            matrix = data['matrix']
-            perspective_matrices.append(matrix)
-        except FileNotFoundError:
-            print(f"Perspective matrix file not found for camera {camera_index}. Please calibrate the cameras first.")
-            exit(1)
-    return perspective_matrices
-
-perspective_matrices = load_perspective_matrices()
-
-def generate_kalman_filters():
-    kalman_filter_R = KalmanFilter(constants['DT'], constants['U_X'], constants['U_Y'], constants['STD_ACC'], constants['X_STD_MEAS'], constants['Y_STD_MEAS'])
-    kalman_filter_L = KalmanFilter(constants['DT'], constants['U_X'], constants['U_Y'], constants['STD_ACC'], constants['X_STD_MEAS'], constants['Y_STD_MEAS'])
-    kalman_filter_C = KalmanFilter(constants['DT'], constants['U_X'], constants['U_Y'], constants['STD_ACC'], constants['X_STD_MEAS'], constants['Y_STD_MEAS'])
+import functools
+import time
+from board_layout import DEFAULT_SECTOR_ORDER, RING_NAMES, get_layout
+from cv_context import get_context, lazy_import
+from frame_workspace import FrameWorkspace
+
+# cv2/numpy are only imported the first time a helper below actually uses them
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+
+
+def load_perspective_matrices(ctx=None):
+    ctx = ctx or get_context()
+    try:
+        return ctx.perspective_matrices
+    except FileNotFoundError as e:
+        print(e)
+        raise
+
+def generate_kalman_filters(ctx=None):
+    from kalman_filter import KalmanFilter
+    constants = (ctx or get_context()).constants
+    kalman_filter_R = KalmanFilter(constants.DT, constants.U_X, constants.U_Y, constants.STD_ACC, constants.X_STD_MEAS, constants.Y_STD_MEAS)
+    kalman_filter_L = KalmanFilter(constants.DT, constants.U_X, constants.U_Y, constants.STD_ACC, constants.X_STD_MEAS, constants.Y_STD_MEAS)
+    kalman_filter_C = KalmanFilter(constants.DT, constants.U_X, constants.U_Y, constants.STD_ACC, constants.X_STD_MEAS, constants.Y_STD_MEAS)
     return kalman_filter_R, kalman_filter_L, kalman_filter_C
 
 ##################################### Camera/Image Processing Helper Functions #################################3
 
 """ These functions are also used to help detect the precesense of a dart """
 
-def cam2gray(cam):
+def cam2gray(cam, dst=None):
+    # capture.Camera gives the luma without decoding a BGR frame first
+    if hasattr(cam, 'read_gray'):
+        return cam.read_gray(dst)
     success, image = cam.read()
-    img_g = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    img_g = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=dst)
     return success, img_g
 
-def diff2blur(cam, t):
-    _, t_plus = cam2gray(cam)
-    dimg = cv2.absdiff(t, t_plus)
-    kernel = np.ones((5, 5), np.float32) / 25
-    blur = cv2.filter2D(dimg, -1, kernel)
+@functools.lru_cache(maxsize=None)
+def box_kernel(size=5):
+    # built once, not on every diff2blur
+    return np.ones((size, size), np.float32) / (size * size)
+
+""" Blur backends for diff2blur: all of them are a 5x5 mean (same output as filter2d), except gaussian """
+
+def blur_filter2d(src, dst=None):
+    # generic convolution with the float kernel (the original blur)
+    return cv2.filter2D(src, -1, box_kernel(), dst=dst)
+
+def blur_box(src, dst=None):
+    return cv2.blur(src, (5, 5), dst=dst)
+
+def blur_separable(src, dst=None):
+    kernel = box_kernel(5)[0] * 5
+    return cv2.sepFilter2D(src, -1, kernel, kernel, dst=dst)
+
+def blur_integral(src, dst=None):
+    # window sums from the integral image, same border as filter2D (reflect 101)
+    padded = cv2.copyMakeBorder(src, 2, 2, 2, 2, cv2.BORDER_REFLECT_101)
+    sums = cv2.integral(padded)
+    window = sums[5:, 5:] - sums[:-5, 5:] - sums[5:, :-5] + sums[:-5, :-5]
+    if dst is None or dst.shape != src.shape:
+        dst = np.empty_like(src)
+    # rounded like opencv (a tie can not happen with 25 pixels)
+    np.floor_divide(window * 2 + 25, 50, out=dst, casting='unsafe')
+    return dst
+
+def blur_gaussian(src, dst=None):
+    # not a mean: the blurred values differ a bit, only use it after checking with scripts/check_blur_backends.py
+    return cv2.GaussianBlur(src, (5, 5), 0, dst=dst)
+
+BLUR_BACKENDS = {
+    'filter2d': blur_filter2d,
+    'box': blur_box,
+    'separable': blur_separable,
+    'integral': blur_integral,
+    'gaussian': blur_gaussian,
+}
+# backends 'auto' can choose from, they give the exact same image as filter2d
+EXACT_BLUR_BACKENDS = ('filter2d', 'box', 'separable', 'integral')
+
+@functools.lru_cache(maxsize=None)
+def fastest_blur_backend(shape, iterations=30):
+    ''' Times the exact backends on a frame of this shape (on this cpu) and returns the fastest one '''
+    image = np.random.default_rng(0).integers(0, 255, shape, dtype=np.uint8)
+    dst = np.empty_like(image)
+    timings = {}
+    for name in EXACT_BLUR_BACKENDS:
+        blur = BLUR_BACKENDS[name]
+        blur(image, dst)
+        start = time.perf_counter()
+        for _ in range(iterations):
+            blur(image, dst)
+        timings[name] = (time.perf_counter() - start) / iterations
+    fastest = min(timings, key=timings.get)
+    print("Blur backends (ms): " + ", ".join(f"{name} {seconds * 1000:.3f}" for name, seconds in timings.items())
+          + f" -> using {fastest}")
+    return fastest
+
+def resolve_blur_backend(name, shape):
+    if name == 'auto':
+        return fastest_blur_backend(tuple(shape))
+    if name not in BLUR_BACKENDS:
+        raise ValueError(f"Unknown BLUR_BACKEND '{name}', expected auto or one of {sorted(BLUR_BACKENDS)}")
+    return name
+
+def diff2blur(cam, t, ws=None, blur_backend='filter2d'):
+    # with a workspace (frame_workspace.py) t_plus and blur are its buffers, valid until the next diff2blur
+    ws = ws if ws is not None else FrameWorkspace()
+    _, t_plus = cam2gray(cam, ws.get('gray'))
+    ws.keep('gray', t_plus)
+    dimg = ws.keep('diff', cv2.absdiff(t, t_plus, dst=ws.get('diff')))
+    blur = ws.keep('blur', BLUR_BACKENDS[blur_backend](dimg, ws.get('blur')))
     return t_plus, blur
 
 def getCorners(img_in):
+    # full frame harris, DartBoard_CV uses corner_detectors.find_corners
     edges = cv2.goodFeaturesToTrack(img_in, 640, 0.0008, 1, mask=None, blockSize=3, useHarrisDetector=1, k=0.06)
+    if edges is None:
+        return np.empty((0, 1, 2), np.intp)
     corners = np.intp(edges)
     return corners
 
@@ -65,66 +134,88 @@ def filterCornersLine(corners, rows, cols):
     corners_final = np.array([i for i in corners if abs((righty - lefty) * i[0][0] - (cols - 1) * i[0][1] + cols * lefty - righty) / np.sqrt((righty - lefty)**2 + (cols - 1)**2) <= 40])
     return corners_final
 
-def get_threshold(cam, t):
-    success, t_plus = cam2gray(cam)
-    dimg = cv2.absdiff(t, t_plus)
-    blur = cv2.GaussianBlur(dimg, (5, 5), 0)
-    blur = cv2.bilateralFilter(blur, 9, 75, 75)
-    _, thresh = cv2.threshold(blur, 60, 255, 0)
-    return thresh
+def get_threshold(cam, t, threshold=60, ws=None):
+    ws = ws if ws is not None else FrameWorkspace()
+    success, t_plus = cam2gray(cam, ws.get('gray'))
+    ws.keep('gray', t_plus)
+    dimg = ws.keep('diff', cv2.absdiff(t, t_plus, dst=ws.get('diff')))
+    blur = ws.keep('gauss', cv2.GaussianBlur(dimg, (5, 5), 0, dst=ws.get('gauss')))
+    # bilateralFilter can not work in place
+    blur = ws.keep('smooth', cv2.bilateralFilter(blur, 9, 75, 75, dst=ws.get('smooth')))
+    _, thresh = cv2.threshold(blur, threshold, 255, 0, dst=ws.get('thresh'))
+    return ws.keep('thresh', thresh)
 
 #################### Calculte the Score Helper Functions ###################################################
 
-def get_score(locationofdart_R,locationofdart_L,locationofdart_C):
-    camera_scores = [None] * constants['NUM_CAMERAS']  # Initialize camera_scores list
+def get_hits(locationofdart_R,locationofdart_L,locationofdart_C, ctx=None):
+    ''' (score, sector, ring) for each camera, None for the cameras that did not find the dart '''
+    ctx = ctx or get_context()
+    camera_hits = [None] * ctx.constants.NUM_CAMERAS  # Initialize camera_hits list
     for camera_index, locationofdart in enumerate([locationofdart_R, locationofdart_L, locationofdart_C]):
             if isinstance(locationofdart, tuple) and len(locationofdart) == 2:
                 x, y = locationofdart
-                score = calculate_score_from_coordinates(x, y, camera_index)
-                print(f"Camera {camera_index} - Dart Location: {locationofdart}, Score: {score}")
-
-                # Store the score in the camera_scores list
-                camera_scores[camera_index] = score
-    return camera_scores
-
-
-def calculate_score_from_coordinates(x, y, camera_index):
-    #fix this my making it a global varible??
-    inverse_matrix = cv2.invert(perspective_matrices[camera_index])[1]
-    transformed_coords = cv2.perspectiveTransform(np.array([[[x, y]]], dtype=np.float32), inverse_matrix)[0][0]
-    transformed_x, transformed_y = transformed_coords
-
-    dx = transformed_x - constants['center'][0]
-    dy = transformed_y - constants['center'][0]
-    distance_from_center = math.sqrt(dx**2 + dy**2)
-    angle = math.atan2(dy, dx)
-    score = calculate_score(distance_from_center, angle)
-    return score
-
-def calculate_score(distance, angle):
-    if angle < 0:
-        angle += 2 * np.pi
-    sector_scores = [10, 15, 2, 17, 3, 19, 7, 16, 8, 11, 14, 9, 12, 5, 20, 1, 18, 4, 13, 6]
-    sector_index = int(angle / (2 * np.pi) * 20)
-    base_score = sector_scores[sector_index]
-    if distance <= constants['BULLSEYE_RADIUS_PX']:
-        return 50
-    elif distance <= constants['OUTER_BULL_RADIUS_PX']:
-        return 25
-    elif constants['TRIPLE_RING_INNER_RADIUS_PX'] < distance <= constants['TRIPLE_RING_OUTER_RADIUS_PX']:
-        return base_score * 3
-    elif constants['DOUBLE_RING_INNER_RADIUS_PX'] < distance <= constants['DOUBLE_RING_OUTER_RADIUS_PX']:
-        return base_score * 2
-    elif distance <= constants['DOUBLE_RING_OUTER_RADIUS_PX']:
-        return base_score
-    else:
-        return 0
-
-def get_score_coordinates(dart_coordinates, majority_camera_index):
+                hit = classify_hit_from_coordinates(x, y, camera_index, ctx)
+                print(f"Camera {camera_index} - Dart Location: {locationofdart}, Score: {hit[0]}")
+
+                # Store the hit in the camera_hits list
+                camera_hits[camera_index] = hit
+    return camera_hits
+
+def get_score(locationofdart_R,locationofdart_L,locationofdart_C, ctx=None):
+    camera_hits = get_hits(locationofdart_R, locationofdart_L, locationofdart_C, ctx)
+    return [hit[0] if hit is not None else None for hit in camera_hits]
+
+
+def transform_to_board(points, camera_index, ctx=None, with_bias=True):
+    '''
+    camera pixel coordinates (N, 2) -> coordinates on the drawn board (N, 2), all in one perspectiveTransform.
+    with_bias: the offset learned from the score corrections of the camera (camera_bias.py) is taken off
+    '''
+    ctx = ctx or get_context()
+    points = np.asarray(points, dtype=np.float32).reshape(-1, 1, 2)
+    board_points = cv2.perspectiveTransform(points, ctx.inverse_matrices[camera_index]).reshape(-1, 2)
+    if with_bias:
+        board_points -= ctx.camera_offsets[camera_index].astype(np.float32)
+    return board_points
+
+def classify_hit_from_coordinates(x, y, camera_index, ctx=None):
+    ctx = ctx or get_context()
+    transformed_x, transformed_y = transform_to_board([[x, y]], camera_index, ctx)[0]
+    return get_layout(ctx.constants).classify_point(transformed_x, transformed_y)
+
+def classify_points(points, camera_index=None, ctx=None):
+    '''
+    (scores, sectors, ring names) arrays for many points at once (ie: a whole replay). The points are camera
+    coordinates of camera_index, or board coordinates when camera_index is None
+    '''
+    ctx = ctx or get_context()
+    if camera_index is not None:
+        points = transform_to_board(points, camera_index, ctx)
+    scores, sectors, rings = get_layout(ctx.constants).classify_points(points)
+    return scores, sectors, np.asarray(RING_NAMES)[rings]
+
+def calculate_score_from_coordinates(x, y, camera_index, ctx=None):
+    return classify_hit_from_coordinates(x, y, camera_index, ctx)[0]
+
+SECTOR_SCORES = list(DEFAULT_SECTOR_ORDER)
+
+def classify_hit(distance, angle, constants=None):
+    '''
+    Returns (score, sector, ring). sector is the board number (25 for the bulls, 0 for a miss) and ring is one of
+    'inner_bull', 'outer_bull', 'inner_single', 'triple', 'outer_single', 'double', 'miss'
+    '''
+    constants = constants or get_context().constants
+    scores, sectors, rings = get_layout(constants).classify_polar([distance], [angle])
+    return int(scores[0]), int(sectors[0]), RING_NAMES[rings[0]]
+
+def calculate_score(distance, angle, constants=None):
+    return classify_hit(distance, angle, constants)[0]
+
+def get_score_coordinates(dart_coordinates, majority_camera_index, ctx=None):
     # Transform the dart coordinates to match the drawn dartboard
     if dart_coordinates is not None:
         x, y = dart_coordinates
-        inverse_matrix = cv2.invert(perspective_matrices[majority_camera_index])[1]
+        inverse_matrix = (ctx or get_context()).inverse_matrices[majority_camera_index]
         transformed_coords = cv2.perspectiveTransform(np.array([[[x, y]]], dtype=np.float32), inverse_matrix)[0][0]
         dart_coordinates = tuple(map(int, transformed_coords))
         return dart_coordinates
@@ -148,33 +239,34 @@ def draw_point_at_angle(image, center, angle_degrees, radius, color, point_radiu
     y = int(center[1] - radius * np.sin(angle_radians))
     cv2.circle(image, (x, y), point_radius, color, -1)
 
-def draw_dartboard():
+def draw_dartboard(constants=None):
+    constants = constants or get_context().constants
     # Create a blank image with white background
-    dartboard_image = np.ones((constants['IMAGE_HEIGHT'], constants['IMAGE_WIDTH'], 3), dtype=np.uint8) * 255
+    dartboard_image = np.ones((constants.IMAGE_HEIGHT, constants.IMAGE_WIDTH, 3), dtype=np.uint8) * 255
 
     # Draw the bullseye and rings
-    cv2.circle(dartboard_image, constants['center'], constants['BULLSEYE_RADIUS_PX'], (0, 0, 0), -1, lineType=cv2.LINE_AA)  # Bullseye
-    cv2.circle(dartboard_image, constants['center'], constants['OUTER_BULL_RADIUS_PX'], (255, 0, 0), 2, lineType=cv2.LINE_AA)  # Outer bull
-    cv2.circle(dartboard_image, constants['center'], constants['TRIPLE_RING_INNER_RADIUS_PX'], (0, 255, 0), 2, lineType=cv2.LINE_AA)  # Inner triple
-    cv2.circle(dartboard_image, constants['center'], constants['TRIPLE_RING_OUTER_RADIUS_PX'], (0, 255, 0), 2, lineType=cv2.LINE_AA)  # Outer triple
-    cv2.circle(dartboard_image, constants['center'], constants['DOUBLE_RING_INNER_RADIUS_PX'], (0, 0, 255), 2, lineType=cv2.LINE_AA)  # Inner double
-    cv2.circle(dartboard_image, constants['center'], constants['DOUBLE_RING_OUTER_RADIUS_PX'], (0, 0, 255), 2, lineType=cv2.LINE_AA)  # Outer double
+    cv2.circle(dartboard_image, constants.center, constants.BULLSEYE_RADIUS_PX, (0, 0, 0), -1, lineType=cv2.LINE_AA)  # Bullseye
+    cv2.circle(dartboard_image, constants.center, constants.OUTER_BULL_RADIUS_PX, (255, 0, 0), 2, lineType=cv2.LINE_AA)  # Outer bull
+    cv2.circle(dartboard_image, constants.center, constants.TRIPLE_RING_INNER_RADIUS_PX, (0, 255, 0), 2, lineType=cv2.LINE_AA)  # Inner triple
+    cv2.circle(dartboard_image, constants.center, constants.TRIPLE_RING_OUTER_RADIUS_PX, (0, 255, 0), 2, lineType=cv2.LINE_AA)  # Outer triple
+    cv2.circle(dartboard_image, constants.center, constants.DOUBLE_RING_INNER_RADIUS_PX, (0, 0, 255), 2, lineType=cv2.LINE_AA)  # Inner double
+    cv2.circle(dartboard_image, constants.center, constants.DOUBLE_RING_OUTER_RADIUS_PX, (0, 0, 255), 2, lineType=cv2.LINE_AA)  # Outer double
 
     # Draw the sector lines
-    for angle in np.linspace(0, 2 * np.pi, 21)[:-1]:  # 20 sectors
-        start_x = int(constants['center'][0] + np.cos(angle) * constants['DOUBLE_RING_OUTER_RADIUS_PX'])
-        start_y = int(constants['center'][1] + np.sin(angle) * constants['DOUBLE_RING_OUTER_RADIUS_PX'])
-        end_x = int(constants['center'][0] + np.cos(angle) * constants['OUTER_BULL_RADIUS_PX'])
-        end_y = int(constants['center'][1] + np.sin(angle) * constants['OUTER_BULL_RADIUS_PX'])
+    layout = get_layout(constants)
+    for angle in layout.sector_start_angle(np.arange(20)):  # 20 sectors
+        start_x = int(constants.center[0] + np.cos(angle) * constants.DOUBLE_RING_OUTER_RADIUS_PX)
+        start_y = int(constants.center[1] + np.sin(angle) * constants.DOUBLE_RING_OUTER_RADIUS_PX)
+        end_x = int(constants.center[0] + np.cos(angle) * constants.OUTER_BULL_RADIUS_PX)
+        end_y = int(constants.center[1] + np.sin(angle) * constants.OUTER_BULL_RADIUS_PX)
         cv2.line(dartboard_image, (start_x, start_y), (end_x, end_y), (0, 0, 0), 1, lineType=cv2.LINE_AA)
 
-    text_radius_px = int((constants['TRIPLE_RING_OUTER_RADIUS_PX'] + constants['DOUBLE_RING_INNER_RADIUS_PX']) / 2)
+    text_radius_px = int((constants.TRIPLE_RING_OUTER_RADIUS_PX + constants.DOUBLE_RING_INNER_RADIUS_PX) / 2)
 
-    sector_scores = [10, 15, 2, 17, 3, 19, 7, 16, 8, 11, 14, 9, 12, 5, 20, 1, 18, 4, 13, 6]
-    for i, score in enumerate(sector_scores):
-        start_angle = (i * 360 / 20 - 0) * np.pi / 180
-        end_angle = ((i + 1) * 360 / 20 - 0) * np.pi / 180
-        draw_segment_text(dartboard_image, constants['center'], start_angle, end_angle, text_radius_px, str(score))
+    for i, score in enumerate(layout.sector_order):
+        start_angle = layout.sector_start_angle(i)
+        end_angle = layout.sector_start_angle(i + 1)
+        draw_segment_text(dartboard_image, constants.center, start_angle, end_angle, text_radius_px, str(score))
 
     sector_intersections = {
         '20_1': 0,
@@ -184,6 +276,6 @@ def draw_dartboard():
     }
 
     for angle in sector_intersections.values():
-        draw_point_at_angle(dartboard_image, constants['center'], angle, constants['DOUBLE_RING_OUTER_RADIUS_PX'], (255, 0, 0), 5)
+        draw_point_at_angle(dartboard_image, constants.center, angle, constants.DOUBLE_RING_OUTER_RADIUS_PX, (255, 0, 0), 5)
 
     return dartboard_image
@@ -0,0 +1,178 @@
+import os
+import sys
+import argparse
+import threading
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import cv2
+from flask import Flask, Response, abort, jsonify, render_template, request, send_file
+from flask_socketio import SocketIO, emit
+from analytics import Analytics, render_error_map, render_heatmap
+from board_layout import valid_segment
+from board_assets import SIZES, board_image_path, board_png
+from board_manager import BoardManager, load_boards_config, DEFAULT_BOARDS_PATH
+from cv_context import CVContext
+from preview import MJPEG_CONTENT_TYPE, STREAMS
+
+app = Flask(__name__)
+# the boards are stepped by real threads (opencv releases the GIL), so the server has to use threads too
+socketio = SocketIO(app, async_mode="threading", cors_allowed_origins="*")
+
+manager = None
+analytics = None
+ANALYTICS_KINDS = ('board', 'player')
+# (socket session id, stream) -> stop event of the task pushing that preview stream to the client
+preview_tasks = {}
+
+def board_namespace(name):
+    return f"/{name}"
+
+def send_board_event(name, event):
+    """Every board reports on its own namespace (ie: /board1)."""
+    socketio.emit(event.kind, event.to_app(), namespace=board_namespace(name))
+    if event.kind == 'dart_detected':
+        analytics.add_event(event)
+    elif event.kind == 'score_corrected':
+        analytics.correct_event(event)
+
+@app.route('/')
+def index():
+    return render_template('boards.html', boards=list(manager.boards))
+
+@app.route('/board/<name>/<size>.png')
+def board_image(name, size):
+    """The drawn board (cached asset, see board_assets.py) in the web or thumbnail size."""
+    if name not in manager.boards or size not in SIZES or size == 'display':
+        abort(404)
+    constants = manager.boards[name].db_cv.constants
+    path = board_image_path(constants, size)
+    if os.path.exists(path):
+        return send_file(path, mimetype="image/png")
+    # the assets could not be saved (read-only install), serve the image from memory
+    return Response(board_png(constants, size), mimetype="image/png")
+
+@app.route('/board/<name>/preview/<stream>.mjpg')
+def preview_stream(name, stream):
+    """Live camera feed (right/left/center) or its threshold mask (ie: center_mask) of a board."""
+    if name not in manager.previews or stream not in STREAMS:
+        abort(404)
+    return Response(manager.previews[name].mjpeg(stream), mimetype=MJPEG_CONTENT_TYPE)
+
+def preview_subscribe(name, data):
+    """Same feed over the socket: 'preview_frame' messages with the jpeg bytes, until preview_unsubscribe."""
+    stream = (data or {}).get('stream')
+    if name not in manager.previews or stream not in STREAMS:
+        return
+    key = (request.sid, stream)
+    if key in preview_tasks:
+        return
+    stop = preview_tasks[key] = threading.Event()
+    sid, namespace = request.sid, board_namespace(name)
+
+    def push():
+        for jpeg in manager.previews[name].frames(stream, stop=stop):
+            socketio.emit('preview_frame', {'stream': stream, 'image': jpeg}, to=sid, namespace=namespace)
+
+    socketio.start_background_task(push)
+
+def preview_unsubscribe(data=None):
+    streams = [(data or {}).get('stream')] if (data or {}).get('stream') else STREAMS
+    for stream in streams:
+        stop = preview_tasks.pop((request.sid, stream), None)
+        if stop is not None:
+            stop.set()
+
+@app.route('/analytics/<kind>/<name>')
+def analytics_summary(kind, name):
+    """Throws, points per dart, grouping, segment counts, rolling accuracy of a board or a player."""
+    summary = analytics.summary(kind, name) if kind in ANALYTICS_KINDS else None
+    if summary is None:
+        abort(404)
+    return jsonify(summary)
+
+@app.route('/analytics/<kind>/<name>/heatmap.png')
+def analytics_heatmap(kind, name):
+    """Where the darts of a board or a player landed, over the drawn board."""
+    heatmap = analytics.heatmap(kind, name) if kind in ANALYTICS_KINDS else None
+    if heatmap is None:
+        abort(404)
+    board = next(iter(manager.boards.values())).db_cv.dartboard_image
+    _, png = cv2.imencode(".png", render_heatmap(heatmap, board))
+    return Response(png.tobytes(), mimetype="image/png")
+
+@app.route('/analytics/<kind>/<name>/camera_errors')
+def analytics_camera_errors(kind, name):
+    """Where on the board each camera gets the score wrong: misscore rate per camera in every bin with throws."""
+    errors = analytics.camera_errors(kind, name) if kind in ANALYTICS_KINDS else None
+    if errors is None:
+        abort(404)
+    return jsonify(errors)
+
+@app.route('/analytics/<kind>/<name>/camera_errors/<int:camera>.png')
+def analytics_camera_error_map(kind, name, camera):
+    """The misscore rate of one camera (0 right, 1 left, 2 center) over the drawn board."""
+    error_maps = analytics.camera_error_maps(kind, name) if kind in ANALYTICS_KINDS else None
+    if error_maps is None or not 0 <= camera < len(error_maps):
+        abort(404)
+    board = next(iter(manager.boards.values())).db_cv.dartboard_image
+    _, png = cv2.imencode(".png", render_error_map(error_maps[camera], board))
+    return Response(png.tobytes(), mimetype="image/png")
+
+def correct_score(name, data):
+    """The right score of a throw: {throw_id, sector (25 bulls, 0 miss), ring}, answered with score_corrected."""
+    data = data or {}
+    throw_id, sector, ring = data.get('throw_id'), data.get('sector'), data.get('ring')
+    if not valid_segment(sector, ring):
+        emit('error', {'message': f'Invalid segment {sector} {ring}'})
+        return
+    if manager.boards[name].correct_score(throw_id, sector, ring) is None:
+        emit('error', {'message': f'Unknown throw {throw_id}'})
+
+def set_player(name, data):
+    """Who throws next on a board: {player} (empty/None when nobody), logged with the throws and in the analytics."""
+    player = (data or {}).get('player') or None
+    if player is not None and not isinstance(player, str):
+        emit('error', {'message': f'Invalid player {player!r}'})
+        return
+    manager.boards[name].player = player
+    socketio.emit('player', {'player': player}, namespace=board_namespace(name))
+
+@app.route('/stats')
+def stats():
+    """Per board step latency / lateness, to see how the boards do when they share the cpu."""
+    return jsonify(manager.stats_summary())
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Host several dartboards in one server")
+    parser.add_argument("--config", default=DEFAULT_BOARDS_PATH, help="boards config file")
+    parser.add_argument("--workers", type=int, default=None, help="worker threads (default: from the config)")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--no-preview", action="store_true", help="No camera preview streams")
+    args = parser.parse_args()
+
+    manager = BoardManager(load_boards_config(args.config), send_board_event, workers=args.workers,
+                           preview=not args.no_preview)
+    # the boards share the drawn board size (first board's constants)
+    boards_config = manager.boards_config['boards']
+    analytics = Analytics(CVContext(config_path=boards_config[0].get('config_path')).constants)
+    if manager.throw_log is not None:
+        # the history once (before the boards start), from then on the events keep the aggregates up to date
+        analytics.load(manager.throw_log)
+    if manager.start() == 0:
+        sys.exit("No board could be started")
+    for name in manager.boards:
+        socketio.on_event('connect', lambda: None, namespace=board_namespace(name))
+        socketio.on_event('preview_subscribe', lambda data, name=name: preview_subscribe(name, data),
+                          namespace=board_namespace(name))
+        socketio.on_event('preview_unsubscribe', preview_unsubscribe, namespace=board_namespace(name))
+        socketio.on_event('set_player', lambda data, name=name: set_player(name, data),
+                          namespace=board_namespace(name))
+        socketio.on_event('correct_score', lambda data, name=name: correct_score(name, data),
+                          namespace=board_namespace(name))
+        socketio.on_event('disconnect', lambda *reason: preview_unsubscribe(), namespace=board_namespace(name))
+
+    try:
+        socketio.run(app, host=args.host, port=args.port, debug=False, allow_unsafe_werkzeug=True)
+    finally:
+        manager.stop()
@@ -1,64 +1,119 @@
-from flask import Flask, render_template, url_for
-from flask_socketio import SocketIO, emit
-from src.calibrate import Calibration_App
-import cv2
-import numpy as np
-import yaml
 import os
+import sys
 import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from flask import Flask, Response, abort, render_template, request
+from flask_socketio import SocketIO, emit
+from calibrate import Calibration_App
+from capture_worker import CaptureWorkers
+import numpy as np
 
 app = Flask(__name__)
-socketio = SocketIO(app)
+# the cameras are read by worker threads (opencv releases the GIL), so the server uses threads too and a slow
+# camera or calibration only holds up the client that asked for it
+socketio = SocketIO(app, async_mode="threading")
 
 calibration = Calibration_App()
+# one capture worker per camera, shared by every client (see capture_worker.py)
+workers = CaptureWorkers()
+# per client (socket session id): the camera it selected
+sessions = {}
+
+STREAM_FPS = 10
 
 
-video_capture = None
-camera_index = None
+def camera_index_of(camera_id):
+    ''' position of the camera in CAMERA_ID, the index of its perspective matrix '''
+    return list(calibration.constants.CAMERA_ID).index(camera_id)
+
 
 @app.route('/')
 def index():
-    return render_template('index.html', camera_ids=calibration.constants['CAMERA_ID'])
-
-#selects camera + saves image for calibratoin in static folder
+    return render_template('index.html', camera_ids=calibration.constants.CAMERA_ID)
+
+#live view of a camera (multipart jpeg), while the page is open
+@app.route('/stream/<int:camera_id>.mjpg')
+def stream(camera_id):
+    if camera_id not in calibration.constants.CAMERA_ID:
+        abort(404)
+
+    def frames():
+        worker = workers.acquire(camera_id)
+        seq = 0
+        try:
+            while True:
+                started = time.monotonic()
+                seq, jpeg = worker.jpeg(seq)
+                if jpeg is None:
+                    break
+                yield b"--frame\r\nContent-Type: image/jpeg\r\n\r\n" + jpeg + b"\r\n"
+                time.sleep(max(0.0, 1 / STREAM_FPS - (time.monotonic() - started)))
+        finally:
+            workers.release(camera_id)
+
+    return Response(frames(), mimetype="multipart/x-mixed-replace; boundary=frame")
+
+@socketio.on('connect')
+def handle_connect():
+    sessions[request.sid] = {'camera_id': None, 'frame': None}
+
+@socketio.on('disconnect')
+def handle_disconnect():
+    session = sessions.pop(request.sid, None)
+    if session and session['camera_id'] is not None:
+        workers.release(session['camera_id'])
+
+#selects camera + sends the image for calibration
 @socketio.on('select_camera')
 def handle_select_camera(data):
-    global video_capture
-    global camera_index
-    camera_index = data.get('camera_index')
-    if camera_index is None:
+    session = sessions.setdefault(request.sid, {'camera_id': None, 'frame': None})
+    camera_id = data.get('camera_index')
+    if camera_id is None:
         emit('error', {'message': 'Camera index not provided'})
         return
+    if camera_id not in calibration.constants.CAMERA_ID:
+        emit('error', {'message': f'Unknown camera {camera_id}'})
+        return
 
-    print(f"Selecting camera: {camera_index}")
-
-    if video_capture:
-        video_capture.release()
-
-    video_capture = cv2.VideoCapture(camera_index)
-
-    if not video_capture.isOpened():
-        emit('error', {'message': f'Unable to access camera {camera_index}'})
-    else:
-        emit('success', {'message': f'Camera {camera_index} selected successfully'})
-        #check if frame read is sucessful
-        success, frame = video_capture.read()
-
-        if success:
-
-            image_path = os.path.join('static','snapshot.jpg')
-            saved = cv2.imwrite(image_path, frame)
-
-            if saved:
-                emit('image_captured', {'image_url': f'static/snapshot.jpg?{int(time.time())}'})
-            else:
-                emit('error', {'message': 'Failed to save calibration image'})
-        else:
-            emit('error', {'message': 'Failed to take calibration image'})
+    print(f"Selecting camera: {camera_id}")
+    if session['camera_id'] != camera_id:
+        # the worker of the previous camera stops if this client was its last user
+        if session['camera_id'] is not None:
+            workers.release(session['camera_id'])
+        workers.acquire(camera_id)
+        session['camera_id'] = camera_id
+    if send_snapshot(session):
+        emit('success', {'message': f'Camera {camera_id} selected successfully'})
+
+#a new image of the selected camera
+@socketio.on('snapshot')
+def handle_snapshot(data=None):
+    session = sessions.get(request.sid)
+    if not session or session['camera_id'] is None:
+        emit('error', {'message': 'Select a camera first'})
+        return
+    send_snapshot(session)
+
+def send_snapshot(session):
+    worker = workers.get(session['camera_id'])
+    _, frame, jpeg = worker.snapshot()
+    if jpeg is None:
+        emit('error', {'message': worker.error or 'Failed to take calibration image'})
+        return False
+    # the points are clicked on this frame, it is the one auto calibration uses as well
+    session['frame'] = frame
+    emit('image_captured', {'camera_id': session['camera_id'], 'image': jpeg,
+                            'stream_url': f'stream/{session["camera_id"]}.mjpg'})
+    return True
 
 #allows user to submit 4 points for calibartion
 @socketio.on('submit_points')
 def handle_submit_points(data):
+    session = sessions.get(request.sid)
+    if not session or session['camera_id'] is None:
+        emit('error', {'message': 'Select a camera first'})
+        return
 
     points = data.get('points')
     if not points or len(points) != 4:
@@ -69,10 +124,31 @@ def handle_submit_points(data):
     selected_points = np.float32([[p['x'], p['y']] for p in points])
     #print(f"Received points: {selected_points}")
 
-    calibration.save_perspective_matrix(camera_index,selected_points)
+    camera_index = camera_index_of(session['camera_id'])
+    calibration.save_perspective_matrix(camera_index, selected_points)
 
     emit('points_saved', {'message': f'Persective matrix is sucessfully generated for camera{camera_index}!'})
 
+#calibrates the selected camera from the board itself, no points needed
+@socketio.on('auto_calibrate')
+def handle_auto_calibrate(data):
+    session = sessions.get(request.sid)
+    if not session or session['frame'] is None:
+        emit('error', {'message': 'Select a camera first'})
+        return
+
+    camera_index = camera_index_of(session['camera_id'])
+    result, saved = calibration.auto_calibrate(camera_index, session['frame'])
+    if result is None:
+        emit('error', {'message': f'Board not found by camera {camera_index}, select the 4 points instead'})
+    elif not saved:
+        emit('error', {'message': f'Automatic calibration not accurate enough ({result.summary()}), select the 4 points instead'})
+    else:
+        emit('points_saved', {'message': f'Perspective matrix generated for camera{camera_index}: {result.summary()}'})
+
 
 if __name__ == '__main__':
-    socketio.run(app, host='192.168.40.187', port=5000, debug=False)
+    try:
+        socketio.run(app, host='192.168.40.187', port=5000, debug=False, allow_unsafe_werkzeug=True)
+    finally:
+        workers.stop()